@@ -0,0 +1,257 @@
+import os
+from typing import List, Dict
+
+import numpy as np
+import pandas as pd
+
+SEVERITY_LEVELS = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+INTERNATIONAL_LOCATIONS = ['International', 'Unknown']
+FEATURES = ('severity', 'log_count', 'log_example_mean', 'log_example_max', 'example_international',
+            'log_account_transactions', 'log_account_mean', 'log_account_std', 'account_international',
+            'match_share')
+
+
+# ============================================================================
+# CASE FEATURES
+# ============================================================================
+
+def account_summaries(transactions: pd.DataFrame) -> pd.DataFrame:
+    """Per-account totals used in case features, for all accounts in one groupby"""
+    amounts = transactions['amount'].astype(np.float64).round(2)
+    grouped = amounts.groupby(transactions['account_id'], observed=True)
+    international = transactions['location'].isin(INTERNATIONAL_LOCATIONS).groupby(
+        transactions['account_id'], observed=True).mean()
+    return pd.DataFrame({
+        'total_transactions': grouped.size(),
+        'average_amount': grouped.mean(),
+        'std_deviation': grouped.std().fillna(0.0),
+        'international_share': international,
+    })
+
+
+def summary_from_stats(stats: Dict) -> Dict:
+    """The same account totals taken from a report's statistical_analysis output"""
+    total = max(stats['total_transactions'], 1)
+    std = stats['std_deviation']
+    return {
+        'total_transactions': stats['total_transactions'],
+        'average_amount': stats['average_amount'],
+        'std_deviation': 0.0 if np.isnan(std) else std,
+        'international_share': stats['geographic_analysis']['international_transactions'] / total,
+    }
+
+
+def case_features(detection: Dict, summary: Dict) -> np.ndarray:
+    """Compact numeric description of one detection in its account's context (see FEATURES)"""
+    examples = detection.get('transactions', [])
+    amounts = np.array([float(t.get('amount', 0.0)) for t in examples]) if examples else np.zeros(1)
+    international = np.mean([t.get('location') in INTERNATIONAL_LOCATIONS for t in examples]) if examples else 0.0
+    severity = detection.get('severity', 'MEDIUM')
+    return np.array([
+        SEVERITY_LEVELS.index(severity) / 3 if severity in SEVERITY_LEVELS else 0.5,
+        np.log1p(detection.get('count', 0)),
+        np.log1p(np.abs(amounts).mean()),
+        np.log1p(np.abs(amounts).max()),
+        international,
+        np.log1p(summary['total_transactions']),
+        np.log1p(abs(summary['average_amount'])),
+        np.log1p(summary['std_deviation']),
+        summary['international_share'],
+        detection.get('count', 0) / max(summary['total_transactions'], 1),
+    ], dtype=np.float32)
+
+
+def case_resolution(detection: Dict) -> str:
+    """Outcome of a historical case from the labels of its transactions"""
+    labels = [t.get('fraud_indicator', 'normal') for t in detection.get('transactions', [])]
+    return 'confirmed_fraud' if any(label != 'normal' for label in labels) else 'false_positive'
+
+
+def summarize_cases(cases: List[Dict]) -> str:
+    """One-line summary of similar past cases for LLM prompts"""
+    if not cases:
+        return "no similar past cases"
+    confirmed = sum(case['resolution'] == 'confirmed_fraud' for case in cases)
+    return f"{len(cases)} similar past cases: {confirmed} confirmed fraud, {len(cases) - confirmed} false positive"
+
+
+# ============================================================================
+# CASE STORE
+# ============================================================================
+
+class CaseStore:
+    """Historical flagged cases as unit feature vectors with exact top-k lookup
+
+    Features are standardized with the mean/std of the first batch loaded and
+    normalized to unit length, so similarity is a dot product. Cases are
+    searched only among cases of the same pattern; each pattern's vectors are
+    gathered into one contiguous block on first use, so a batch of queries is a
+    single matrix product per pattern. Everything is plain NumPy arrays saved
+    to one .npz file.
+    """
+
+    ARRAYS = ('case_ids', 'patterns', 'accounts', 'resolutions', 'created', 'vectors', 'mean', 'std')
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self._reset()
+
+    @classmethod
+    def empty(cls) -> 'CaseStore':
+        return cls(case_ids=np.array([], dtype=str), patterns=np.array([], dtype=str),
+                   accounts=np.array([], dtype=str), resolutions=np.array([], dtype=str),
+                   created=np.array([], dtype='datetime64[s]'),
+                   vectors=np.zeros((0, len(FEATURES)), dtype=np.float32),
+                   mean=np.zeros(0, dtype=np.float32), std=np.zeros(0, dtype=np.float32))
+
+    def _reset(self):
+        self._order = np.argsort(self.case_ids, kind='stable')
+        self._partitions = {}
+
+    def __len__(self):
+        return len(self.case_ids)
+
+    def _normalize(self, raw: np.ndarray) -> np.ndarray:
+        vectors = (np.asarray(raw, dtype=np.float32) - self.mean) / self.std
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def upsert(self, case_ids, patterns, accounts, resolutions, created, raw_features: np.ndarray):
+        """Insert or replace a batch of cases by case id (later duplicates in the batch win)"""
+        case_ids = np.asarray(case_ids, dtype=str)
+        keep = ~pd.Series(case_ids).duplicated(keep='last').to_numpy()
+        raw_features = np.asarray(raw_features, dtype=np.float32)[keep]
+        columns = {
+            'case_ids': case_ids[keep],
+            'patterns': np.asarray(patterns, dtype=str)[keep],
+            'accounts': np.asarray(accounts, dtype=str)[keep],
+            'resolutions': np.asarray(resolutions, dtype=str)[keep],
+            'created': np.asarray(created, dtype='datetime64[s]')[keep],
+        }
+        if len(self.mean) == 0:
+            self.mean = raw_features.mean(axis=0)
+            std = raw_features.std(axis=0)
+            self.std = np.where(std > 0, std, 1).astype(np.float32)
+        columns['vectors'] = self._normalize(raw_features)
+
+        # Existing ids are replaced in place, new ids appended
+        existing = np.full(len(columns['case_ids']), -1)
+        if len(self.case_ids):
+            pos = np.minimum(np.searchsorted(self.case_ids, columns['case_ids'], sorter=self._order),
+                             len(self.case_ids) - 1)
+            rows = self._order[pos]
+            existing = np.where(self.case_ids[rows] == columns['case_ids'], rows, -1)
+        replaced, added = existing >= 0, existing < 0
+        for name, values in columns.items():
+            current = getattr(self, name)
+            if replaced.any():
+                # Copy, widened if needed to hold longer replacement strings
+                current = current.astype(np.result_type(current, values))
+                current[existing[replaced]] = values[replaced]
+            setattr(self, name, np.concatenate([current, values[added]]))
+        self._reset()
+        return int(replaced.sum()), int(added.sum())
+
+    def _partition(self, pattern: str):
+        """Rows, contiguous vectors and account codes of one pattern's cases (cached)"""
+        if pattern not in self._partitions:
+            rows = np.flatnonzero(self.patterns == pattern)
+            account_codes, accounts = pd.factorize(self.accounts[rows])
+            self._partitions[pattern] = (rows, np.ascontiguousarray(self.vectors[rows]), account_codes,
+                                         {account: code for code, account in enumerate(accounts)})
+        return self._partitions[pattern]
+
+    def similar(self, patterns: List[str], raw_features: np.ndarray, k: int = 3,
+                exclude_accounts: List[str] = None) -> List[List[Dict]]:
+        """Top-k most similar past cases of the same pattern for each query
+
+        Cases of `exclude_accounts[i]` are left out for query i (an account's own
+        history says nothing about how comparable cases were resolved).
+        """
+        results = [[] for _ in patterns]
+        if len(self) == 0:
+            return results
+        queries = self._normalize(np.atleast_2d(raw_features))
+        for pattern in set(patterns):
+            group = [i for i, p in enumerate(patterns) if p == pattern]
+            rows, vectors, account_codes, account_lookup = self._partition(pattern)
+            if len(rows) == 0:
+                continue
+            scores = queries[group] @ vectors.T
+            for row, i in enumerate(group):
+                if exclude_accounts is not None:
+                    scores[row, account_codes == account_lookup.get(str(exclude_accounts[i]), -1)] = -np.inf
+                top = np.argpartition(-scores[row], min(k, len(rows)) - 1)[:k]
+                top = top[np.argsort(-scores[row, top], kind='stable')]
+                results[i] = [{
+                    'case_id': str(self.case_ids[rows[j]]),
+                    'account_id': str(self.accounts[rows[j]]),
+                    'resolution': str(self.resolutions[rows[j]]),
+                    'created': str(self.created[rows[j]]),
+                    'similarity': round(float(scores[row, j]), 4),
+                } for j in top if np.isfinite(scores[row, j])]
+        return results
+
+    def save(self, path: str):
+        """Write all arrays to a single uncompressed .npz file"""
+        np.savez(path, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> 'CaseStore':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
+
+
+# ============================================================================
+# OFFLINE BUILD
+# ============================================================================
+
+def build_cases(transactions: pd.DataFrame, detections_by_account: Dict[str, List[Dict]],
+                store: CaseStore = None, batch_size: int = 100_000) -> CaseStore:
+    """Add every detection as a case, upserting in batches"""
+    store = store or CaseStore.empty()
+    summaries = account_summaries(transactions)
+    batch = []
+
+    def flush():
+        store.upsert(*zip(*[case[:5] for case in batch]), np.array([case[5] for case in batch]))
+        batch.clear()
+
+    for account_id, detections in detections_by_account.items():
+        summary = summaries.loc[account_id].to_dict()
+        for detection in detections:
+            times = [str(t.get('timestamp') or t.get('date')) for t in detection.get('transactions', [])]
+            created = pd.Timestamp(max(times)) if times else pd.Timestamp.now()
+            batch.append((f"{account_id}:{detection['pattern']}:{created.date()}", detection['pattern'],
+                          account_id, case_resolution(detection), np.datetime64(created, 's'),
+                          case_features(detection, summary)))
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+    return store
+
+
+if __name__ == "__main__":
+    from fraud_detectors import run_detectors
+    from transaction_graph import detect_layering
+    from transaction_schema import load_transactions
+
+    data_path = "sample_data/transactions.csv"
+    cases_path = "sample_data/cases.npz"
+    if not os.path.exists(data_path):
+        print(f"Error: Sample data not found at {data_path}")
+        exit()
+
+    df = load_transactions(data_path)
+    detections = run_detectors(df)
+    for account_id, layering in detect_layering(df).items():
+        detections.setdefault(account_id, []).extend(layering)
+
+    store = CaseStore.load(cases_path) if os.path.exists(cases_path) else None
+    store = build_cases(df, detections, store)
+    store.save(cases_path)
+    resolutions, counts = np.unique(store.resolutions, return_counts=True)
+    print(f"✓ Case store holds {len(store)} cases "
+          f"({', '.join(f'{n} {resolution}' for resolution, n in zip(resolutions, counts))})")
+    print(f"✓ Saved cases to {cases_path} ({os.path.getsize(cases_path) / 1024:.1f} KiB)")
@@ -1,91 +1,232 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-from openai import OpenAI
-import requests
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from embedding_service import LazyEmbeddingService
+from llm_router import get_llm_router, LLMUnavailableError
+from vector_quantization import CompactVectorIndex
+from lexical_index import BM25Index, HybridRetriever
+from engine_snapshot import load_snapshot
+from prompt_templates import PromptTemplate, warm_up
 
 # --- 1. Konfiguracja ---
-# Sprawdź, który serwer jest aktywny i ustaw odpowiedni URL
-OLLAMA_URL = "http://localhost:11434"
-LM_STUDIO_URL = "http://localhost:1234"
-
-api_url = ""
-api_key = "ollama"  # Dla Ollama klucz jest dowolny, dla LM Studio też
-# model_name = "qwen/qwen3-4b-thinking-2507"
-model_name = "gemma3:1b"
-
-try:
-    requests.get(OLLAMA_URL)
-    api_url = f"{OLLAMA_URL}/v1"
-    print("✓ Wykryto serwer Ollama.")
-except requests.exceptions.ConnectionError:
-    try:
-        requests.get(LM_STUDIO_URL)
-        api_url = f"{LM_STUDIO_URL}/v1"
-        print("✓ Wykryto serwer LM Studio.")
-    except requests.exceptions.ConnectionError:
-        print("❌ Nie wykryto aktywnego serwera Ollama ani LM Studio.")
-        print("Uruchom jeden z nich i spróbuj ponownie.")
-        exit()
-
-# Inicjalizacja klienta OpenAI, który będzie komunikował się z lokalnym serwerem
-client = OpenAI(base_url=api_url, api_key=api_key)
+# Pula serwerów zgodnych z API OpenAI (Ollama, LM Studio lub lista z LLM_BACKENDS),
+# z kontrolą dostępności, limitem czasu, ponawianiem i opcjonalnym "hedgingiem" (patrz llm_router.py)
+model_name = None  # None = model skonfigurowany dla danego serwera (domyślnie gemma3:1b)
+llm = get_llm_router()
 
 # Inicjalizacja bazy wektorowej i modelu do tworzenia wektorów
-chroma_client = chromadb.PersistentClient(path='chroma_db')
-embedding_model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-collection = chroma_client.get_collection("regulaminy_firmy")
+# Wspólny model wektorów dla wszystkich modułów (patrz embedding_service.py), ładowany dopiero przy pierwszym
+# pytaniu, które potrzebuje wektorów - start z migawki i pytania obsłużone przez BM25 nie ładują modelu
+embedding_model = LazyEmbeddingService()
+if os.environ.get("CHATBOT_SNAPSHOT"):
+    # Szybki start z migawki (python engine_snapshot.py --collection regulaminy_firmy --output ...),
+    # mapowanej tylko do odczytu i współdzielonej między procesami - bez uruchamiania ChromaDB
+    collection = load_snapshot(os.environ["CHATBOT_SNAPSHOT"])["collections"]["regulaminy_firmy"]
+else:
+    import chromadb
+    chroma_client = chromadb.PersistentClient(path='chroma_db')
+    collection = chroma_client.get_collection("regulaminy_firmy")
+
+# Opcjonalny kompaktowy indeks w pamięci: COMPACT_INDEX=float16, int8 lub int8:128 (z PCA do 128 wymiarów).
+# Wyniki są ponownie oceniane na pełnych wektorach float32 (patrz vector_quantization.py), mapowanych z pliku.
+# Indeks jest zapisywany w COMPACT_INDEX_PATH i wczytywany przy starcie; budujemy go z kolekcji tylko, gdy
+# pliku brak, ma inną konfigurację albo liczba wektorów nie zgadza się z kolekcją (indeksowanie.py go usuwa).
+retriever = collection
+if os.environ.get("COMPACT_INDEX"):
+    mode, _, pca_dim = os.environ["COMPACT_INDEX"].partition(":")
+    pca_dim = int(pca_dim) if pca_dim else None
+    compact_path = os.environ.get("COMPACT_INDEX_PATH", os.path.join("chroma_db", "regulaminy_firmy.compact"))
+    retriever = None
+    if os.path.exists(os.path.join(compact_path, "index.json")):
+        retriever = CompactVectorIndex.load(compact_path)
+    if retriever is None or (retriever.mode, retriever.pca_dim, len(retriever)) != (mode, pca_dim, collection.count()):
+        os.makedirs(compact_path, exist_ok=True)
+        retriever = CompactVectorIndex.from_collection(collection, mode=mode, pca_dim=pca_dim,
+                                                       full_precision_path=os.path.join(compact_path, "full.npy"))
+        retriever.save(compact_path)
+    print(f"✓ Kompaktowy indeks {mode}: {len(retriever)} wektorów, "
+          f"{retriever.compact_bytes() / 2**20:.1f} MB zamiast {retriever.full_bytes() / 2**20:.1f} MB")
+
+# Indeks leksykalny BM25 (patrz lexical_index.py), zapisywany przez indeksowanie.py razem z bazą wektorową.
+# RETRIEVAL=hybrid (domyślnie): pytania "hasłowe" (np. "Multisport") obsługuje sam BM25 bez wektoryzacji,
+# pozostałe łączą ranking BM25 i wektorowy; RETRIEVAL=lexical lub vector używa tylko jednej metody.
+lexical_path = os.environ.get("LEXICAL_INDEX", os.path.join("chroma_db", "regulaminy_firmy.bm25.json"))
+lexical_index = BM25Index.load(lexical_path) if os.path.exists(lexical_path) else None
+if lexical_index is None or len(lexical_index) != collection.count():
+    # Brak pliku lub plik nieaktualny - budujemy indeks z dokumentów kolekcji
+    lexical_index = BM25Index.from_collection(collection)
+search = HybridRetriever(lexical_index, retriever, embedding_model, mode=os.environ.get("RETRIEVAL", "hybrid"))
 
 
 # --- 2. Funkcja RAG ---
-def run_rag(query):
-    print(f"\nZapytanie: {query}")
-
-    # Krok 1: Wyszukiwanie w bazie wektorowej (Retrieval)
-    print("\n1. Wyszukiwanie relevantnych informacji...")
-    query_embedding = embedding_model.encode([query]).tolist()
-    results = collection.query(
-        query_embeddings=query_embedding,
-        n_results=2
-    )
-
-    retrieved_context = "\n\n---\n\n".join(results["documents"][0])
-    print("   Znaleziony kontekst:")
-    print("   " + retrieved_context.replace("\n", "\n   "))
-
-    # Krok 2: Budowanie promptu z kontekstem (Augmentation)
-    system_prompt = """
+# Szablon ze stałym prefiksem (patrz prompt_templates.py): instrukcje są identyczne w każdym zapytaniu,
+# więc serwer LLM liczy je tylko raz, a kontekst i pytanie (zmienne) trafiają na koniec promptu
+RAG_PROMPT = PromptTemplate("regulaminy_rag", """
     Jesteś pomocnym asystentem AI o nazwie "Firmowy Bot". Twoim zadaniem jest odpowiadanie na pytania pracowników na podstawie dostarczonych fragmentów regulaminu.
     Odpowiadaj tylko i wyłącznie na podstawie dostarczonego kontekstu. 
     Jeśli w kontekście nie ma odpowiedzi na pytanie, odpowiedz: 
     "Przepraszam, ale nie znalazłem odpowiedzi na to pytanie w dostarczonych dokumentach."
     Bądź precyzyjny i trzymaj się faktów.
-    """
-
-    user_prompt = f"""
+    Każde zapytanie zawiera najpierw kontekst (fragmenty regulaminu), a na końcu pytanie.
+    """, """
     Kontekst:
     ---
-    {retrieved_context}
+    {context}
     ---
 
     Pytanie: {query}
-    """
+    """)
 
-    # Krok 3: Generowanie odpowiedzi przez LLM (Generation)
-    print("\n2. Generowanie odpowiedzi przez LLM...")
-    response = client.chat.completions.create(
+
+def format_context(ids, documents):
+    """Fragmenty w stałej kolejności (wg id), żeby pytania o ten sam fragment miały wspólny prefiks promptu"""
+    return "\n\n---\n\n".join(document for _, document in sorted(zip(ids, documents)))
+
+
+def build_messages(query, retrieved_context):
+    return RAG_PROMPT.messages(context=retrieved_context, query=query)
+
+
+def generate(messages):
+    return llm.chat(
+        messages,
         model=model_name,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
         temperature=0.1,  # Niska temperatura dla bardziej precyzyjnych odpowiedzi
     )
 
-    return response.choices[0].message.content
 
+def run_rag(query):
+    print(f"\nZapytanie: {query}")
+
+    # Krok 1: Wyszukiwanie (Retrieval) - BM25, a wektory tylko gdy trafienie leksykalne nie jest pewne
+    print("\n1. Wyszukiwanie relevantnych informacji...")
+    results = search.query_texts([query], n_results=2)
+
+    retrieved_context = format_context(results["ids"][0], results["documents"][0])
+    print(f"   Znaleziony kontekst (wyszukiwanie: {results['retrieval'][0]}):")
+    print("   " + retrieved_context.replace("\n", "\n   "))
 
-# --- 3. Uruchomienie ---
+    # Krok 2: Budowanie promptu z kontekstem (Augmentation)
+    messages = build_messages(query, retrieved_context)
+
+    # Krok 3: Generowanie odpowiedzi przez LLM (Generation)
+    print("\n2. Generowanie odpowiedzi przez LLM...")
+    return generate(messages)
+
+
+# --- 3. Tryb wsadowy (plik pytań -> JSONL) ---
+def read_questions(path):
+    """Pytania z pliku .jsonl (pole "question", opcjonalnie "id") lub z pliku tekstowego (jedno na linię)"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                questions.append({"id": item.get("id", len(questions)), "question": item["question"]})
+            else:
+                questions.append({"id": len(questions), "question": line})
+    return questions
+
+
+def run_batch(input_path, output_path, concurrency=4, n_results=2):
+    """Odpowiada na wszystkie pytania z pliku i zapisuje wyniki do JSONL
+
+    Pytania, na które pewnie odpowiada indeks BM25, nie są wektoryzowane; pozostałe
+    są wektoryzowane jednym wywołaniem encode i wyszukiwane jednym zapytaniem do
+    bazy; generowanie odpowiedzi działa równolegle w maksymalnie
+    `concurrency` wątkach, więc przepustowość ogranicza serwer LLM, a nie Python.
+    """
+    questions = read_questions(input_path)
+    if not questions:
+        return {"questions": 0}
+    texts = [q["question"] for q in questions]
+
+    # Krok 1-2: wyszukiwanie dla wszystkich pytań (BM25, a dla niepewnych jedno wsadowe
+    # wektoryzowanie i jedno zapytanie do bazy)
+    start = time.perf_counter()
+    results = search.query_texts(texts, n_results=n_results)
+    embed_seconds = results["encode_seconds"]
+    retrieval_seconds = time.perf_counter() - start - embed_seconds
+
+    # Krok 3: równoległe generowanie z ograniczoną liczbą jednoczesnych zapytań
+    def answer(i):
+        messages = build_messages(texts[i], format_context(results["ids"][i], results["documents"][i]))
+        record = {
+            **questions[i],
+            "chunk_ids": results["ids"][i],
+            "distances": results["distances"][i],
+            "scores": results["scores"][i],
+            "retrieval": results["retrieval"][i],
+            "timings": {
+                # Czas wsadowych etapów rozłożony równo na pytania
+                "embed_seconds": embed_seconds / len(texts),
+                "retrieval_seconds": retrieval_seconds / len(texts),
+            }
+        }
+        start = time.perf_counter()
+        try:
+            record["answer"] = generate(messages)
+        except LLMUnavailableError as e:
+            record["answer"], record["error"] = None, str(e)
+        record["timings"]["generation_seconds"] = time.perf_counter() - start
+        return record
+
+    start = time.perf_counter()
+    failed = 0
+    with open(output_path, "w", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Wyniki zapisywane w kolejności ukończenia, żeby plik rósł na bieżąco
+        # Pytania z tym samym kontekstem wysyłane po kolei - serwer ponownie używa przeliczonego prefiksu
+        order = sorted(range(len(texts)), key=lambda i: sorted(results["ids"][i]))
+        for record in (future.result() for future in as_completed([pool.submit(answer, i) for i in order])):
+            failed += "error" in record
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+    generation_seconds = time.perf_counter() - start
+
+    return {
+        "questions": len(texts),
+        "failed": failed,
+        "lexical_only": results["retrieval"].count("lexical"),
+        "embed_seconds": embed_seconds,
+        "retrieval_seconds": retrieval_seconds,
+        "generation_seconds": generation_seconds,
+        "questions_per_second": len(texts) / max(embed_seconds + retrieval_seconds + generation_seconds, 1e-9),
+    }
+
+
+# --- 4. Uruchomienie ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Firmowy Bot - pytania o regulamin (RAG)")
+    parser.add_argument("--batch", metavar="PLIK", help="Plik z pytaniami (.jsonl z polem question lub .txt)")
+    parser.add_argument("--output", default="odpowiedzi.jsonl", help="Plik wynikowy JSONL dla trybu wsadowego")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maksymalna liczba równoległych zapytań do LLM")
+    args = parser.parse_args()
+
+    # Sprawdź, które serwery są aktywne
+    active = llm.check_health()
+    if not active:
+        print("❌ Nie wykryto aktywnego serwera Ollama ani LM Studio.")
+        print("Uruchom jeden z nich i spróbuj ponownie.")
+        exit()
+    print(f"✓ Aktywne serwery LLM: {', '.join(backend.name for backend in active)}")
+    # Załadowanie modelu i przeliczenie stałego prefiksu promptu przed pierwszym pytaniem
+    warm_up(llm, [RAG_PROMPT])
+
+    if args.batch:
+        summary = run_batch(args.batch, args.output, args.concurrency)
+        print(f"✓ Odpowiedzi na {summary['questions']} pytań zapisano do {args.output}")
+        if summary["questions"]:
+            print(f"  Błędy: {summary['failed']}, tylko BM25 (bez wektoryzacji): {summary['lexical_only']}")
+            print(f"  Wektoryzacja: {summary['embed_seconds']:.2f}s, wyszukiwanie: {summary['retrieval_seconds']:.2f}s, "
+                  f"generowanie: {summary['generation_seconds']:.2f}s ({summary['questions_per_second']:.2f} pytań/s)")
+        exit()
+
     # Przykład 1: Pytanie, na które jest odpowiedź w danych
     answer1 = run_rag("Ile dni urlopu mi przysługuje, jeśli pracuję w firmie 5 lat?")
     print(f"\nOdpowiedź Bota:\n{answer1}")
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import argparse
+from collections import OrderedDict
+from typing import List, Dict
+
+import numpy as np
+
+# One embedding model for every collection (regulations, fraud patterns, compliance docs)
+EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+ONNX_FILE = "model_int8.onnx"
+ONNX_CONFIG_FILE = "embedding_config.json"
+
+
+# ============================================================================
+# EMBEDDING SERVICE
+# ============================================================================
+
+class EmbeddingService:
+    """Shared sentence embedding engine for all modules
+
+    backend="torch" runs the fp32 SentenceTransformer model; backend="onnx" runs
+    an int8-quantized export of the same model with ONNX Runtime on CPU (see
+    export_quantized_onnx). Both return float32 arrays of shape (n, dim).
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, backend: str = "torch",
+                 onnx_path: str = None, batch_size: int = 32, max_batch_tokens: int = 8192,
+                 max_batch_texts: int = 256, num_threads: int = None, cache_size: int = 4096):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_texts = max_batch_texts
+        self.num_threads = num_threads
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+        if backend == "torch":
+            import torch
+            from sentence_transformers import SentenceTransformer
+            if num_threads:
+                torch.set_num_threads(num_threads)
+            self.model = SentenceTransformer(model_name, device="cpu")
+        elif backend == "onnx":
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+            if onnx_path is None or not os.path.exists(os.path.join(onnx_path, ONNX_FILE)):
+                raise FileNotFoundError(f"No quantized ONNX model in {onnx_path} - run "
+                                        f"'python embedding_service.py --export {onnx_path}' first")
+            with open(os.path.join(onnx_path, ONNX_CONFIG_FILE), "r", encoding="utf-8") as f:
+                self.onnx_config = json.load(f)
+            options = ort.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+                options.inter_op_num_threads = 1
+            self.session = ort.InferenceSession(os.path.join(onnx_path, ONNX_FILE), options,
+                                                providers=["CPUExecutionProvider"])
+            self.session_inputs = {i.name for i in self.session.get_inputs()}
+            self.tokenizer = AutoTokenizer.from_pretrained(onnx_path)
+        else:
+            raise ValueError(f"Unknown embedding backend '{backend}' (expected 'torch' or 'onnx')")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed a list of texts; returns a float32 array of shape (len(texts), dim)"""
+        texts = list(texts)
+        if self.backend == "torch":
+            return np.asarray(self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True),
+                              dtype=np.float32)
+        return self._encode_onnx(texts)
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed short query strings through a bounded LRU cache (repeated pattern names, questions)"""
+        found = {}
+        for query in dict.fromkeys(queries):
+            if query in self._cache:
+                self._cache.move_to_end(query)
+                found[query] = self._cache[query]
+        missing = [query for query in dict.fromkeys(queries) if query not in found]
+        if missing:
+            for query, vector in zip(missing, self.encode(missing)):
+                found[query] = self._cache[query] = vector
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return np.stack([found[query] for query in queries])
+
+    def _encode_onnx(self, texts: List[str]) -> np.ndarray:
+        """Length-bucketed dynamic batching: similar-length texts share a batch up to a token budget"""
+        max_length = self.onnx_config["max_seq_length"]
+        lengths = [min(len(ids), max_length) for ids in self.tokenizer(texts, truncation=True,
+                                                                         max_length=max_length)["input_ids"]]
+        order = np.argsort(lengths, kind="stable")
+        output = np.zeros((len(texts), self.onnx_config["dimension"]), dtype=np.float32)
+
+        start = 0
+        while start < len(order):
+            end = start + 1
+            # Texts are sorted by length, so the last one in the batch sets the padded size
+            while (end < len(order) and end - start < self.max_batch_texts
+                   and (end - start + 1) * lengths[order[end]] <= self.max_batch_tokens):
+                end += 1
+            batch = order[start:end]
+            encoded = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                     max_length=max_length, return_tensors="np")
+            feeds = {name: encoded[name].astype(np.int64) for name in self.session_inputs if name in encoded}
+            hidden = self.session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            output[batch] = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            start = end
+        return output
+
+
+_shared_service = None
+
+
+def get_embedding_service(**kwargs) -> EmbeddingService:
+    """Process-wide embedding service, created on first use
+
+    Defaults come from the environment: EMBEDDING_BACKEND (torch/onnx),
+    EMBEDDING_ONNX_PATH, EMBEDDING_THREADS and EMBEDDING_BATCH_SIZE.
+    """
+    global _shared_service
+    if _shared_service is None:
+        settings = {
+            "backend": os.environ.get("EMBEDDING_BACKEND", "torch"),
+            "onnx_path": os.environ.get("EMBEDDING_ONNX_PATH"),
+            "num_threads": int(os.environ["EMBEDDING_THREADS"]) if os.environ.get("EMBEDDING_THREADS") else None,
+            "batch_size": int(os.environ.get("EMBEDDING_BATCH_SIZE", 32)),
+        }
+        settings.update(kwargs)
+        _shared_service = EmbeddingService(**settings)
+    return _shared_service
+
+
+class LazyEmbeddingService:
+    """Stands in for get_embedding_service(); the model is loaded on the first encode, not at startup"""
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return get_embedding_service().encode(texts)
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        return get_embedding_service().encode_queries(queries)
+
+
+# ============================================================================
+# ONNX EXPORT AND INT8 QUANTIZATION
+# ============================================================================
+
+def export_quantized_onnx(output_dir: str, model_name: str = EMBEDDING_MODEL):
+    """Export the locally available SentenceTransformer model to ONNX and quantize weights to int8"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    sample = tokenizer(["Przykładowe zdanie", "Sample sentence"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    fp32_path = os.path.join(output_dir, "model_fp32.onnx")
+    torch.onnx.export(
+        transformer,
+        tuple(sample[name] for name in input_names),
+        fp32_path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+        opset_version=17,
+        dynamo=False
+    )
+    quantize_dynamic(fp32_path, os.path.join(output_dir, ONNX_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_seq_length": model.max_seq_length,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "pooling": "mean"
+        }, f, indent=2)
+
+
+def benchmark(texts: List[str], services: Dict[str, EmbeddingService], repeats: int = 3) -> Dict[str, Dict]:
+    """Encode throughput of each service and cosine agreement with the first one"""
+    results = {}
+    reference = None
+    for name, service in services.items():
+        service.encode(texts[:8])  # warm-up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            vectors = service.encode(texts)
+            timings.append(time.perf_counter() - start)
+        normalized = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if reference is None:
+            reference = normalized
+        results[name] = {
+            "texts_per_second": len(texts) / min(timings),
+            "mean_cosine_to_reference": float((normalized * reference).sum(axis=1).mean())
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared embedding service: export and benchmark")
+    parser.add_argument("--export", metavar="DIR", help="Export an int8 ONNX model of the embedding model to DIR")
+    parser.add_argument("--onnx-path", help="Quantized ONNX model directory to benchmark against fp32")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads for inference")
+    parser.add_argument("--data", default="dane.txt", help="Text file whose paragraphs are used as benchmark input")
+    args = parser.parse_args()
+
+    if args.export:
+        export_quantized_onnx(args.export)
+        print(f"✓ Exported int8 ONNX model to {args.export}")
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        chunks = [chunk for chunk in f.read().split("\n\n") if chunk.strip()]
+    texts = (chunks * (512 // max(len(chunks), 1) + 1))[:512]
+
+    services = {"torch-fp32": EmbeddingService(backend="torch", num_threads=args.threads)}
+    onnx_path = args.onnx_path or args.export
+    if onnx_path:
+        services["onnx-int8"] = EmbeddingService(backend="onnx", onnx_path=onnx_path, num_threads=args.threads)
+
+    print(f"\nEncoding {len(texts)} texts (threads: {args.threads or 'default'})")
+    for name, result in benchmark(texts, services).items():
+        print(f"  {name:12s} {result['texts_per_second']:8.1f} texts/s   "
+              f"cosine vs fp32: {result['mean_cosine_to_reference']:.4f}")
@@ -0,0 +1,225 @@
+import os
+import json
+import struct
+import argparse
+from typing import List, Dict
+
+import numpy as np
+
+from embedding_service import get_embedding_service
+
+MAGIC = b"FRDSNAP1"
+ALIGNMENT = 64
+
+
+# ============================================================================
+# SNAPSHOT FILE FORMAT
+# ============================================================================
+#
+#   MAGIC | uint64 header length | JSON header | padding | array data
+#
+# The header holds small metadata (ids, documents, query strings) and the dtype,
+# shape and offset of every array. Arrays start on 64-byte boundaries, so a
+# reader maps the file once and views each array in place: nothing is copied,
+# and processes loading the same snapshot share its pages read-only.
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(path: str, arrays: Dict[str, np.ndarray], meta: Dict):
+    """Write arrays and JSON metadata to a single memory-mappable file (atomically)"""
+    arrays = {name: np.asarray(array) for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header = json.dumps({"meta": meta, "arrays": layout}, ensure_ascii=False).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes(order="C"))
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str):
+    """Map a snapshot read-only; returns (arrays as zero-copy views, metadata)"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an engine snapshot")
+        header_length = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_length).decode("utf-8"))
+
+    data_start = _align(len(MAGIC) + 8 + header_length)
+    buffer = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) > data_start else None
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        size = int(np.prod(spec["shape"], dtype=np.int64)) * dtype.itemsize
+        start = data_start + spec["offset"]
+        if size == 0:
+            arrays[name] = np.empty(tuple(spec["shape"]), dtype=dtype)
+        else:
+            arrays[name] = buffer[start:start + size].view(dtype).reshape(tuple(spec["shape"]))
+    return arrays, header["meta"]
+
+
+# ============================================================================
+# SNAPSHOT-BACKED RETRIEVAL AND EMBEDDINGS
+# ============================================================================
+
+class SnapshotCollection:
+    """Read-only, Chroma-compatible view of a collection stored in a snapshot
+
+    Queries run as exact search over the mapped embeddings using the
+    collection's distance space (Chroma's default is squared L2), so results
+    match the live collection.
+    """
+
+    def __init__(self, name: str, ids: List[str], documents: List[str], metadatas: List[Dict],
+                 embeddings: np.ndarray, space: str = "l2"):
+        self.name = name
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.embeddings = embeddings
+        self.space = space
+        self.metadata = {"hnsw:space": space}
+        self._norms = (np.asarray(embeddings, dtype=np.float32) ** 2).sum(axis=1)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids: List[str] = None, include=("documents", "metadatas"), limit: int = None,
+            offset: int = 0, **kwargs) -> Dict:
+        if ids is not None:
+            positions = {entry_id: i for i, entry_id in enumerate(self.ids)}
+            rows = [positions[entry_id] for entry_id in ids if entry_id in positions]
+        else:
+            rows = list(range(offset, len(self.ids) if limit is None else min(offset + limit, len(self.ids))))
+        result = {"ids": [self.ids[i] for i in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[i] for i in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[i] for i in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.embeddings[rows])
+        return result
+
+    def query(self, query_embeddings, n_results: int = 10, **kwargs) -> Dict:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        dots = queries @ self.embeddings.T
+        if self.space == "cosine":
+            query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            distances = 1 - dots / np.maximum(query_norms * np.sqrt(self._norms), 1e-12)
+        elif self.space == "ip":
+            distances = 1 - dots
+        else:
+            distances = (queries ** 2).sum(axis=1, keepdims=True) - 2 * dots + self._norms
+        top = np.argsort(distances, axis=1, kind="stable")[:, :n_results]
+        return {
+            "ids": [[self.ids[i] for i in row] for row in top.tolist()],
+            "documents": [[self.documents[i] for i in row] for row in top.tolist()],
+            "metadatas": [[self.metadatas[i] for i in row] for row in top.tolist()],
+            "distances": np.take_along_axis(distances, top, axis=1).tolist(),
+        }
+
+
+class SnapshotEmbeddings:
+    """Query embeddings from the snapshot's cache; the model is loaded only on a miss"""
+
+    def __init__(self, model_name: str, queries: List[str], vectors: np.ndarray):
+        self.model_name = model_name
+        self._index = {query: i for i, query in enumerate(queries)}
+        self._vectors = vectors
+
+    @property
+    def service(self):
+        return get_embedding_service()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.service.encode(texts)
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        if all(query in self._index for query in queries):
+            return np.asarray(self._vectors[[self._index[query] for query in queries]], dtype=np.float32)
+        return self.service.encode_queries(queries)
+
+
+# ============================================================================
+# SAVE / LOAD
+# ============================================================================
+
+def save_snapshot(path: str, collections: List, queries: List[str] = (), embeddings=None,
+                  profiles=None, extra_meta: Dict = None):
+    """Snapshot Chroma collections, precomputed query embeddings and baseline profiles"""
+    embeddings = embeddings or get_embedding_service()
+    arrays, meta = {}, {"embedding_model": embeddings.model_name, "collections": {}}
+
+    for collection in collections:
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        meta["collections"][collection.name] = {
+            "ids": data["ids"],
+            "documents": data["documents"],
+            "metadatas": data["metadatas"],
+            "space": (collection.metadata or {}).get("hnsw:space", "l2"),
+        }
+        arrays[f"collections/{collection.name}/embeddings"] = np.asarray(data["embeddings"], dtype=np.float32)
+
+    queries = list(dict.fromkeys(queries))
+    meta["queries"] = queries
+    if queries:
+        arrays["query_embeddings"] = embeddings.encode_queries(queries)
+
+    if profiles is not None:
+        for name in profiles.ARRAYS:
+            arrays[f"profiles/{name}"] = getattr(profiles, name)
+    meta.update(extra_meta or {})
+    write_snapshot(path, arrays, meta)
+
+
+def load_snapshot(path: str) -> Dict:
+    """Collections, embeddings and profiles from a snapshot, backed by one read-only mapping"""
+    from behavior_profiles import ProfileStore
+
+    arrays, meta = read_snapshot(path)
+    dimension = None
+    collections = {}
+    for name, spec in meta["collections"].items():
+        vectors = arrays[f"collections/{name}/embeddings"]
+        dimension = dimension or (vectors.shape[1] if vectors.ndim == 2 else None)
+        collections[name] = SnapshotCollection(name, spec["ids"], spec["documents"], spec["metadatas"],
+                                               vectors, spec["space"])
+
+    query_vectors = arrays.get("query_embeddings", np.empty((0, dimension or 0), dtype=np.float32))
+    profiles = None
+    if f"profiles/{ProfileStore.ARRAYS[0]}" in arrays:
+        profiles = ProfileStore(**{name: arrays[f"profiles/{name}"] for name in ProfileStore.ARRAYS})
+
+    return {
+        "meta": meta,
+        "collections": collections,
+        "embeddings": SnapshotEmbeddings(meta["embedding_model"], meta["queries"], query_vectors),
+        "profiles": profiles,
+    }
+
+
+if __name__ == "__main__":
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="Snapshot ChromaDB collections for fast, read-only worker startup")
+    parser.add_argument("--db-path", default="chroma_db", help="ChromaDB persistent storage directory")
+    parser.add_argument("--collection", action="append", required=True, help="Collection to include (repeatable)")
+    parser.add_argument("--output", required=True, help="Snapshot file to write")
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=args.db_path)
+    save_snapshot(args.output, [client.get_collection(name) for name in args.collection])
+    print(f"✓ Saved snapshot of {', '.join(args.collection)} to {args.output} "
+          f"({os.path.getsize(args.output) / 1024:.1f} KiB)")
@@ -1,43 +1,52 @@
-import chromadb
+import numpy as np
 import pandas as pd
-import json
 import os
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
-import statistics
-
-import requests
-from openai import OpenAI
-
-# --- 1. Konfiguracja ---
-# Sprawdź, który serwer jest aktywny i ustaw odpowiedni URL
-OLLAMA_URL = "http://localhost:11434"
-LM_STUDIO_URL = "http://localhost:1234"
-
-api_url = ""
-api_key = "ollama"
-model_name = "gemma3:1b"
-
-OLLAMA_AVAILABLE = False
-LM_STUDIO_AVAILABLE = False
-
-try:
-    requests.get(OLLAMA_URL)
-    api_url = f"{OLLAMA_URL}/v1"
-    OLLAMA_AVAILABLE = True
-    print("✓ Wykryto serwer Ollama.")
-except requests.exceptions.ConnectionError:
-    try:
-        requests.get(LM_STUDIO_URL)
-        api_url = f"{LM_STUDIO_URL}/v1"
-        LM_STUDIO_AVAILABLE = True
-        print("✓ Wykryto serwer LM Studio.")
-    except requests.exceptions.ConnectionError:
-        print("❌ Nie wykryto aktywnego serwera Ollama ani LM Studio.")
-        exit()
-
-# Inicjalizacja klienta OpenAI, który będzie komunikował się z lokalnym serwerem
-client = OpenAI(base_url=api_url, api_key=api_key)
+import argparse
+import multiprocessing
+from datetime import datetime
+from typing import List, Dict
+from functools import partial
+
+from fraud_detectors import build_timestamps, run_detectors, DETECTOR_REGISTRY, AccountRule, RowRule
+from transaction_graph import detect_layering, LAYERING_PATTERN
+from behavior_profiles import ProfileStore, detect_behavior_change, BEHAVIOR_PATTERNS
+from peer_groups import analyze_peer_groups
+from quantile_sketch import QuantileSketches
+from case_store import CaseStore, case_features, summary_from_stats, summarize_cases
+from embedding_service import get_embedding_service
+from transaction_schema import load_transactions
+from transaction_dataset import PartitionedDataset
+from ingestion import drop_duplicate_ids
+from engine_snapshot import load_snapshot, save_snapshot
+from llm_router import get_llm_router, LLMUnavailableError
+from prompt_templates import PromptTemplate, warm_up
+import profiling
+from llm_triage import LLMBudget, TriageStopped, run_triage, save_pending, load_pending
+from report_memo import ReportMemo
+from results_store import ResultsStore
+from sharded_runs import ShardQueue
+from structured_analysis import ACCOUNT_ANALYSIS, build_account_messages, parse_account_analysis, AnalysisParseError, RISK_LEVELS
+
+# Free-text analysis of one detected pattern; the static questions form the cached prompt prefix
+PATTERN_ANALYSIS = PromptTemplate("pattern_analysis", """
+You analyze financial fraud patterns detected on customer accounts.
+
+For the pattern in each request, based on your knowledge of financial fraud detection and AML regulations:
+1. What are the key risk indicators?
+2. What regulatory requirements apply?
+3. What immediate actions should be taken?
+4. What is the recommended investigation approach?
+
+Provide a concise, actionable analysis.
+""", """
+Analyze the following financial fraud pattern:
+
+Pattern: {pattern}
+Severity Level: {severity}
+Number of Occurrences: {count}
+Account: {account_id}
+{history}""")
+
 # ============================================================================
 # FRAUD DETECTION ENGINE
 # ============================================================================
@@ -45,19 +54,44 @@ client = OpenAI(base_url=api_url, api_key=api_key)
 class FraudDetectionEngine:
     """Main fraud detection engine using RAG and LLM"""
 
-    def __init__(self, chroma_db_path="/chroma_db"):
-        """Initialize the fraud detection engine"""
-        self.client = chromadb.PersistentClient(path=chroma_db_path)
-        self.fraud_patterns_collection = self.client.get_collection(name="fraud_patterns")
-        self.financial_docs_collection = self.client.get_collection(name="financial_documents")
-        self.model = "gemma3:1b"  # Primary model
+    def __init__(self, chroma_db_path="/chroma_db", snapshot_path: str = None):
+        """Initialize the fraud detection engine
+
+        With `snapshot_path` the engine starts from a warm-start snapshot (see
+        save_snapshot): retrieval tables, query embeddings and baseline profiles
+        are mapped read-only from one file, and neither ChromaDB nor the
+        embedding model is loaded unless a query misses the snapshot.
+        """
+        snapshot = load_snapshot(snapshot_path) if snapshot_path else None
+        if snapshot:
+            self.client = None
+            self.fraud_patterns_collection = snapshot['collections']['fraud_patterns']
+            self.financial_docs_collection = snapshot['collections']['financial_documents']
+            self.embeddings = snapshot['embeddings']
+        else:
+            import chromadb  # only needed without a snapshot
+            self.client = chromadb.PersistentClient(path=chroma_db_path)
+            self.fraud_patterns_collection = self.client.get_collection(name="fraud_patterns")
+            self.financial_docs_collection = self.client.get_collection(name="financial_documents")
+            # Queries are embedded with the same shared model the knowledge packs were loaded with
+            self.embeddings = get_embedding_service()
+        # LLM calls go through a pool of OpenAI-compatible backends (see llm_router.py)
+        self.llm = get_llm_router()
         self.analysis_results = []
+        self.detectors = list(DETECTOR_REGISTRY)
+        self.graph_detections = {}
+        self.profiles = None
+        self.sketches = None
+        self.cases = None
+        self.peer_groups = None
+        if snapshot and snapshot['profiles'] is not None:
+            self.use_profiles(snapshot['profiles'])
 
     def query_fraud_patterns(self, query: str, n_results: int = 5) -> List[Dict]:
         """Query RAG database for relevant fraud patterns"""
         try:
             results = self.fraud_patterns_collection.query(
-                query_texts=[query],
+                query_embeddings=self.embeddings.encode_queries([query]).tolist(),
                 n_results=n_results
             )
 
@@ -78,7 +112,7 @@ class FraudDetectionEngine:
         """Query compliance and regulatory documents"""
         try:
             results = self.financial_docs_collection.query(
-                query_texts=[query],
+                query_embeddings=self.embeddings.encode_queries([query]).tolist(),
                 n_results=n_results
             )
 
@@ -95,19 +129,13 @@ class FraudDetectionEngine:
             print(f"Error querying compliance docs: {e}")
             return []
 
-    def analyze_with_ollama(self, prompt: str, model: str = None) -> str:
-        if model is None:
-            model = self.model
-
+    def analyze_with_ollama(self, messages: List[Dict], model: str = None) -> str:
+        """Run the prompt on the least-loaded LLM backend; falls back to a mock analysis"""
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.choices[0].message["content"]
-        except Exception as e:
-            print(f"Error calling Ollama via OpenAI API-compatible endpoint: {e}")
-            return self._generate_mock_analysis(prompt)
+            return self.llm.chat(messages, model=model)
+        except LLMUnavailableError as e:
+            print(f"Error calling LLM backends via OpenAI API-compatible endpoint: {e}")
+            return self._generate_mock_analysis(messages[-1]["content"])
 
     def _generate_mock_analysis(self, prompt: str) -> str:
         """Generate mock analysis when Ollama is not available"""
@@ -167,39 +195,74 @@ FRAUD ANALYSIS RESULT:
 - Next Steps: Request additional verification, monitor for related transactions
 """
 
+    def analyze_account_structured(self, account_id: str, detections: List[Dict], stats: Dict,
+                                   patterns: List[Dict], compliance_docs: List[Dict],
+                                   similar_cases: List[List[Dict]] = None, attempts: int = 2) -> Dict:
+        """One LLM call for all of an account's detections, parsed into validated JSON entries
+
+        An invalid answer is sent back once with the validation error; if the LLM
+        backends are unavailable, mock entries are returned with source "mock".
+        """
+        messages = build_account_messages(account_id, detections, stats, patterns, compliance_docs, similar_cases)
+        error = None
+        for _ in range(attempts):
+            try:
+                answer = self.llm.chat(messages, temperature=0.1)
+            except LLMUnavailableError as e:
+                print(f"Error calling LLM backends via OpenAI API-compatible endpoint: {e}")
+                return {'source': 'mock', 'analyses': self._mock_structured_analysis(detections)}
+            try:
+                return {'source': 'llm', 'analyses': parse_account_analysis(answer, detections)}
+            except AnalysisParseError as e:
+                error = str(e)
+                messages += [{"role": "assistant", "content": answer},
+                             {"role": "user", "content": f"Your answer was invalid ({error}). "
+                                                         f"Return only the corrected JSON object."}]
+        return {'source': 'llm', 'analyses': [], 'error': error}
+
+    def _mock_structured_analysis(self, detections: List[Dict]) -> List[Dict]:
+        """Structured fallback built from the mock text analysis"""
+        return [{
+            'pattern': d['pattern'],
+            'risk_level': d['severity'] if d['severity'] in RISK_LEVELS else 'MEDIUM',
+            'risk_indicators': [],
+            'regulations': [],
+            'immediate_actions': [],
+            'investigation_approach': self._generate_mock_analysis(d['pattern']).strip()
+        } for d in detections]
+
     def statistical_analysis(self, transactions: pd.DataFrame) -> Dict:
         """Perform statistical analysis on transactions"""
+        # float32 amounts rounded back to exact cents in float64 before aggregating
+        amounts = np.round(transactions['amount'].to_numpy(dtype=np.float64), 2)
         analysis = {
             'total_transactions': int(len(transactions)),
-            'total_amount': float(transactions['amount'].sum()),
-            'average_amount': float(transactions['amount'].mean()),
-            'median_amount': float(transactions['amount'].median()),
-            'std_deviation': float(transactions['amount'].std()),
-            'min_amount': float(transactions['amount'].min()),
-            'max_amount': float(transactions['amount'].max()),
-            'amount_outliers': [float(x) for x in self._detect_outliers(transactions['amount'])],
+            'total_amount': float(amounts.sum()),
+            'average_amount': float(amounts.mean()),
+            'median_amount': float(np.median(amounts)),
+            'std_deviation': float(amounts.std(ddof=1)) if len(amounts) > 1 else float('nan'),
+            'min_amount': float(amounts.min()),
+            'max_amount': float(amounts.max()),
+            'amount_outliers': self._detect_outliers(amounts),
             'frequency_analysis': self._analyze_frequency(transactions),
             'merchant_analysis': self._analyze_merchants(transactions),
             'geographic_analysis': self._analyze_locations(transactions)
         }
         return analysis
 
-    def _detect_outliers(self, series: pd.Series, threshold: float = 3.0) -> List[float]:
+    def _detect_outliers(self, amounts: np.ndarray, threshold: float = 3.0) -> List[float]:
         """Detect statistical outliers using z-score"""
-        mean = series.mean()
-        std = series.std()
-        if std == 0:
+        amounts = np.asarray(amounts, dtype=np.float64)
+        std = amounts.std(ddof=1) if len(amounts) > 1 else 0
+        if not std > 0:
             return []
-
-        z_scores = [(x - mean) / std for x in series]
-        outliers = [series.iloc[i] for i, z in enumerate(z_scores) if abs(z) > threshold]
-        return outliers
+        return amounts[np.abs(amounts - amounts.mean()) / std > threshold].tolist()
 
     def _analyze_frequency(self, transactions: pd.DataFrame) -> Dict:
         """Analyze transaction frequency patterns"""
-        trans_copy = transactions.copy()
-        trans_copy['date'] = pd.to_datetime(trans_copy['date'])
-        daily_counts = trans_copy.groupby('date').size()
+        # Days since epoch from the timestamps parsed at load time (no copy, no re-parsing)
+        timestamps = build_timestamps(transactions).to_numpy(dtype='datetime64[D]')
+        daily_counts = pd.Series(np.unique(timestamps[~np.isnat(timestamps)], return_counts=True)[1])
 
         return {
             'transactions_per_day_avg': float(daily_counts.mean()),
@@ -210,95 +273,166 @@ FRAUD ANALYSIS RESULT:
 
     def _analyze_merchants(self, transactions: pd.DataFrame) -> Dict:
         """Analyze merchant patterns"""
-        merchant_stats = transactions.groupby('merchant').agg({
-            'amount': ['count', 'sum', 'mean'],
-            'transaction_id': 'count'
-        }).round(2)
+        merchant_counts = transactions['merchant'].value_counts()
 
         return {
             'unique_merchants': int(transactions['merchant'].nunique()),
-            'top_merchants': transactions['merchant'].value_counts().head(5).to_dict(),
-            'new_merchants': int(len(transactions[
-                                         transactions['merchant'].str.contains('International|Transfer|ATM', case=False,
-                                                                               na=False)]))
+            'top_merchants': {str(k): int(v) for k, v in merchant_counts[merchant_counts > 0].head(5).items()},
+            'new_merchants': int(transactions['merchant'].str.contains('International|Transfer|ATM', case=False,
+                                                                       na=False).sum())
         }
 
     def _analyze_locations(self, transactions: pd.DataFrame) -> Dict:
         """Analyze geographic patterns"""
+        # Categorical value_counts also lists locations the account never used
         location_stats = transactions['location'].value_counts()
+        location_stats = location_stats[location_stats > 0]
 
         return {
             'unique_locations': int(transactions['location'].nunique()),
             'primary_location': str(location_stats.index[0]) if len(location_stats) > 0 else 'Unknown',
             'location_diversity': int(len(location_stats)),
-            'international_transactions': int(
-                len(transactions[transactions['location'].isin(['International', 'Unknown'])]))
+            'international_transactions': int(transactions['location'].isin(['International', 'Unknown']).sum())
+        }
+
+    def load_profiles(self, profiles_path: str) -> int:
+        """Load precomputed baseline profiles and enable the baseline comparison detectors"""
+        return self.use_profiles(ProfileStore.load(profiles_path))
+
+    def use_profiles(self, store: ProfileStore) -> int:
+        """Enable the baseline comparison detectors with an already loaded profile store"""
+        self.profiles = store
+        self.detectors.append(AccountRule(
+            'behavior_baseline',
+            ('account_id', 'timestamp', 'merchant', 'location', 'amount'),
+            partial(detect_behavior_change, store=self.profiles),
+            BEHAVIOR_PATTERNS
+        ))
+        return len(self.profiles)
+
+    def load_sketches(self, sketches_path: str) -> int:
+        """Load persisted per-account amount sketches (see quantile_sketch.py)
+
+        Percentile thresholds then come from the sketches, extended with the
+        transactions after their cutoff, instead of sorting every account's amounts.
+        They match the exact (pandas) quantiles within the sketch's relative
+        error alpha, so an amount within alpha of its account's threshold can
+        be flagged differently than with exact quantiles.
+        """
+        self.sketches = QuantileSketches.load(sketches_path)
+        return len(self.sketches)
+
+    def load_cases(self, cases_path: str) -> int:
+        """Load the store of historical flagged cases (built by case_store.py)"""
+        self.cases = CaseStore.load(cases_path)
+        return len(self.cases)
+
+    def similar_cases(self, account_id: str, detections: List[Dict], stats: Dict, k: int = 3) -> List[List[Dict]]:
+        """Top-k similar past cases of other accounts for every detection (one batched lookup)"""
+        if self.cases is None or not detections:
+            return [[] for _ in detections]
+        summary = summary_from_stats(stats)
+        return self.cases.similar([d['pattern'] for d in detections],
+                                  np.stack([case_features(d, summary) for d in detections]),
+                                  k=k, exclude_accounts=[str(account_id)] * len(detections))
+
+    def _current_sketches(self, transactions: pd.DataFrame) -> Dict:
+        """Stored sketches plus the transactions newer than their cutoff, by column"""
+        if self.sketches is None:
+            return None
+        recent = transactions
+        if not np.isnat(self.sketches.cutoff):
+            cutoff = pd.Timestamp(self.sketches.cutoff.item())
+            recent = transactions[(build_timestamps(transactions) >= cutoff).to_numpy()]
+        return {'amount': self.sketches.update(recent['account_id'], recent['amount'].to_numpy(dtype=np.float64))}
+
+    def detectable_patterns(self) -> List[str]:
+        """Every pattern name the detectors can emit, including graph analysis and the
+        baseline detectors (profiles may be loaded after the snapshot is written)"""
+        patterns = [LAYERING_PATTERN, *BEHAVIOR_PATTERNS]
+        for rule in self.detectors:
+            patterns.extend([rule.pattern] if isinstance(rule, RowRule) else rule.patterns)
+        return list(dict.fromkeys(patterns))
+
+    def save_snapshot(self, path: str) -> int:
+        """Write the engine's warm state to a single memory-mappable file for fast worker startup
+
+        Includes both knowledge base collections, embeddings of every pattern name
+        the detectors and knowledge base can produce (plus the current query
+        cache) and the baseline profiles, if loaded. Returns the file size.
+        """
+        pattern_names = self.detectable_patterns()
+        pattern_names += [metadata['pattern_name'] for metadata in
+                          self.fraud_patterns_collection.get(include=['metadatas'])['metadatas']]
+        pattern_names += list(getattr(self.embeddings, '_cache', {}))
+        save_snapshot(path, [self.fraud_patterns_collection, self.financial_docs_collection],
+                      queries=pattern_names, embeddings=self.embeddings, profiles=self.profiles)
+        return os.path.getsize(path)
+
+    def analyze_peers(self, transactions: pd.DataFrame) -> int:
+        """Cluster all accounts into peer groups by spending profile (needs the full dataset)"""
+        self.peer_groups = analyze_peer_groups(transactions)
+        return int(self.peer_groups['peer_group'].nunique())
+
+    def _peer_summary(self, account_id: str) -> Dict:
+        """Peer group statistics of one account, empty if peer analysis has not run"""
+        if self.peer_groups is None or account_id not in self.peer_groups.index:
+            return {}
+        row = self.peer_groups.loc[account_id]
+        return {
+            'peer_group': int(row['peer_group']),
+            'peer_group_size': int(row['peer_group_size']),
+            'deviation': float(row['deviation']),
+            'amount_zscore': float(row['amount_zscore'])
         }
 
+    def analyze_transaction_graph(self, transactions: pd.DataFrame) -> int:
+        """Run graph-based layering detection over all accounts' transfers
+
+        Needs the full dataset (money flows cross accounts), so it runs once before
+        per-account reports; detect_fraud_patterns picks up the stored results.
+        """
+        self.graph_detections = detect_layering(transactions)
+        return len(self.graph_detections)
+
     def detect_fraud_patterns(self, transactions: pd.DataFrame) -> List[Dict]:
         """Detect fraud patterns in transaction data"""
         detections = []
+        for account_detections in run_detectors(transactions, self.detectors,
+                                                sketches=self._current_sketches(transactions)).values():
+            detections.extend(account_detections)
 
-        # Pattern 1: Unusual amounts
-        unusual_amounts = transactions[transactions['amount'] > transactions['amount'].quantile(0.95)]
-        if len(unusual_amounts) > 0:
-            detections.append({
-                'pattern': 'Unusual Transaction Amounts',
-                'severity': 'HIGH',
-                'count': len(unusual_amounts),
-                'transactions': unusual_amounts.to_dict('records')[:3]
-            })
-
-        # Pattern 2: Rapid draining
-        daily_txn = transactions.groupby('date').size()
-        high_frequency_days = daily_txn[daily_txn > 5]
-        if len(high_frequency_days) > 0:
-            detections.append({
-                'pattern': 'Rapid Account Draining',
-                'severity': 'CRITICAL',
-                'count': len(high_frequency_days),
-                'days_affected': high_frequency_days.to_dict()
-            })
-
-        # Pattern 3: Structuring
-        structuring_txns = transactions[
-            (transactions['amount'] >= 9500) &
-            (transactions['amount'] <= 9999)
-            ]
-        if len(structuring_txns) > 3:
-            detections.append({
-                'pattern': 'Structuring (Smurfing)',
-                'severity': 'HIGH',
-                'count': len(structuring_txns),
-                'transactions': structuring_txns.to_dict('records')[:3]
-            })
-
-        # Pattern 4: Geographic anomalies
-        international_txns = transactions[
-            transactions['location'].isin(['International', 'Unknown'])
-        ]
-        if len(international_txns) > 2:
-            detections.append({
-                'pattern': 'Geographic Anomalies',
-                'severity': 'MEDIUM',
-                'count': len(international_txns),
-                'transactions': international_txns.to_dict('records')[:3]
-            })
-
-        # Pattern 5: Duplicate transactions
-        duplicate_txns = transactions[transactions['fraud_indicator'] == 'duplicate_transaction']
-        if len(duplicate_txns) > 0:
-            detections.append({
-                'pattern': 'Duplicate Transactions',
-                'severity': 'MEDIUM',
-                'count': len(duplicate_txns),
-                'transactions': duplicate_txns.to_dict('records')[:3]
-            })
+        # Layering (precomputed on the transaction graph, see analyze_transaction_graph)
+        for account_id in transactions['account_id'].unique():
+            detections.extend(self.graph_detections.get(account_id, []))
+
+        return detections
 
+    def detect_all_accounts(self, transactions: pd.DataFrame) -> Dict[str, List[Dict]]:
+        """Detect fraud patterns for every account in a single pass over the dataset"""
+        self.analyze_transaction_graph(transactions)
+        detections = run_detectors(transactions, self.detectors, sketches=self._current_sketches(transactions))
+        for account_id, graph_detections in self.graph_detections.items():
+            detections.setdefault(account_id, []).extend(graph_detections)
         return detections
 
-    def generate_report(self, account_id: str, transactions: pd.DataFrame) -> Dict:
-        """Generate comprehensive fraud analysis report"""
+    def assess_account(self, account_id: str, transactions: pd.DataFrame, detections: List[Dict]) -> Dict:
+        """Deterministic part of a report (statistics and risk score), computed without the LLM"""
+        stats = self.statistical_analysis(transactions)
+        stats['peer_analysis'] = self._peer_summary(account_id)
+        return {'statistics': stats, 'risk_score': self._calculate_risk_score(detections, stats)}
+
+    def generate_report(self, account_id: str, transactions: pd.DataFrame,
+                        detections: List[Dict] = None, structured: bool = False,
+                        assessment: Dict = None, run_llm: bool = True) -> Dict:
+        """Generate comprehensive fraud analysis report
+
+        With structured=True all detections are analyzed in a single LLM call
+        returning JSON (see structured_analysis.py) instead of one free-text call
+        per detection; the parsed entries are stored under 'llm_analysis'.
+        A precomputed `assessment` (see assess_account) is reused as is, and
+        run_llm=False leaves the LLM analysis out (see llm_triage.py).
+        """
         print(f"\n{'=' * 70}")
         print(f"FRAUD DETECTION ANALYSIS REPORT")
         print(f"Account: {account_id}")
@@ -308,7 +442,11 @@ FRAUD ANALYSIS RESULT:
         # Statistical analysis
         print("1. STATISTICAL ANALYSIS")
         print("-" * 70)
-        stats = self.statistical_analysis(transactions)
+        if assessment is None:
+            if detections is None:
+                detections = self.detect_fraud_patterns(transactions)
+            assessment = self.assess_account(account_id, transactions, detections)
+        stats = assessment['statistics']
         print(f"Total Transactions: {stats['total_transactions']}")
         print(f"Total Amount: ${stats['total_amount']:,.2f}")
         print(f"Average Transaction: ${stats['average_amount']:,.2f}")
@@ -318,17 +456,25 @@ FRAUD ANALYSIS RESULT:
         print(f"Outliers Detected: {len(stats['amount_outliers'])}")
         print(f"Unique Merchants: {stats['merchant_analysis']['unique_merchants']}")
         print(f"Unique Locations: {stats['geographic_analysis']['unique_locations']}")
+        if stats['peer_analysis']:
+            peer = stats['peer_analysis']
+            print(f"Peer Group: {peer['peer_group']} ({peer['peer_group_size']} accounts), "
+                  f"deviation {peer['deviation']:.2f}x typical")
 
         # Fraud pattern detection
         print("\n2. FRAUD PATTERN DETECTION")
         print("-" * 70)
-        detections = self.detect_fraud_patterns(transactions)
+        if detections is None:
+            detections = self.detect_fraud_patterns(transactions)
 
+        similar_cases = self.similar_cases(account_id, detections, stats)
         if detections:
-            for detection in detections:
+            for detection, cases in zip(detections, similar_cases):
                 print(f"\n  ⚠️  Pattern: {detection['pattern']}")
                 print(f"     Severity: {detection['severity']}")
                 print(f"     Occurrences: {detection['count']}")
+                if self.cases is not None:
+                    print(f"     History: {summarize_cases(cases)}")
         else:
             print("No suspicious patterns detected")
 
@@ -336,12 +482,16 @@ FRAUD ANALYSIS RESULT:
         print("\n3. RAG-BASED FRAUD PATTERN MATCHING")
         print("-" * 70)
 
-        for detection in detections[:3]:  # Analyze top 3 detections
+        # Top 3 detections; structured mode puts every distinct pattern's context into its single prompt
+        rag_detections = list({d['pattern']: d for d in detections}.values()) if structured else detections[:3]
+        context_patterns, context_docs = {}, {}
+        for detection in rag_detections:
             pattern_name = detection['pattern']
             print(f"\n  Analyzing: {pattern_name}")
 
             # Query RAG database
             relevant_patterns = self.query_fraud_patterns(pattern_name, n_results=3)
+            context_patterns.update((rp['pattern'], rp) for rp in relevant_patterns)
             if relevant_patterns:
                 print(f"  Related patterns from knowledge base:")
                 for rp in relevant_patterns:
@@ -351,6 +501,7 @@ FRAUD ANALYSIS RESULT:
 
             # Query compliance documents
             compliance_docs = self.query_compliance_docs(pattern_name, n_results=2)
+            context_docs.update((doc['content'], doc) for doc in compliance_docs)
             if compliance_docs:
                 print(f"  Relevant regulations:")
                 for doc in compliance_docs:
@@ -362,38 +513,43 @@ FRAUD ANALYSIS RESULT:
         print("\n4. DETAILED LLM ANALYSIS")
         print("-" * 70)
 
-        for detection in detections[:2]:  # Analyze top 2 with LLM
+        llm_analysis = None
+        if not run_llm and detections:
+            print("  LLM analysis deferred by the triage budget")
+        elif structured and detections:
+            llm_analysis = self.analyze_account_structured(
+                account_id, detections, stats, list(context_patterns.values()), list(context_docs.values()),
+                similar_cases=similar_cases if self.cases is not None else None
+            )
+            if llm_analysis.get('error'):
+                print(f"  Could not parse structured LLM analysis: {llm_analysis['error']}")
+            for entry in llm_analysis['analyses']:
+                print(f"\n  Pattern: {entry['pattern']} (LLM risk level: {entry['risk_level']})")
+                for field in ('risk_indicators', 'regulations', 'immediate_actions'):
+                    if entry[field]:
+                        print(f"    {field.replace('_', ' ').title()}: {'; '.join(entry[field])}")
+                if entry['investigation_approach']:
+                    print(f"    Investigation: {entry['investigation_approach']}")
+
+        for i, detection in enumerate([] if structured or not run_llm else detections[:2]):  # Analyze top 2 with LLM
             pattern_name = detection['pattern']
             severity = detection['severity']
             count = detection['count']
+            history = f"Similar Past Cases: {summarize_cases(similar_cases[i])}\n" if self.cases is not None else ""
 
-            prompt = f"""
-Analyze the following financial fraud pattern:
-
-Pattern: {pattern_name}
-Severity Level: {severity}
-Number of Occurrences: {count}
-Account: {account_id}
-
-Based on your knowledge of financial fraud detection and AML regulations:
-1. What are the key risk indicators?
-2. What regulatory requirements apply?
-3. What immediate actions should be taken?
-4. What is the recommended investigation approach?
-
-Provide a concise, actionable analysis.
-"""
+            messages = PATTERN_ANALYSIS.messages(pattern=pattern_name, severity=severity, count=count,
+                                                 account_id=account_id, history=history)
 
             print(f"\n  Pattern: {pattern_name}")
             print("  " + "-" * 66)
-            analysis = self.analyze_with_ollama(prompt)
+            analysis = self.analyze_with_ollama(messages)
             # Print first 500 chars of analysis
             print(analysis[:500] if len(analysis) > 500 else analysis)
 
         # Risk Score
         print("\n5. OVERALL RISK ASSESSMENT")
         print("-" * 70)
-        risk_score = self._calculate_risk_score(detections, stats)
+        risk_score = assessment['risk_score']
         print(f"Risk Score: {risk_score['score']:.1f}/100")
         print(f"Risk Level: {risk_score['level']}")
         print(f"Recommendation: {risk_score['recommendation']}")
@@ -429,6 +585,8 @@ Provide a concise, actionable analysis.
             'timestamp': datetime.now().isoformat(),
             'statistics': stats,
             'detections': detections,
+            'similar_cases': similar_cases,
+            'llm_analysis': llm_analysis,
             'risk_score': risk_score
         }
 
@@ -448,6 +606,11 @@ Provide a concise, actionable analysis.
         # Adjust based on outliers
         score += min(len(stats['amount_outliers']) * 5, 20)
 
+        # Adjust based on deviation from the account's peer group (typical deviation is 1.0)
+        peer = stats.get('peer_analysis')
+        if peer:
+            score += min(max(peer['deviation'] - 2.0, 0) * 5, 15)
+
         # Cap at 100
         score = min(score, 100)
 
@@ -476,40 +639,252 @@ Provide a concise, actionable analysis.
 # MAIN EXECUTION
 # ============================================================================
 
+def read_transactions(data_path: str, accounts: List[str] = None, since: str = None, until: str = None,
+                      columns: List[str] = None) -> pd.DataFrame:
+    """Transactions of `accounts` (all if None) with since <= timestamp < until, in the engine's schema
+
+    From a partitioned dataset directory (see transaction_dataset.py) only the
+    partitions and columns that can match are read; a CSV is loaded whole and
+    then filtered.
+    """
+    if os.path.isdir(data_path):
+        return PartitionedDataset(data_path).read(accounts, since, until, columns)
+    df = load_transactions(data_path)
+    mask = np.ones(len(df), dtype=bool)
+    if accounts is not None:
+        mask &= df['account_id'].isin([str(account_id) for account_id in accounts]).to_numpy()
+    if since is not None:
+        mask &= (df['timestamp'] >= pd.Timestamp(since)).to_numpy()
+    if until is not None:
+        mask &= (df['timestamp'] < pd.Timestamp(until)).to_numpy()
+    if not mask.all():
+        df = df[mask].reset_index(drop=True)
+        for column in df.select_dtypes('category').columns:
+            df[column] = df[column].cat.remove_unused_categories()
+    return df if columns is None else df[columns]
+
+
+def prepare_run(args, log=print):
+    """Engine, transactions and detections for a run (everything before per-account reports)"""
+    # Initialize engine (from a warm-start snapshot if given)
+    with profiling.stage("load_engine"):
+        engine = FraudDetectionEngine(snapshot_path=args.snapshot)
+    healthy = engine.llm.check_health()
+    if healthy:
+        log(f"✓ Active LLM backends: {', '.join(b.name for b in healthy)}")
+        # Load the model and cache the shared prompt prefixes before the first account
+        warm = warm_up(engine.llm, [ACCOUNT_ANALYSIS if args.structured_llm else PATTERN_ANALYSIS])
+        log(f"✓ LLM warm-up: {', '.join(f'{name} {max(t.values(), default=0):.2f}s' for name, t in warm.items())}")
+    else:
+        log("❌ No Ollama / LM Studio backend detected - using mock analysis")
+
+    # Load sample data (the partitioned dataset when present, so filters read only matching partitions)
+    data_path = args.data or next((path for path in ("sample_data/transactions_dataset", "sample_data/transactions.csv")
+                                   if os.path.exists(path)), "sample_data/transactions.csv")
+    if not os.path.exists(data_path):
+        print(f"Error: Sample data not found at {data_path}")
+        return None
+
+    # Categorical text columns, float32 amounts and parsed timestamps, established once
+    with profiling.stage("load_data"):
+        df = read_transactions(data_path, args.accounts, args.since, args.until)
+        # A transaction_id seen twice (overlapping exports) would inflate counts and velocity alerts
+        df, dropped = drop_duplicate_ids(df)
+    log(f"\nLoaded {len(df)} transactions from {data_path}")
+    if dropped:
+        log(f"Dropped {dropped} rows with an already seen transaction_id")
+
+    # Baseline profiles are built offline by behavior_profiles.py
+    profiles_path = "sample_data/profiles.npz"
+    if engine.profiles is not None:
+        log(f"Using baseline profiles for {len(engine.profiles)} accounts from the snapshot")
+    elif os.path.exists(profiles_path):
+        log(f"Loaded baseline profiles for {engine.load_profiles(profiles_path)} accounts")
+    else:
+        log(f"No baseline profiles at {profiles_path} - run behavior_profiles.py to enable baseline detectors")
+    sketches_path = "sample_data/amount_sketches.npz"
+    if os.path.exists(sketches_path):
+        log(f"Loaded amount quantile sketches for {engine.load_sketches(sketches_path)} accounts")
+    cases_path = "sample_data/cases.npz"
+    if os.path.exists(cases_path):
+        log(f"Loaded {engine.load_cases(cases_path)} historical cases for similar-case lookup")
+    if args.save_snapshot:
+        log(f"✓ Saved warm-start snapshot to {args.save_snapshot} "
+            f"({engine.save_snapshot(args.save_snapshot) / 1024:.1f} KiB)")
+
+    # Run all detectors (including cross-account graph analysis) in one pass
+    with profiling.stage("detect"):
+        detections_by_account = engine.detect_all_accounts(df)
+        peer_groups = engine.analyze_peers(df)
+    log(f"Transaction graph analysis flagged {len(engine.graph_detections)} accounts for layering")
+    log(f"Peer group analysis formed {peer_groups} peer groups")
+    return engine, df, detections_by_account
+
+
+def process_shards(engine, df: pd.DataFrame, detections_by_account: Dict[str, List[Dict]],
+                   args, queue: ShardQueue, worker: str, budget: LLMBudget) -> int:
+    """Claim shards from the queue and write their reports until none are left
+
+    `budget` is this worker's share of the run's LLM budget; what each shard
+    spends is logged in the run directory so a resumed run continues from it.
+    Accounts left pending by the previous run are prioritized in every shard
+    (run_sharded saves the merged pending list). A shard whose lease is lost
+    is abandoned to the worker that took it over. All workers write their
+    reports to the results store under the run's creation time as run id, so a
+    resumed run keeps adding to the same run. Returns the number of shards processed.
+    """
+    positions = df.groupby('account_id', sort=False, observed=True).indices
+    previous_pending = load_pending(args.pending_file)
+    memo = None if args.no_report_memo else ReportMemo(args.report_memo)
+    results = ResultsStore(args.results_db, run_id=queue.manifest['created'])
+    processed = 0
+    while True:
+        shard = queue.claim(worker)
+        if shard is None:
+            break
+        rows = np.sort(np.concatenate([positions[account_id] for account_id in queue.shards[shard]]))
+        calls, seconds = budget.calls, budget.seconds
+        with profiling.stage(f"shard_{shard:04d}"), queue.lease(shard, worker) as lost:
+            try:
+                reports = run_triage(engine, df.iloc[rows], detections_by_account, budget,
+                                     min_level=args.llm_min_level, structured=args.structured_llm, memo=memo,
+                                     results=results, previous_pending=previous_pending, stop=lost)
+            except TriageStopped:
+                reports = None
+        queue.record_spend(shard, worker, budget.calls - calls, budget.seconds - seconds)
+        if reports is None or not queue.complete(shard, reports, worker):
+            print(f"[{worker}] shard {shard + 1}/{len(queue.shards)} taken over by another worker, skipped")
+            continue
+        processed += 1
+        print(f"[{worker}] shard {shard + 1}/{len(queue.shards)} done ({len(reports)} accounts)")
+    if memo is not None:
+        memo.close()
+    results.close()
+    return processed
+
+
+def shard_worker(args, worker: str, budget: LLMBudget):
+    """Entry point of an extra worker process in a sharded run"""
+    if args.profile:
+        # Each worker profiles into its own subdirectory
+        profiling.configure(os.path.join(args.profile, worker))
+    prepared = prepare_run(args, log=lambda *_: None)
+    if prepared is not None:
+        process_shards(*prepared, args, ShardQueue(args.run_dir), worker, budget)
+
+
+def run_sharded(engine, df: pd.DataFrame, detections_by_account: Dict[str, List[Dict]], args) -> List[Dict]:
+    """Process all accounts in checkpointed shards with `args.workers` local processes
+
+    Completed shards are kept in `args.run_dir`; rerunning with the same run
+    directory resumes with the unfinished shards only. Returns the merged
+    reports, or None if some shards are still unfinished (e.g. a worker failed).
+    """
+    settings = {'structured_llm': args.structured_llm, 'llm_min_level': args.llm_min_level,
+                'snapshot': args.snapshot, 'shard_size': args.shard_size,
+                'data': args.data, 'since': args.since, 'until': args.until}
+    queue = ShardQueue.create(args.run_dir, df['account_id'].unique(), args.shard_size, settings)
+    remaining = queue.remaining()
+    print(f"Run {args.run_dir}: {len(queue.shards) - len(remaining)} of {len(queue.shards)} shards already done")
+
+    # Extra workers are separate processes that load their own engine and data
+    # and spend an equal share of what is left of the LLM budget
+    budget = LLMBudget(args.llm_max_calls, args.llm_max_seconds).remaining(*queue.spent())
+    context = multiprocessing.get_context("spawn")
+    count = max(1, min(args.workers, len(remaining)))
+    workers = [context.Process(target=shard_worker, args=(args, f"worker-{i}", budget.share(i, count)))
+               for i in range(1, count)]
+    for process in workers:
+        process.start()
+    process_shards(engine, df, detections_by_account, args, queue, "worker-0", budget.share(0, count))
+    for process in workers:
+        process.join()
+
+    try:
+        return queue.merge()
+    except RuntimeError as e:
+        print(f"❌ {e} - rerun with --run-dir {args.run_dir} to resume")
+        return None
+
+
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description="Financial fraud detection with ChromaDB RAG and LLM analysis")
+    parser.add_argument("--data", help="Transactions CSV or partitioned dataset directory "
+                                       "(default: sample_data/transactions_dataset, else sample_data/transactions.csv)")
+    parser.add_argument("--accounts", nargs="+", help="Only rescore these accounts")
+    parser.add_argument("--since", help="Only transactions at or after this date/time (e.g. 2026-10-12)")
+    parser.add_argument("--until", help="Only transactions before this date/time")
+    parser.add_argument("--structured-llm", action="store_true",
+                        help="Analyze all detections of an account in one LLM call with JSON output")
+    parser.add_argument("--llm-max-calls", type=int, default=None, help="LLM call budget for this run")
+    parser.add_argument("--llm-max-seconds", type=float, default=None, help="Budget of seconds spent in LLM calls for this run")
+    parser.add_argument("--llm-min-level", default="MEDIUM", choices=["CRITICAL", "HIGH", "MEDIUM", "LOW"],
+                        help="Lowest risk level that gets LLM analysis")
+    parser.add_argument("--pending-file", default="llm_pending.json",
+                        help="Accounts left without LLM analysis, prioritized in the next run")
+    parser.add_argument("--report-memo", default="report_memo.sqlite",
+                        help="Store of previous reports, reused for accounts whose data and configuration are unchanged")
+    parser.add_argument("--no-report-memo", action="store_true", help="Recompute every account's report")
+    parser.add_argument("--run-dir", help="Process accounts in checkpointed shards kept in this directory "
+                                          "(rerun with the same directory to resume)")
+    parser.add_argument("--shard-size", type=int, default=100, help="Accounts per shard in a sharded run")
+    parser.add_argument("--workers", type=int, default=1, help="Local worker processes in a sharded run")
+    parser.add_argument("--results-db", default="analysis_results.sqlite",
+                        help="Indexed store the reports are written to (query it with results_store.py)")
+    parser.add_argument("--export-json", metavar="PATH",
+                        help="Also export this run's reports to a .json or .jsonl file")
+    parser.add_argument("--snapshot", help="Start the engine from a warm-start snapshot file")
+    parser.add_argument("--save-snapshot", metavar="PATH", help="Write a warm-start snapshot after loading")
+    parser.add_argument("--profile", metavar="DIR", default=os.environ.get("PROFILE_DIR"),
+                        help="Write cProfile/tracemalloc results per stage and shard to this directory "
+                             "(.pstats, speedscope .json and text summaries; also PROFILE_DIR)")
+    args = parser.parse_args()
+    profiler = profiling.configure(args.profile)
+
     print("\n" + "=" * 70)
     print("FINANCIAL FRAUD DETECTION SYSTEM")
     print("Using ChromaDB RAG + Ollama (Llama3/DeepSeek)")
     print("=" * 70)
 
-    # Initialize engine
-    engine = FraudDetectionEngine()
-
-    # Load sample data
-    data_path = "sample_data/transactions.csv"
-    if not os.path.exists(data_path):
-        print(f"Error: Sample data not found at {data_path}")
+    prepared = prepare_run(args)
+    if prepared is None:
         return
+    engine, df, detections_by_account = prepared
 
-    df = pd.read_csv(data_path)
-    print(f"\nLoaded {len(df)} transactions from sample data")
-
-    # Analyze each account
+    # Score every account, then spend the LLM budget in descending risk order
+    # (reusing stored reports of accounts whose fingerprint is unchanged since the previous run)
     accounts = df['account_id'].unique()
-    all_reports = []
-
-    for account_id in accounts:
-        account_txns = df[df['account_id'] == account_id]
-        report = engine.generate_report(account_id, account_txns)
-        all_reports.append(report)
-
-    # Save reports
-    reports_path = "analysis_reports.json"
-    with open(reports_path, 'w') as f:
-        json.dump(all_reports, f, indent=2, default=str)
-
-    print(f"\n✓ Analysis reports saved to {reports_path}")
+    memo = None
+    if args.run_dir:
+        # Checkpointed shards, optionally processed by several worker processes
+        with profiling.stage("reports"):
+            all_reports = run_sharded(engine, df, detections_by_account, args)
+        if all_reports is None:
+            return
+        save_pending(args.pending_file, [r['account_id'] for r in all_reports if r['llm_status'] == 'pending'])
+        run_id = ShardQueue(args.run_dir).manifest['created']
+    else:
+        memo = None if args.no_report_memo else ReportMemo(args.report_memo)
+        results = ResultsStore(args.results_db)
+        run_id = results.run_id
+        with profiling.stage("reports"):
+            all_reports = run_triage(engine, df, detections_by_account,
+                                     LLMBudget(args.llm_max_calls, args.llm_max_seconds),
+                                     min_level=args.llm_min_level, structured=args.structured_llm,
+                                     pending_path=args.pending_file, memo=memo, results=results)
+        if memo is not None:
+            memo.close()
+        results.close()
+
+    # Reports were written to the results store in batches as they were generated
+    print(f"\n✓ Analysis reports saved to {args.results_db} (run {run_id})")
+    if args.export_json:
+        results = ResultsStore(args.results_db)
+        with profiling.stage("export"):
+            exported = results.export(args.export_json, run_id=run_id)
+        results.close()
+        print(f"✓ Exported {exported} reports to {args.export_json}")
 
     # Summary
     print("\n" + "=" * 70)
@@ -517,7 +892,18 @@ def main():
     print("=" * 70)
     print(f"Accounts analyzed: {len(accounts)}")
     print(f"Reports generated: {len(all_reports)}")
+    if memo is not None:
+        print(f"Reports reused from {args.report_memo}: {memo.hits} (unchanged accounts)")
     print(f"Total fraud patterns detected: {sum(len(r['detections']) for r in all_reports)}")
+    for status in ('analyzed', 'pending', 'skipped'):
+        print(f"LLM {status}: {sum(1 for r in all_reports if r['llm_status'] == status)} accounts")
+    if any(r['llm_status'] == 'pending' for r in all_reports):
+        print(f"Pending accounts saved to {args.pending_file} for the next run")
+    for name, stats in engine.llm.stats().items():
+        print(f"LLM backend {name}: {stats['requests']} requests, {stats['failures']} failures, "
+              f"p50 {stats['p50_seconds']}s, p95 {stats['p95_seconds']}s")
+    if profiler is not None:
+        profiler.report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,440 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Callable
+
+from transaction_schema import example_records
+
+
+# ============================================================================
+# TIMESTAMPS
+# ============================================================================
+
+def build_timestamps(transactions: pd.DataFrame) -> pd.Series:
+    """Combine the 'date' and 'time' columns into a single datetime column"""
+    if 'timestamp' in transactions.columns:
+        return transactions['timestamp']
+    return pd.to_datetime(
+        transactions['date'].astype(str) + ' ' + transactions['time'].astype(str),
+        errors='coerce'
+    )
+
+
+def _sorted_account_keys(transactions: pd.DataFrame, pad_seconds: int):
+    """Sort transactions by (account, timestamp) and build monotonic int64 search keys
+
+    Each account gets its own disjoint key range of width `span`, so a single
+    np.searchsorted over the whole array never crosses an account boundary
+    as long as the searched offset is smaller than `pad_seconds`.
+    """
+    timestamps = build_timestamps(transactions)
+    seconds = timestamps.to_numpy(dtype='datetime64[s]').astype(np.int64)
+    valid = ~np.isnat(timestamps.to_numpy(dtype='datetime64[s]'))
+
+    account_codes, accounts = pd.factorize(transactions['account_id'], sort=True)
+    positions = np.flatnonzero(valid & (account_codes >= 0))
+    seconds = seconds[positions]
+    account_codes = account_codes[positions]
+
+    order = np.lexsort((seconds, account_codes))
+    positions = positions[order]
+    seconds = seconds[order]
+    account_codes = account_codes[order]
+
+    if len(seconds):
+        seconds = seconds - seconds.min()
+        span = int(seconds.max()) + pad_seconds + 1
+    else:
+        span = pad_seconds + 1
+    keys = account_codes.astype(np.int64) * span + seconds
+    return positions, account_codes, accounts, keys
+
+
+# ============================================================================
+# VELOCITY DETECTION
+# ============================================================================
+
+@dataclass(frozen=True)
+class VelocityRule:
+    """A sliding time window with count and/or amount thresholds"""
+    pattern: str
+    severity: str
+    window: pd.Timedelta
+    min_count: int = 1
+    min_amount: Optional[float] = None
+
+
+DEFAULT_VELOCITY_RULES = [
+    # fp_003: 5+ transactions within 24 hours (previously: more than 5 per calendar date) that move a
+    # significant amount; balances are not in the data, so "total > 50% of balance" becomes a $10,000 floor
+    VelocityRule('Rapid Account Draining', 'CRITICAL', pd.Timedelta(hours=24), min_count=5, min_amount=10_000),
+    # fp_009: multiple transactions within minutes
+    VelocityRule('Velocity Fraud', 'CRITICAL', pd.Timedelta(minutes=10), min_count=3),
+]
+
+
+def detect_velocity(transactions: pd.DataFrame,
+                    rules: List[VelocityRule] = None,
+                    max_examples: int = 3) -> Dict[str, List[Dict]]:
+    """Evaluate sliding-window velocity rules for all accounts at once
+
+    Transactions are sorted once by (account, timestamp); for every transaction
+    the start of its trailing window is found with a single vectorized
+    searchsorted, and window counts/sums come from prefix sums. Runs in
+    O(n log n) without per-row Python. Returns detections keyed by account id;
+    'count' is the number of distinct transactions inside any triggering window.
+    """
+    if rules is None:
+        rules = DEFAULT_VELOCITY_RULES
+    if len(transactions) == 0 or not rules:
+        return {}
+
+    pad = max(int(rule.window.total_seconds()) for rule in rules) + 1
+    positions, account_codes, accounts, keys = _sorted_account_keys(transactions, pad)
+    if len(keys) == 0:
+        return {}
+
+    amounts = transactions['amount'].to_numpy(dtype=np.float64)[positions]
+    amount_prefix = np.concatenate(([0.0], np.cumsum(amounts)))
+    index = np.arange(len(keys))
+
+    results = {}
+    for rule in rules:
+        window = int(rule.window.total_seconds())
+        # Window is (t - window, t], i.e. transactions strictly within `window` of the last one
+        starts = np.searchsorted(keys, keys - window, side='right')
+        counts = index - starts + 1
+        sums = amount_prefix[index + 1] - amount_prefix[starts]
+
+        hit = counts >= rule.min_count
+        if rule.min_amount is not None:
+            hit &= sums >= rule.min_amount
+        if not hit.any():
+            continue
+
+        hit_idx = np.flatnonzero(hit)
+        hit_accounts = account_codes[hit_idx]
+        windows_per_account = np.bincount(hit_accounts, minlength=len(accounts))
+        # Distinct transactions inside any triggering window: union of the [start, end] row ranges
+        # (ranges never cross accounts, as account keys are padded apart by more than a window)
+        coverage = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.add.at(coverage, starts[hit_idx], 1)
+        np.add.at(coverage, hit_idx + 1, -1)
+        involved = np.cumsum(coverage[:-1]) > 0
+        transactions_per_account = np.bincount(account_codes[involved], minlength=len(accounts))
+
+        # Pick the densest window of every triggered account as the example
+        order = np.lexsort((-counts[hit_idx], hit_accounts))
+        first = np.flatnonzero(np.r_[True, hit_accounts[order][1:] != hit_accounts[order][:-1]])
+        best = hit_idx[order[first]]
+
+        for end in best:
+            code = account_codes[end]
+            window_rows = transactions.iloc[positions[starts[end]:end + 1]]
+            results.setdefault(accounts[code], []).append({
+                'pattern': rule.pattern,
+                'severity': rule.severity,
+                'count': int(transactions_per_account[code]),
+                'windows': int(windows_per_account[code]),
+                'window': str(rule.window),
+                'max_transactions_in_window': int(counts[end]),
+                'max_amount_in_window': round(float(sums[end]), 2),
+                'transactions': example_records(window_rows.iloc[:max_examples])
+            })
+
+    return results
+
+
+# ============================================================================
+# DUPLICATE DETECTION
+# ============================================================================
+
+DUPLICATE_PATTERN = 'Duplicate Transactions'
+DUPLICATE_KEY_COLUMNS = ['account_id', 'merchant', 'currency']
+DEFAULT_DUPLICATE_WINDOW = pd.Timedelta(hours=1)
+
+
+def content_hashes(transactions: pd.DataFrame) -> np.ndarray:
+    """Hash (account, merchant, amount, currency) of every row into a uint64"""
+    keys = transactions[DUPLICATE_KEY_COLUMNS].astype(str)
+    keys['amount_cents'] = np.rint(transactions['amount'].to_numpy(dtype=np.float64) * 100).astype(np.int64)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def _find_repeats(hashes: np.ndarray, seconds: np.ndarray, window: int):
+    """Return (repeat, original) row positions for hashes re-seen within `window` seconds"""
+    order = np.lexsort((seconds, hashes))
+    same = hashes[order][1:] == hashes[order][:-1]
+    close = (seconds[order][1:] - seconds[order][:-1]) <= window
+    hit = np.flatnonzero(same & close)
+    return order[hit + 1], order[hit]
+
+
+def _duplicate_detections(transactions: pd.DataFrame, repeats: np.ndarray,
+                          original_ids: np.ndarray, max_examples: int) -> Dict[str, List[Dict]]:
+    """Group repeat rows by account and materialize examples for triggered accounts only"""
+    results = {}
+    if len(repeats) == 0:
+        return results
+
+    repeat_rows = transactions.iloc[repeats]
+    for account_id, positions in repeat_rows.groupby('account_id', sort=False, observed=True).indices.items():
+        examples = example_records(repeat_rows.iloc[positions[:max_examples]])
+        for example, original_id in zip(examples, original_ids[positions[:max_examples]]):
+            example['duplicate_of'] = original_id
+        results[account_id] = [{
+            'pattern': DUPLICATE_PATTERN,
+            'severity': 'MEDIUM',
+            'count': int(len(positions)),
+            'transactions': examples
+        }]
+    return results
+
+
+def detect_duplicates(transactions: pd.DataFrame,
+                      window: pd.Timedelta = DEFAULT_DUPLICATE_WINDOW,
+                      max_examples: int = 3) -> Dict[str, List[Dict]]:
+    """Find repeated (account, merchant, amount, currency) charges within a time window
+
+    Rows are hashed once and sorted by (hash, timestamp), so repeats are adjacent
+    and found with one vectorized comparison over all accounts.
+    """
+    if len(transactions) == 0:
+        return {}
+
+    seconds = build_timestamps(transactions).to_numpy(dtype='datetime64[s]')
+    valid = ~np.isnat(seconds)
+    rows = transactions[valid]
+    repeats, originals = _find_repeats(content_hashes(rows), seconds[valid].astype(np.int64),
+                                       int(window.total_seconds()))
+    original_ids = rows['transaction_id'].to_numpy()[originals]
+    return _duplicate_detections(rows, repeats, original_ids, max_examples)
+
+
+class DuplicateIndex:
+    """Incremental duplicate detector for streaming input
+
+    Keeps a bounded index of recent content hashes per account (at most
+    `max_per_account` entries, none older than `window` before the newest
+    transaction seen), so memory stays flat regardless of stream length.
+    """
+
+    def __init__(self, window: pd.Timedelta = DEFAULT_DUPLICATE_WINDOW, max_per_account: int = 1000):
+        self.window = window
+        self.max_per_account = max_per_account
+        self.recent = pd.DataFrame({
+            'account_id': pd.Series(dtype=object),
+            'transaction_id': pd.Series(dtype=object),
+            'hash': pd.Series(dtype=np.uint64),
+            'seconds': pd.Series(dtype=np.int64),
+        })
+
+    def __len__(self):
+        return len(self.recent)
+
+    def update(self, batch: pd.DataFrame, max_examples: int = 3) -> Dict[str, List[Dict]]:
+        """Detect duplicates in a new batch (against itself and the index), then absorb it"""
+        seconds = build_timestamps(batch).to_numpy(dtype='datetime64[s]')
+        valid = ~np.isnat(seconds)
+        batch = batch[valid]
+        if len(batch) == 0:
+            return {}
+
+        incoming = pd.DataFrame({
+            'account_id': batch['account_id'].to_numpy(),
+            'transaction_id': batch['transaction_id'].to_numpy(),
+            'hash': content_hashes(batch),
+            'seconds': seconds[valid].astype(np.int64),
+        })
+        combined = pd.concat([self.recent, incoming], ignore_index=True) if len(self.recent) else incoming
+        window = int(self.window.total_seconds())
+        repeats, originals = _find_repeats(combined['hash'].to_numpy(np.uint64),
+                                           combined['seconds'].to_numpy(np.int64), window)
+
+        # Only report repeats that arrived in this batch
+        offset = len(self.recent)
+        new = repeats >= offset
+
+        original_ids = combined['transaction_id'].to_numpy()[originals[new]]
+        results = _duplicate_detections(batch, repeats[new] - offset, original_ids, max_examples)
+
+        self._prune(combined, window)
+        return results
+
+    def _prune(self, combined: pd.DataFrame, window: int):
+        """Drop index entries outside the window and cap entries per account"""
+        recent = combined[combined['seconds'] >= combined['seconds'].max() - window]
+        recent = recent.sort_values('seconds', kind='stable')
+        keep = recent.groupby('account_id', sort=False, observed=True).cumcount(ascending=False) < self.max_per_account
+        self.recent = recent[keep].reset_index(drop=True)
+
+
+# ============================================================================
+# DETECTOR REGISTRY
+# ============================================================================
+
+class DetectorContext:
+    """Columnar view of the whole dataset shared by all rules in one executor pass
+
+    Column arrays and per-account aggregates are computed once and cached, so
+    rules that need the same inputs do not rescan the data. With `sketches`
+    (column -> QuantileSketches, see quantile_sketch.py) per-account quantiles
+    of those columns come from the mergeable sketches instead of sorting the
+    column per account.
+    """
+
+    def __init__(self, frame: pd.DataFrame, sketches: Dict = None):
+        self.frame = frame
+        self.codes, self.accounts = pd.factorize(frame['account_id'], sort=True)
+        self.num_accounts = len(self.accounts)
+        self.sketches = sketches or {}
+        self._cache = {}
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        if column not in self._cache:
+            self._cache[column] = self.frame[column].to_numpy()
+        return self._cache[column]
+
+    def isin(self, column: str, values) -> np.ndarray:
+        """Hash-based membership test of a column against a small set of values"""
+        return self.frame[column].isin(values).to_numpy()
+
+    def account_quantile(self, column: str, q: float) -> np.ndarray:
+        """Per-account quantile of a column, broadcast back to every row
+
+        Exact (pandas, linear interpolation) unless a sketch of the column was
+        given; sketched quantiles are within the sketch's relative error alpha.
+        """
+        key = ('quantile', column, q)
+        if key not in self._cache:
+            if column in self.sketches:
+                per_account = self.sketches[column].quantile(q, np.asarray(self.accounts).astype(str))
+            else:
+                per_account = self.frame[column].groupby(self.codes).quantile(q)
+                per_account = per_account.reindex(range(self.num_accounts)).to_numpy()
+            self._cache[key] = per_account[self.codes]
+        return self._cache[key]
+
+
+@dataclass(frozen=True)
+class RowRule:
+    """Row-level rule: an account triggers when at least `min_count` rows match"""
+    pattern: str
+    severity: str
+    columns: Tuple[str, ...]
+    predicate: Callable[[DetectorContext], np.ndarray]
+    min_count: int = 1
+
+
+@dataclass(frozen=True)
+class AccountRule:
+    """Set-level rule evaluated on the whole frame, returning detections keyed by account
+
+    `patterns` lists every pattern name the rule can emit (used to precompute
+    query embeddings, see FraudDetectionEngine.save_snapshot).
+    """
+    name: str
+    columns: Tuple[str, ...]
+    detect: Callable[[pd.DataFrame], Dict[str, List[Dict]]]
+    patterns: Tuple[str, ...] = ()
+
+
+DETECTOR_REGISTRY: List = []
+
+
+def register_detector(rule):
+    """Add a rule to the default registry; rules run in registration order"""
+    DETECTOR_REGISTRY.append(rule)
+    return rule
+
+
+def _unusual_amounts(ctx: DetectorContext) -> np.ndarray:
+    return ctx['amount'] > ctx.account_quantile('amount', 0.95)
+
+
+def _structuring(ctx: DetectorContext) -> np.ndarray:
+    amounts = ctx['amount']
+    return (amounts >= 9500) & (amounts <= 9999)
+
+
+def _international(ctx: DetectorContext) -> np.ndarray:
+    return ctx.isin('location', ['International', 'Unknown'])
+
+
+register_detector(RowRule('Unusual Transaction Amounts', 'HIGH', ('amount',), _unusual_amounts))
+register_detector(AccountRule('velocity', ('account_id', 'timestamp', 'amount'), detect_velocity,
+                              tuple(rule.pattern for rule in DEFAULT_VELOCITY_RULES)))
+register_detector(RowRule('Structuring (Smurfing)', 'HIGH', ('amount',), _structuring, min_count=4))
+register_detector(RowRule('Geographic Anomalies', 'MEDIUM', ('location',), _international, min_count=3))
+register_detector(AccountRule('duplicates', ('account_id', 'transaction_id', 'timestamp', 'merchant',
+                                             'amount', 'currency'), detect_duplicates,
+                              (DUPLICATE_PATTERN,)))
+
+
+def first_matches_per_account(codes: np.ndarray, matches: np.ndarray, limit: int) -> np.ndarray:
+    """Row positions of the first `limit` matches of every account, grouped by account"""
+    order = np.argsort(codes[matches], kind='stable')
+    matches = matches[order]
+    match_codes = codes[matches]
+    group_start = np.flatnonzero(np.r_[True, match_codes[1:] != match_codes[:-1]])
+    rank = np.arange(len(matches)) - np.repeat(group_start, np.diff(np.r_[group_start, len(matches)]))
+    return matches[rank < limit]
+
+
+def _row_rule_detections(rule: RowRule, ctx: DetectorContext, transactions: pd.DataFrame,
+                         max_examples: int) -> Dict[str, Dict]:
+    """Count matches per account and materialize example rows for triggered accounts only"""
+    matches = np.flatnonzero(rule.predicate(ctx))
+    if len(matches) == 0:
+        return {}
+    match_codes = ctx.codes[matches]
+    counts = np.bincount(match_codes, minlength=ctx.num_accounts)
+    matches = matches[counts[match_codes] >= rule.min_count]
+    if len(matches) == 0:
+        return {}
+
+    results = {}
+    for code in np.unique(ctx.codes[matches]).tolist():
+        results[ctx.accounts[code]] = {
+            'pattern': rule.pattern,
+            'severity': rule.severity,
+            'count': int(counts[code]),
+            'transactions': []
+        }
+    examples = first_matches_per_account(ctx.codes, matches, max_examples)
+    for code, record in zip(ctx.codes[examples].tolist(), example_records(transactions.iloc[examples])):
+        results[ctx.accounts[code]]['transactions'].append(record)
+    return results
+
+
+def run_detectors(transactions: pd.DataFrame, detectors: List = None,
+                  max_examples: int = 3, sketches: Dict = None) -> Dict[str, List[Dict]]:
+    """Evaluate all registered rules over all accounts in a single columnar pass
+
+    Row rules read their columns through one shared DetectorContext, straight
+    from the frame without copying it; account rules get the whole frame, as
+    their example rows carry every column. Timestamps are built once if a rule
+    declares them, and example rows are materialized only for accounts that
+    trigger. Returns detections keyed by account id, in rule order.
+    Percentile thresholds use `sketches` where given (see DetectorContext).
+    """
+    if detectors is None:
+        detectors = DETECTOR_REGISTRY
+    if len(transactions) == 0:
+        return {}
+
+    needs_timestamp = any('timestamp' in rule.columns for rule in detectors)
+    if needs_timestamp and 'timestamp' not in transactions.columns:
+        # Ad-hoc calls on raw frames; main() builds the timestamp column once at load time
+        transactions = transactions.assign(timestamp=build_timestamps(transactions))
+    ctx = DetectorContext(transactions, sketches)
+
+    results = {}
+    for rule in detectors:
+        if isinstance(rule, RowRule):
+            for account_id, detection in _row_rule_detections(rule, ctx, transactions, max_examples).items():
+                results.setdefault(account_id, []).append(detection)
+        else:
+            for account_id, detections in rule.detect(transactions).items():
+                results.setdefault(account_id, []).extend(detections)
+    return results
@@ -5,6 +5,8 @@ import random
 import json
 import os
 
+from transaction_dataset import PartitionedDataset
+
 # Set random seed for reproducibility
 np.random.seed(42)
 random.seed(42)
@@ -171,7 +173,8 @@ def generate_structuring_fraud(account_id, num_frauds=10):
 def generate_geographic_fraud(account_id, num_frauds=3):
     """Generate transactions from impossible locations"""
     transactions = []
-    base_date = datetime.now() - timedelta(days=7)
+    # After the structuring run (days -14 to -5) ends, so the two scenarios do not pile up in one day
+    base_date = datetime.now() - timedelta(days=3)
 
     locations = ["Tokyo", "London", "Sydney", "Dubai", "Hong Kong"]
 
@@ -208,13 +211,15 @@ def generate_duplicate_fraud(account_id, num_frauds=3):
         amount = round(np.random.uniform(100, 500), 2)
         merchant = random.choice(["Online Retailer", "Subscription Service", "Utility Company"])
 
-        # Create duplicate transactions
+        hour, minute = random.randint(10, 15), random.randint(0, 59)
+
+        # Create duplicate transactions (same charge repeated 30 seconds apart)
         for j in range(2):
             transactions.append({
                 "transaction_id": f"FRAUD_DUP_{account_id}_{i:05d}_{j}",
                 "account_id": account_id,
                 "date": (base_date + timedelta(days=i)).strftime("%Y-%m-%d"),
-                "time": f"{random.randint(10, 15):02d}:{random.randint(0, 59):02d}:{j * 30:02d}",
+                "time": f"{hour:02d}:{minute:02d}:{j * 30:02d}",
                 "merchant": merchant,
                 "amount": amount,
                 "currency": "USD",
@@ -227,6 +232,79 @@ def generate_duplicate_fraud(account_id, num_frauds=3):
     return transactions
 
 
+# ============================================================================
+# FRAUD SCENARIO 6: VELOCITY (CARD TESTING)
+# ============================================================================
+
+def generate_velocity_fraud(account_id, num_frauds=4):
+    """Generate a card-testing burst - several small charges within minutes"""
+    transactions = []
+    start = (datetime.now() - timedelta(days=20)).replace(hour=random.randint(9, 20), minute=0, second=0)
+    merchants = ["Online Gift Cards", "Digital Goods Store", "Prepaid Card Reload", "App Store"]
+
+    for i in range(num_frauds):
+        timestamp = start + timedelta(minutes=2 * i, seconds=random.randint(0, 59))
+
+        transactions.append({
+            "transaction_id": f"FRAUD_VEL_{account_id}_{i:05d}",
+            "account_id": account_id,
+            "date": timestamp.strftime("%Y-%m-%d"),
+            "time": timestamp.strftime("%H:%M:%S"),
+            "merchant": merchants[i % len(merchants)],
+            "amount": round(np.random.uniform(1, 50), 2),
+            "currency": "USD",
+            "location": random.choice(["New York", "Los Angeles", "Chicago", "Houston", "Phoenix"]),
+            "transaction_type": "debit",
+            "status": "completed",
+            "fraud_indicator": "velocity"
+        })
+
+    return transactions
+
+
+# ============================================================================
+# FRAUD SCENARIO 7: LAYERING
+# ============================================================================
+
+def generate_layering_fraud(account_id, num_mules=5):
+    """Generate layering pattern - funds dispersed to mule accounts, collected and returned"""
+    transactions = []
+    # Finished (day -21) before the structuring run starts (day -14)
+    base_date = datetime.now() - timedelta(days=28)
+    mules = [f"MULE_{account_id}_{i:02d}" for i in range(num_mules)]
+    collector = f"MULE_{account_id}_COLLECT"
+
+    def transfer(source, target, amount, day, index):
+        return {
+            "transaction_id": f"FRAUD_LAY_{source}_{index:05d}",
+            "account_id": source,
+            "date": (base_date + timedelta(days=day)).strftime("%Y-%m-%d"),
+            "time": f"{random.randint(9, 17):02d}:{random.randint(0, 59):02d}:00",
+            "merchant": random.choice(["Wire Transfer", "International Transfer"]),
+            "amount": amount,
+            "currency": "USD",
+            "location": "International",
+            "transaction_type": "transfer",
+            "status": "completed",
+            "fraud_indicator": "layering",
+            "counterparty_account": target
+        }
+
+    # Layer 1: origin fans out to mule accounts, one transfer a day (a same-day burst would look like draining)
+    amounts = [round(np.random.uniform(2000, 4000), 2) for _ in mules]
+    for i, (mule, amount) in enumerate(zip(mules, amounts)):
+        transactions.append(transfer(account_id, mule, amount, i, i))
+
+    # Layer 2: each mule forwards (minus a cut) to a single collector two days later
+    for i, (mule, amount) in enumerate(zip(mules, amounts)):
+        transactions.append(transfer(mule, collector, round(amount * 0.95, 2), i + 2, 0))
+
+    # Layer 3: collector returns funds to the origin
+    transactions.append(transfer(collector, account_id, round(sum(amounts) * 0.9, 2), num_mules + 2, 0))
+
+    return transactions
+
+
 # ============================================================================
 # MAIN DATA GENERATION
 # ============================================================================
@@ -270,6 +348,18 @@ for account_id in accounts:
         all_transactions.extend(fraud_txns)
         print(f"  ✓ Added {len(fraud_txns)} geographic anomaly fraud transactions")
 
+    if account_id == "ACC_004":
+        # Layering through mule accounts
+        fraud_txns = generate_layering_fraud(account_id)
+        all_transactions.extend(fraud_txns)
+        print(f"  ✓ Added {len(fraud_txns)} layering fraud transactions")
+
+    if account_id == "ACC_005":
+        # Card-testing burst
+        fraud_txns = generate_velocity_fraud(account_id)
+        all_transactions.extend(fraud_txns)
+        print(f"  ✓ Added {len(fraud_txns)} velocity fraud transactions")
+
     if account_id == "ACC_003":
         # Duplicate transactions
         fraud_txns = generate_duplicate_fraud(account_id, num_frauds=3)
@@ -284,6 +374,11 @@ csv_path = os.path.join(output_dir, "transactions.csv")
 df.to_csv(csv_path, index=False)
 print(f"\n✓ Saved {len(df)} transactions to {csv_path}")
 
+# Save as a partitioned dataset (account hash bucket x month) for filtered reads
+dataset_path = os.path.join(output_dir, "transactions_dataset")
+dataset = PartitionedDataset.write(dataset_path, df)
+print(f"✓ Saved transactions to {dataset_path} ({len(dataset.partitions)} partitions)")
+
 # Save to JSON
 json_path = os.path.join(output_dir, "transactions.json")
 with open(json_path, 'w') as f:
@@ -1,5 +1,14 @@
+import os
+import shutil
+
 import chromadb
-from sentence_transformers import SentenceTransformer
+
+from embedding_service import get_embedding_service
+from lexical_index import BM25Index
+import profiling
+
+# Profilowanie etapów (cProfile + tracemalloc): PROFILE_DIR=katalog python indeksowanie.py (patrz profiling.py)
+profiler = profiling.configure()
 
 # --- 1. Inicjalizacja ---
 # Używamy klienta ChromaDB, który działa w pamięci RAM
@@ -8,7 +17,10 @@ client = chromadb.PersistentClient(path='chroma_db')
 # Model do tworzenia wektorów (embeddings). Wybierz model odpowiedni do języka polskiego.
 # "all-MiniLM-L6-v2" jest szybki, ale lepszy dla angielskiego.
 # "paraphrase-multilingual-MiniLM-L12-v2" jest lepszy dla wielu języków.
-embedding_model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+# Model jest współdzielony przez wszystkie moduły (patrz embedding_service.py);
+# EMBEDDING_BACKEND=onnx włącza skwantyzowaną wersję int8 na CPU.
+with profiling.stage("load_model"):
+    embedding_model = get_embedding_service()
 
 # Tworzymy nową kolekcję (odpowiednik tabeli w SQL)
 # Jeśli kolekcja już istnieje, zostanie użyta istniejąca.
@@ -16,30 +28,52 @@ collection = client.get_or_create_collection("regulaminy_firmy")
 
 # --- 2. Ładowanie i dzielenie danych ---
 print("Ładowanie i dzielenie danych...")
-with open("dane.txt", "r", encoding="utf-8") as f:
-    text = f.read()
+with profiling.stage("load_chunks"):
+    with open("dane.txt", "r", encoding="utf-8") as f:
+        text = f.read()
 
-# Proste dzielenie tekstu na akapity (w praktyce używa się bardziej zaawansowanych metod)
-chunks = [chunk for chunk in text.split("\n\n") if chunk.strip()]
+    # Proste dzielenie tekstu na akapity (w praktyce używa się bardziej zaawansowanych metod)
+    chunks = [chunk for chunk in text.split("\n\n") if chunk.strip()]
 
 # --- 3. Tworzenie wektorów i zapis do bazy ---
 print(f"Tworzenie wektorów dla {len(chunks)} fragmentów...")
 
 # Generujemy wektory dla każdego fragmentu
-embeddings = embedding_model.encode(chunks).tolist()
+with profiling.stage("encode"):
+    embeddings = embedding_model.encode(chunks).tolist()
 
 # Tworzymy unikalne ID dla każdego fragmentu
 ids = [f"chunk_{i}" for i in range(len(chunks))]
 
-# Zapisujemy dane w ChromaDB
-collection.add(
-    embeddings=embeddings,
-    documents=chunks,
-    ids=ids
-)
+# Zapisujemy dane w ChromaDB (upsert: ponowne indeksowanie nadpisuje zmienione fragmenty)
+with profiling.stage("chroma_upsert"):
+    collection.upsert(
+        embeddings=embeddings,
+        documents=chunks,
+        ids=ids
+    )
+    # Gdy dane.txt się skrócił, fragmenty chunk_{len(chunks)} i dalsze już nie istnieją - usuwamy je
+    current_ids = set(ids)
+    stale_ids = [doc_id for doc_id in collection.get(include=[])["ids"] if doc_id not in current_ids]
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+
+# Te same fragmenty trafiają do indeksu leksykalnego BM25 używanego przez chatbot_rag.py;
+# indeks jest aktualizowany przyrostowo, tak jak baza wektorowa
+lexical_path = os.path.join('chroma_db', 'regulaminy_firmy.bm25.json')
+with profiling.stage("bm25_index"):
+    lexical_index = BM25Index.load(lexical_path) if os.path.exists(lexical_path) else BM25Index()
+    lexical_index.upsert(ids, chunks)
+    lexical_index.delete([doc_id for doc_id in lexical_index.slots if doc_id not in current_ids])
+    lexical_index.save(lexical_path)
+
+# Kompaktowy indeks wektorowy chatbota (COMPACT_INDEX) jest już nieaktualny - chatbot_rag.py zbuduje go
+# ponownie przy następnym starcie
+shutil.rmtree(os.path.join('chroma_db', 'regulaminy_firmy.compact'), ignore_errors=True)
 
 print("\n✓ Dane zostały zaindeksowane w ChromaDB!")
-print(f"Liczba dokumentów w kolekcji: {collection.count()}")
+print(f"Liczba dokumentów w kolekcji: {collection.count()} (usunięte nieaktualne: {len(stale_ids)})")
+print(f"Liczba dokumentów w indeksie BM25: {len(lexical_index)} ({lexical_path})")
 
 # --- 4. Testowe wyszukiwanie ---
 query = "Ile dni urlopu mi przysługuje?"
@@ -56,4 +90,7 @@ results = collection.query(
 print("\n--- Wyniki testowego wyszukiwania dla zapytania: '{}' ---".format(query))
 for i, doc in enumerate(results["documents"][0]):
     print(f"{i+1}. {doc.strip()}")
-    print(f"   (Podobieństwo: {results["distances"][0][i]:.4f})")
\ No newline at end of file
+    print(f"   (Podobieństwo: {results["distances"][0][i]:.4f})")
+
+if profiler is not None:
+    profiler.report()
@@ -0,0 +1,251 @@
+import os
+import json
+import math
+import argparse
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from transaction_schema import STRING_COLUMNS
+from transaction_dataset import PartitionedDataset
+
+
+# ============================================================================
+# BLOOM FILTER
+# ============================================================================
+
+class BloomFilter:
+    """Memory-mapped Bloom filter over string ids, vectorized over batches
+
+    Bit positions use double hashing of two 64-bit id hashes. The bit array
+    lives in a .npy file mapped read/write, so only the touched pages are
+    resident; 100 million ids at a 1% false positive rate take ~114 MiB.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            self.params = json.load(f)
+        self.num_bits = self.params["num_bits"]
+        self.num_hashes = self.params["num_hashes"]
+        self.bits = np.load(f"{path}.npy", mmap_mode="r+")
+
+    @classmethod
+    def create(cls, path: str, capacity: int, error_rate: float = 0.01) -> 'BloomFilter':
+        """Size the filter for `capacity` ids at `error_rate` false positives"""
+        num_bits = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        np.lib.format.open_memmap(f"{path}.npy", mode="w+", dtype=np.uint8, shape=(-(-num_bits // 8),)).flush()
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump({"capacity": capacity, "error_rate": error_rate, "num_bits": num_bits,
+                       "num_hashes": num_hashes, "count": 0}, f)
+        return cls(path)
+
+    def positions(self, ids: np.ndarray) -> np.ndarray:
+        """(len(ids), num_hashes) bit positions; computed once per batch for contains and add"""
+        first = pd.util.hash_array(ids, hash_key="bloom-hashkey-01", categorize=False)
+        second = pd.util.hash_array(ids, hash_key="bloom-hashkey-02", categorize=False) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (first[:, None] + steps[None, :] * second[:, None]) % np.uint64(self.num_bits)
+
+    def contains(self, positions: np.ndarray) -> np.ndarray:
+        """False means certainly never added; True means probably added"""
+        hits = self.bits[positions >> np.uint64(3)] & (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8))
+        return (hits != 0).all(axis=1)
+
+    def add(self, positions: np.ndarray):
+        self.params["count"] += len(positions)
+        positions = positions.ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8))
+
+    def flush(self):
+        self.bits.flush()
+        with open(f"{self.path}.json", "w", encoding="utf-8") as f:
+            json.dump(self.params, f)
+
+
+# ============================================================================
+# EXACT ID RUNS
+# ============================================================================
+
+class SortedIdRuns:
+    """Exact on-disk id set made of immutable sorted runs
+
+    Every batch of new ids is written as one sorted fixed-width byte array
+    (.npy, memory-mapped when read). Membership is a vectorized binary search
+    in each run, touching only a few pages per id. When there are more than
+    `max_runs` runs, the smallest ones are merged into one.
+    """
+
+    def __init__(self, directory: str, max_runs: int = 8):
+        self.directory = directory
+        self.max_runs = max_runs
+        self.runs = {name: np.load(os.path.join(directory, name), mmap_mode="r")
+                     for name in sorted(os.listdir(directory)) if name.startswith("run_") and name.endswith(".npy")}
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs.values())
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Exact membership of byte-string ids"""
+        found = np.zeros(len(ids), dtype=bool)
+        lengths = np.char.str_len(ids) if len(ids) else np.zeros(0, dtype=int)
+        for run in self.runs.values():
+            if len(run) == 0:
+                continue
+            # Ids longer than the run's width cannot be in it (and must not be truncated)
+            fits = np.flatnonzero(lengths <= run.dtype.itemsize)
+            wanted = ids[fits].astype(run.dtype)
+            pos = np.minimum(np.searchsorted(run, wanted), len(run) - 1)
+            found[fits] |= run[pos] == wanted
+        return found
+
+    def _write(self, ids: np.ndarray) -> str:
+        name = f"run_{max([int(n[4:-4]) for n in self.runs] + [0]) + 1:08d}.npy"
+        tmp_path = os.path.join(self.directory, f"{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, ids)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        self.runs[name] = np.load(os.path.join(self.directory, name), mmap_mode="r")
+        return name
+
+    def add(self, ids: np.ndarray):
+        """Record distinct ids not yet in the set as a new run (atomically), compacting if needed"""
+        if len(ids) == 0:
+            return
+        self._write(np.sort(ids))
+        if len(self.runs) > self.max_runs:
+            smallest = sorted(self.runs, key=lambda name: len(self.runs[name]))[:len(self.runs) - self.max_runs + 1]
+            merged = np.unique(np.concatenate([np.asarray(self.runs[name]) for name in smallest]))
+            self._write(merged)
+            for name in smallest:
+                del self.runs[name]
+                os.remove(os.path.join(self.directory, name))
+
+
+# ============================================================================
+# SEEN-ID INDEX
+# ============================================================================
+
+class SeenIdIndex:
+    """Persistent set of ingested transaction ids
+
+    A Bloom filter answers most lookups in memory; ids it reports as probably
+    seen (true duplicates plus ~error_rate of new ids) are confirmed against the
+    exact sorted runs on disk, so a new transaction is never dropped.
+    """
+
+    def __init__(self, directory: str, capacity: int = 100_000_000, error_rate: float = 0.01):
+        os.makedirs(directory, exist_ok=True)
+        bloom_path = os.path.join(directory, "bloom")
+        self.bloom = (BloomFilter(bloom_path) if os.path.exists(f"{bloom_path}.json")
+                      else BloomFilter.create(bloom_path, capacity, error_rate))
+        self.exact = SortedIdRuns(directory)
+
+    def __len__(self):
+        return self.bloom.params["count"]
+
+    def filter(self, batch: pd.DataFrame) -> Tuple[pd.DataFrame, Dict, Dict]:
+        """Rows of `batch` whose transaction_id was never ingested, without recording them
+
+        Returns (new rows, counts of rows, duplicates within the batch,
+        duplicates of earlier batches, false positives resolved by the exact
+        check, pending ids). Pass the pending ids to `commit` once the new rows
+        are stored, so a failed write never leaves ids marked as seen.
+        """
+        ids = batch['transaction_id'].astype(str).to_numpy(dtype=object)
+        in_batch = pd.Series(ids).duplicated().to_numpy()
+        try:
+            encoded = ids.astype(bytes)
+        except UnicodeEncodeError:
+            encoded = np.char.encode(ids.astype(str), "utf-8")
+
+        candidates = np.flatnonzero(~in_batch)
+        positions = self.bloom.positions(ids[candidates])
+        maybe = self.bloom.contains(positions)
+        seen = np.zeros(len(ids), dtype=bool)
+        seen[candidates[maybe]] = self.exact.contains(encoded[candidates[maybe]])
+        new = ~in_batch & ~seen
+
+        return batch[new], {
+            'rows': int(len(ids)),
+            'new': int(new.sum()),
+            'duplicates_in_batch': int(in_batch.sum()),
+            'duplicates_seen': int(seen.sum()),
+            'false_positives': int(maybe.sum() - seen.sum()),
+        }, {'positions': positions[~seen[candidates]], 'ids': encoded[new]}
+
+    def commit(self, pending: Dict):
+        """Record the ids returned by `filter` as seen"""
+        # Bloom bits are flushed before the exact run is written: a filter that is
+        # ahead of the runs only costs an extra lookup, never a missed duplicate
+        self.bloom.add(pending['positions'])
+        self.bloom.flush()
+        self.exact.add(pending['ids'])
+
+    def ingest(self, batch: pd.DataFrame) -> Tuple[pd.DataFrame, Dict]:
+        """filter and commit in one step, for ids that are already stored (seeding the index)"""
+        new_rows, counts, pending = self.filter(batch)
+        self.commit(pending)
+        return new_rows, counts
+
+
+def drop_duplicate_ids(transactions: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    """Keep the first row of every transaction_id in a loaded frame; returns (frame, rows dropped)"""
+    duplicated = transactions['transaction_id'].duplicated().to_numpy()
+    if not duplicated.any():
+        return transactions, 0
+    return transactions[~duplicated].reset_index(drop=True), int(duplicated.sum())
+
+
+# ============================================================================
+# COMMAND LINE INGESTION
+# ============================================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append transaction exports to the dataset, skipping ids seen before")
+    parser.add_argument("exports", nargs="+", help="CSV exports to ingest")
+    parser.add_argument("--dataset", default="sample_data/transactions.csv",
+                        help="Dataset to append to: a CSV or a partitioned dataset directory")
+    parser.add_argument("--index", default="sample_data/seen_ids", help="Seen-id index directory")
+    parser.add_argument("--capacity", type=int, default=100_000_000, help="Expected number of distinct ids")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Rows per ingestion batch")
+    args = parser.parse_args()
+
+    dtypes = {column: str for column in STRING_COLUMNS}
+    dataset = PartitionedDataset(args.dataset) if os.path.isdir(args.dataset) else None
+    new_index = not os.path.exists(os.path.join(args.index, "bloom.json"))
+    index = SeenIdIndex(args.index, capacity=args.capacity)
+    if new_index and dataset is not None:
+        # Seed a new index with the ids already in the dataset
+        ids = dataset.read(columns=['transaction_id'])
+        for start in range(0, len(ids), args.chunksize):
+            index.ingest(ids.iloc[start:start + args.chunksize])
+        print(f"✓ Seeded seen-id index with {len(index)} ids from {args.dataset}")
+    elif new_index and os.path.exists(args.dataset):
+        for chunk in pd.read_csv(args.dataset, dtype=dtypes, usecols=['transaction_id'], chunksize=args.chunksize):
+            index.ingest(chunk)
+        print(f"✓ Seeded seen-id index with {len(index)} ids from {args.dataset}")
+
+    for path in args.exports:
+        for number, chunk in enumerate(pd.read_csv(path, dtype=dtypes, chunksize=args.chunksize), start=1):
+            # Ids are recorded only after their rows are stored: a crash in between
+            # re-appends the batch on the next run (dropped at load) instead of losing it
+            new_rows, counts, pending = index.filter(chunk)
+            if dataset is not None:
+                # Only the (account bucket, month) partitions of the new rows are rewritten
+                dataset.append(new_rows)
+            elif os.path.exists(args.dataset) and os.path.getsize(args.dataset) > 0:
+                # Appended rows follow the dataset's column order
+                new_rows[pd.read_csv(args.dataset, nrows=0).columns].to_csv(args.dataset, mode='a', header=False,
+                                                                           index=False)
+            else:
+                new_rows.to_csv(args.dataset, index=False)
+            index.commit(pending)
+            print(f"{path} batch {number}: {counts['new']} new, "
+                  f"{counts['duplicates_in_batch'] + counts['duplicates_seen']} duplicates dropped "
+                  f"({counts['duplicates_in_batch']} within the batch, {counts['duplicates_seen']} seen before)")
@@ -0,0 +1,172 @@
+import os
+import glob
+import json
+import hashlib
+from datetime import datetime
+from typing import List, Dict
+
+import yaml
+
+from embedding_service import EmbeddingService, get_embedding_service
+
+
+# ============================================================================
+# KNOWLEDGE PACKS
+# ============================================================================
+
+def load_pack(path: str) -> Dict:
+    """Read a knowledge pack from a .json or .yaml/.yml file"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            pack = yaml.safe_load(f)
+        else:
+            pack = json.load(f)
+
+    for key in ("collection", "type", "entries"):
+        if key not in pack:
+            raise ValueError(f"Knowledge pack {path} is missing '{key}'")
+    if pack["type"] not in ENTRY_BUILDERS:
+        raise ValueError(f"Knowledge pack {path} has unknown type '{pack['type']}'")
+    # Stored entries are tagged with their pack, so entries dropped from the file can be found and deleted
+    pack.setdefault("source", os.path.basename(path))
+    return pack
+
+
+def find_packs(packs_dir: str) -> List[str]:
+    """All knowledge pack files in a directory, in a stable order"""
+    paths = []
+    for pattern in ("*.json", "*.yaml", "*.yml"):
+        paths.extend(glob.glob(os.path.join(packs_dir, pattern)))
+    return sorted(paths)
+
+
+def _fraud_pattern_entry(entry: Dict):
+    document = f"""
+Pattern: {entry['pattern']}
+Description: {entry['description']}
+Risk Level: {entry['risk_level']}
+Indicators: {', '.join(entry['indicators'])}
+Detection Method: {entry['detection_method']}
+"""
+    metadata = {
+        "pattern_name": entry['pattern'],
+        "risk_level": entry['risk_level'],
+        "indicators_count": len(entry['indicators'])
+    }
+    return document, metadata
+
+
+def _compliance_entry(entry: Dict):
+    metadata = {
+        "title": entry['title'],
+        "type": "compliance"
+    }
+    return entry['content'], metadata
+
+
+ENTRY_BUILDERS = {
+    "fraud_pattern": _fraud_pattern_entry,
+    "compliance": _compliance_entry,
+}
+
+
+def embedding_key(embeddings: EmbeddingService) -> str:
+    """Model and backend that produced a collection's vectors, e.g. 'paraphrase-...-L12-v2/onnx'"""
+    return f"{embeddings.model_name}/{embeddings.backend}"
+
+
+def content_hash(document: str, metadata: Dict, embedding_model: str) -> str:
+    """Stable hash of an entry's document, metadata and the embedding model/backend
+
+    Switching the model or backend changes every hash, so all entries are
+    re-embedded instead of mixing vectors from two embedding spaces.
+    """
+    payload = json.dumps({"document": document, "metadata": metadata, "embedding_model": embedding_model},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ============================================================================
+# SYNC
+# ============================================================================
+
+def sync_pack(client, pack: Dict, embeddings: EmbeddingService, batch_size: int = 64) -> Dict:
+    """Upsert a pack into its collection, re-embedding only new or changed entries
+
+    Each stored entry carries a `content_hash` in its metadata; entries whose
+    hash matches the stored one are skipped. Changed entries are embedded with
+    the shared embedding service in batches of `batch_size` and written with
+    one upsert per batch. Entries of this pack (metadata `pack`, or untagged
+    entries stored before packs were tagged) that are no longer in it are deleted.
+    """
+    collection_metadata = {
+        "description": pack.get("description", pack["collection"]),
+        "embedding_model": embedding_key(embeddings)
+    }
+    collection = client.get_or_create_collection(name=pack["collection"], metadata=collection_metadata)
+    if (collection.metadata or {}).get("embedding_model") != collection_metadata["embedding_model"]:
+        # An existing collection keeps its creation metadata unless updated
+        collection.modify(metadata=collection_metadata)
+
+    build = ENTRY_BUILDERS[pack["type"]]
+    source = pack.get("source", pack["collection"])
+    ids, documents, metadatas = [], [], []
+    for entry in pack["entries"]:
+        document, metadata = build(entry)
+        metadata["pack"] = source
+        metadata["content_hash"] = content_hash(document, metadata, collection_metadata["embedding_model"])
+        ids.append(entry["id"])
+        documents.append(document)
+        metadatas.append(metadata)
+
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate ids in knowledge pack for collection '{pack['collection']}'")
+
+    # Look up stored hashes in batches and keep only entries that changed
+    stored_hashes = {}
+    for start in range(0, len(ids), batch_size):
+        existing = collection.get(ids=ids[start:start + batch_size], include=["metadatas"])
+        for entry_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            stored_hashes[entry_id] = (metadata or {}).get("content_hash")
+
+    changed = [i for i, entry_id in enumerate(ids) if stored_hashes.get(entry_id) != metadatas[i]["content_hash"]]
+    date_added = datetime.now().isoformat()
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        batch_documents = [documents[i] for i in batch]
+        collection.upsert(
+            ids=[ids[i] for i in batch],
+            documents=batch_documents,
+            embeddings=embeddings.encode(batch_documents).tolist(),
+            metadatas=[dict(metadatas[i], date_added=date_added) for i in batch]
+        )
+
+    # Entries removed from the pack, found by paging through the collection's metadata
+    keep, removed, offset = set(ids), [], 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=batch_size * 16, offset=offset)
+        if not page["ids"]:
+            break
+        removed.extend(entry_id for entry_id, metadata in zip(page["ids"], page["metadatas"])
+                       if entry_id not in keep and (metadata or {}).get("pack", source) == source)
+        offset += len(page["ids"])
+    for start in range(0, len(removed), batch_size):
+        collection.delete(ids=removed[start:start + batch_size])
+
+    return {
+        "collection": pack["collection"],
+        "total": len(ids),
+        "new": sum(1 for i in changed if ids[i] not in stored_hashes),
+        "updated": sum(1 for i in changed if ids[i] in stored_hashes),
+        "unchanged": len(ids) - len(changed),
+        "deleted": len(removed),
+        "count": collection.count()
+    }
+
+
+def sync_knowledge_packs(client, packs_dir: str, embeddings: EmbeddingService = None,
+                         batch_size: int = 64) -> List[Dict]:
+    """Load every pack in `packs_dir` and sync it into ChromaDB"""
+    if embeddings is None:
+        embeddings = get_embedding_service()
+    return [sync_pack(client, load_pack(path), embeddings, batch_size) for path in find_packs(packs_dir)]
@@ -0,0 +1,263 @@
+import re
+import json
+import math
+import time
+import heapq
+from collections import Counter
+from typing import List, Dict
+
+import numpy as np
+
+
+# ============================================================================
+# POLISH-AWARE TOKENIZATION
+# ============================================================================
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Questions are often typed without Polish diacritics ("zl", "urlopow"), so both sides are folded
+DIACRITICS = str.maketrans("ąćęłńóśźż", "acelnoszz")
+STOPWORDS = {
+    "a", "aby", "ale", "albo", "ani", "bo", "by", "byc", "co", "czy", "dla", "do", "gdy", "gdzie", "i", "ich",
+    "ile", "jak", "jaka", "jaki", "jakie", "je", "jego", "jej", "jesli", "jest", "jestem", "juz", "ktora",
+    "ktore", "ktory", "lub", "ma", "mam", "mi", "mnie", "moge", "moj", "moja", "moje", "na", "nam", "nie",
+    "o", "od", "oraz", "po", "pod", "przez", "przy", "sa", "sie", "ta", "tak", "te", "ten", "to", "tu", "tym",
+    "u", "w", "we", "z", "za", "ze", "zeby",
+}
+# Common inflectional endings (after folding), longest first; a stem keeps at least MIN_STEM letters
+SUFFIXES = sorted([
+    "owaniami", "owaniach", "owania", "owanie", "owaniu", "osciami", "osciach", "oscia", "osci",
+    "owego", "owemu", "owych", "owymi", "owej", "owie", "owa", "owe", "owy", "owi", "ow",
+    "ami", "ach", "ego", "emu", "ymi", "imi", "ych", "ich", "iej", "om", "em", "ie", "ia", "iu", "ej",
+    "a", "e", "i", "o", "u", "y",
+], key=len, reverse=True)
+MIN_STEM = 4
+
+
+def stem(token: str) -> str:
+    """Light suffix-stripping stem, so 'urlopu', 'urlopowy' and 'urlop' share one term"""
+    if token.isdigit():
+        return token
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, diacritic-folded, stemmed terms of `text` without stopwords"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.casefold()):
+        token = token.translate(DIACRITICS)
+        if token not in STOPWORDS:
+            terms.append(stem(token))
+    return terms
+
+
+# ============================================================================
+# BM25 INDEX
+# ============================================================================
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring
+
+    Postings are dictionaries (term -> {slot: term frequency}), so documents
+    can be upserted and deleted one at a time alongside the vector index
+    without rebuilding. A query only visits the postings of its own terms,
+    which on a regulations-sized corpus takes well under a millisecond.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.lengths: List[int] = []
+        self.slots: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self._doc_terms: List[Counter] = []
+        self._free: List[int] = []
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def delete(self, ids: List[str]):
+        for doc_id in ids:
+            slot = self.slots.pop(doc_id, None)
+            if slot is None:
+                continue
+            for term in self._doc_terms[slot]:
+                postings = self.postings[term]
+                del postings[slot]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.lengths[slot]
+            self.ids[slot], self.documents[slot], self.lengths[slot] = None, None, 0
+            self._doc_terms[slot] = Counter()
+            self._free.append(slot)
+
+    def upsert(self, ids: List[str], documents: List[str]):
+        """Add documents, replacing any already stored under the same id"""
+        self.delete(ids)
+        for doc_id, document in zip(ids, documents):
+            terms = Counter(tokenize(document))
+            if self._free:
+                slot = self._free.pop()
+                self.ids[slot], self.documents[slot], self.lengths[slot] = doc_id, document, sum(terms.values())
+                self._doc_terms[slot] = terms
+            else:
+                slot = len(self.ids)
+                self.ids.append(doc_id)
+                self.documents.append(document)
+                self.lengths.append(sum(terms.values()))
+                self._doc_terms.append(terms)
+            self.slots[doc_id] = slot
+            self.total_length += self.lengths[slot]
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[slot] = frequency
+
+    def search(self, query: str, n_results: int = 2) -> List[Dict]:
+        """Best-scoring documents for `query`, each with its BM25 score and the share of query terms it contains"""
+        terms = set(tokenize(query))
+        if not terms or not self.slots:
+            return []
+        count = len(self.slots)
+        average_length = self.total_length / count
+        scores, matched = {}, Counter()
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for slot, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[slot] / average_length)
+                scores[slot] = scores.get(slot, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+                matched[slot] += 1
+        best = heapq.nlargest(n_results, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [{"id": self.ids[slot], "document": self.documents[slot], "score": score,
+                 "coverage": matched[slot] / len(terms)} for slot, score in best]
+
+    # ------------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------------
+
+    def save(self, path: str):
+        """Store the documents; postings are rebuilt on load with the current tokenizer"""
+        live = sorted(self.slots.values())
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "ids": [self.ids[slot] for slot in live],
+                       "documents": [self.documents[slot] for slot in live]}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        index.upsert(data["ids"], data["documents"])
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, page_size: int = 10_000) -> 'BM25Index':
+        """Build from all documents of a Chroma (or snapshot) collection, read page by page"""
+        index = cls()
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            index.upsert(page["ids"], page["documents"])
+            offset += len(page["ids"])
+        return index
+
+
+# ============================================================================
+# HYBRID RETRIEVAL
+# ============================================================================
+
+class HybridRetriever:
+    """Lexical first stage, with vector search only when the lexical match is not confident
+
+    mode="hybrid": a query whose top BM25 document contains every query term
+    and outscores the runner-up by `min_margin` is answered from the lexical
+    index alone, without encoding the query. Other queries are encoded and
+    the lexical and vector rankings of `candidates` documents are fused with
+    reciprocal rank fusion. mode="lexical" and mode="vector" use one side only.
+    Results are Chroma-like; "scores" are higher-is-better (BM25, fused RRF
+    score, or negated vector distance) and "retrieval" names the path taken.
+    """
+
+    MODES = ("hybrid", "lexical", "vector")
+
+    def __init__(self, lexical: BM25Index, vector, encoder, mode: str = "hybrid", candidates: int = 10,
+                 rrf_k: int = 60, min_coverage: float = 1.0, min_margin: float = 1.5):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}' (expected {', '.join(self.MODES)})")
+        self.lexical = lexical
+        self.vector = vector
+        self.encoder = encoder
+        self.mode = mode
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+
+    def confident(self, hits: List[Dict]) -> bool:
+        if not hits or hits[0]["coverage"] < self.min_coverage:
+            return False
+        return len(hits) < 2 or hits[0]["score"] >= self.min_margin * hits[1]["score"]
+
+    def query_texts(self, queries: List[str], n_results: int = 2) -> Dict:
+        """Retrieve for all queries; the queries that need vectors are encoded in one batch
+
+        "distances" holds the vector distance of each returned document (None
+        for a document only BM25 found), or None for a query answered from BM25
+        alone.
+        """
+        results = {"ids": [], "documents": [], "scores": [], "distances": [], "retrieval": [], "encode_seconds": 0.0}
+        lexical_hits = [self.lexical.search(query, max(self.candidates, n_results)) if self.mode != "vector" else []
+                        for query in queries]
+        if self.mode == "lexical":
+            vector_rows = []
+        elif self.mode == "vector":
+            vector_rows = list(range(len(queries)))
+        else:
+            vector_rows = [i for i, hits in enumerate(lexical_hits) if not self.confident(hits)]
+
+        vector_results = {}
+        if vector_rows:
+            start = time.perf_counter()
+            embeddings = np.asarray(self.encoder.encode([queries[i] for i in vector_rows]), dtype=np.float32)
+            results["encode_seconds"] = time.perf_counter() - start
+            found = self.vector.query(query_embeddings=embeddings.tolist(),
+                                      n_results=n_results if self.mode == "vector" else max(self.candidates, n_results))
+            for position, i in enumerate(vector_rows):
+                vector_results[i] = list(zip(found["ids"][position], found["documents"][position],
+                                             found["distances"][position]))
+
+        for i, hits in enumerate(lexical_hits):
+            if i not in vector_results:
+                ranked = [(hit["id"], hit["document"], hit["score"]) for hit in hits[:n_results]]
+                retrieval = "lexical"
+            elif self.mode == "vector":
+                ranked = [(doc_id, document, -distance) for doc_id, document, distance in vector_results[i]]
+                retrieval = "vector"
+            else:
+                fused, documents = Counter(), {}
+                for rank, (doc_id, document) in enumerate([(hit["id"], hit["document"]) for hit in hits]):
+                    fused[doc_id] += 1 / (self.rrf_k + rank + 1)
+                    documents[doc_id] = document
+                for rank, (doc_id, document, _) in enumerate(vector_results[i]):
+                    fused[doc_id] += 1 / (self.rrf_k + rank + 1)
+                    documents[doc_id] = document
+                ranked = [(doc_id, documents[doc_id], score) for doc_id, score in fused.most_common(n_results)]
+                retrieval = "hybrid"
+            results["ids"].append([doc_id for doc_id, _, _ in ranked])
+            results["documents"].append([document for _, document, _ in ranked])
+            results["scores"].append([score for _, _, score in ranked])
+            if i in vector_results:
+                distances = {doc_id: distance for doc_id, _, distance in vector_results[i]}
+                results["distances"].append([distances.get(doc_id) for doc_id, _, _ in ranked])
+            else:
+                results["distances"].append(None)
+            results["retrieval"].append(retrieval)
+        return results
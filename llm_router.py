@@ -0,0 +1,284 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict
+
+import requests
+from openai import OpenAI
+
+OLLAMA_URL = "http://localhost:11434"
+LM_STUDIO_URL = "http://localhost:1234"
+DEFAULT_MODEL = "gemma3:1b"
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when no backend produced a completion within the retry budget"""
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class Backend:
+    """One OpenAI-compatible server/model pair with its load and latency statistics"""
+
+    def __init__(self, name: str, base_url: str, model: str = DEFAULT_MODEL, api_key: str = "ollama",
+                 max_in_flight: int = 4, history: int = 200, keep_alive: str = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_in_flight = max_in_flight
+        # Sent with every request: Ollama keeps the model (and its prompt cache) loaded this long
+        # after the last call instead of its 5 minute default; servers without the option ignore it
+        self.keep_alive = keep_alive if keep_alive is not None else os.environ.get("LLM_KEEP_ALIVE", "30m")
+        # Retries and timeouts are handled by the router, not the client
+        self.client = OpenAI(base_url=f"{self.base_url}/v1", api_key=api_key, max_retries=0)
+        self.healthy = False
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latencies = deque(maxlen=history)
+        self.lock = threading.Lock()
+
+    def check_health(self, timeout: float = 2.0) -> bool:
+        try:
+            self.healthy = requests.get(f"{self.base_url}/v1/models", timeout=timeout).ok
+        except requests.exceptions.RequestException:
+            self.healthy = False
+        if self.healthy:
+            self.consecutive_failures = 0
+        return self.healthy
+
+    def load(self) -> float:
+        """In-flight requests relative to capacity (`max_in_flight`)"""
+        return self.in_flight / self.max_in_flight
+
+    def latency_percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "p50_seconds": round(self.latency_percentile(0.5), 3),
+            "p95_seconds": round(self.latency_percentile(0.95), 3),
+        }
+
+
+def default_backends() -> List[Backend]:
+    """Backends from LLM_BACKENDS ("url|model,url|model"), else local Ollama and LM Studio"""
+    spec = os.environ.get("LLM_BACKENDS")
+    if not spec:
+        return [Backend("ollama", OLLAMA_URL), Backend("lm_studio", LM_STUDIO_URL)]
+    backends = []
+    for i, entry in enumerate(item.strip() for item in spec.split(",") if item.strip()):
+        url, _, model = entry.partition("|")
+        backends.append(Backend(f"backend_{i}", url, model or DEFAULT_MODEL))
+    return backends
+
+
+# ============================================================================
+# ROUTER
+# ============================================================================
+
+class LLMRouter:
+    """Routes chat completions over a pool of backends
+
+    Each call goes to the healthy backend with the fewest in-flight requests
+    relative to its capacity, ties broken by median latency; a backend already
+    running `max_in_flight` requests is skipped, and when all are full the call
+    waits (up to `timeout`) for a free slot. Calls time out after `timeout` seconds and are
+    retried on another backend up to `retries` times. With `hedge_after` set, a
+    call still running after that many seconds is duplicated on a second backend
+    and the first answer wins. `chat_seconds` accumulates the time spent
+    inside `chat` calls (LLMBudget charges it against a seconds budget).
+    """
+
+    def __init__(self, backends: List[Backend] = None, timeout: float = 60.0, retries: int = 2,
+                 hedge_after: float = None, health_interval: float = 30.0, max_failures: int = 3):
+        self.backends = backends if backends is not None else default_backends()
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self._last_health_check = 0.0
+        self.chat_seconds = 0.0
+        self._lock = threading.Lock()
+        # Notified whenever a request finishes and frees a slot on its backend
+        self._capacity = threading.Condition(self._lock)
+        self._health_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(4, 2 * sum(b.max_in_flight for b in self.backends)))
+
+    def check_health(self) -> List[Backend]:
+        """Probe all backends in parallel; returns the healthy ones"""
+        list(self._pool.map(lambda backend: backend.check_health(), self.backends))
+        self._last_health_check = time.monotonic()
+        return [backend for backend in self.backends if backend.healthy]
+
+    def available(self) -> bool:
+        return bool(self._healthy())
+
+    def _healthy(self) -> List[Backend]:
+        """Healthy backends, re-probing them first when the last check is older than `health_interval`
+
+        Only one thread probes at a time; others use the current flags meanwhile
+        (except before the first check, when they wait for its result).
+        """
+        if time.monotonic() - self._last_health_check > self.health_interval:
+            if self._health_lock.acquire(blocking=not self._last_health_check):
+                try:
+                    if time.monotonic() - self._last_health_check > self.health_interval:
+                        self.check_health()
+                finally:
+                    self._health_lock.release()
+        return [backend for backend in self.backends if backend.healthy]
+
+    def _pick(self, exclude=(), strict: bool = False) -> Backend:
+        """Least-loaded healthy backend with a free slot, preferring ones not in `exclude` (only those if `strict`)
+
+        Without a free slot a strict pick returns None at once; otherwise it
+        waits up to `timeout` for a running request to finish.
+        """
+        # Health probes are HTTP calls, so they run before taking the lock
+        self._healthy()
+        deadline = time.monotonic() + self.timeout
+        with self._capacity:
+            while True:
+                healthy = [b for b in self.backends if b.healthy]
+                preferred = [b for b in healthy if b not in exclude]
+                if not (preferred if strict else healthy):
+                    return None
+                free = [b for b in preferred if b.in_flight < b.max_in_flight]
+                if not free and not strict:
+                    free = [b for b in healthy if b.in_flight < b.max_in_flight]
+                if free:
+                    backend = min(free, key=lambda b: (b.load(), b.latency_percentile(0.5)))
+                    backend.in_flight += 1
+                    return backend
+                remaining = deadline - time.monotonic()
+                if strict or remaining <= 0:
+                    return None
+                self._capacity.wait(remaining)
+
+    def _complete(self, backend: Backend, messages: List[Dict], model: str, **kwargs) -> str:
+        start = time.perf_counter()
+        try:
+            if backend.keep_alive:
+                kwargs = {**kwargs, "extra_body": {"keep_alive": backend.keep_alive, **kwargs.get("extra_body", {})}}
+            response = backend.client.with_options(timeout=self.timeout).chat.completions.create(
+                model=model or backend.model, messages=messages, **kwargs
+            )
+            content = response.choices[0].message.content
+        except Exception:
+            with backend.lock:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.max_failures:
+                    backend.healthy = False
+            raise
+        finally:
+            with backend.lock:
+                backend.in_flight -= 1
+                backend.requests += 1
+            with self._capacity:
+                self._capacity.notify_all()
+        with backend.lock:
+            backend.consecutive_failures = 0
+            backend.latencies.append(time.perf_counter() - start)
+        return content
+
+    def chat(self, messages: List[Dict], model: str = None, **kwargs) -> str:
+        """Return the completion text; raises LLMUnavailableError when every attempt fails"""
+        start = time.perf_counter()
+        try:
+            return self._chat(messages, model, **kwargs)
+        finally:
+            with self._lock:
+                self.chat_seconds += time.perf_counter() - start
+
+    def _chat(self, messages: List[Dict], model: str = None, **kwargs) -> str:
+        errors = []
+        tried = []
+        for attempt in range(self.retries + 1):
+            backend = self._pick(exclude=tried)
+            if backend is None:
+                break
+            tried.append(backend)
+            futures = {self._pool.submit(self._complete, backend, messages, model, **kwargs): backend}
+
+            if self.hedge_after is not None:
+                done, _ = wait(futures, timeout=self.hedge_after)
+                if not done:
+                    hedge = self._pick(exclude=tried, strict=True)
+                    if hedge is not None:
+                        tried.append(hedge)
+                        futures[self._pool.submit(self._complete, hedge, messages, model, **kwargs)] = hedge
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=self.timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    errors.append(f"{futures[next(iter(pending))].name}: no answer within {self.timeout}s")
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    errors.append(f"{futures[future].name}: {future.exception()}")
+            # Short jittered backoff before trying the next backend
+            time.sleep(min(0.1 * 2 ** attempt, 2.0) * random.random())
+        raise LLMUnavailableError("; ".join(errors) or "no healthy LLM backend with a free slot")
+
+    def warm(self, messages: List[Dict], model: str = None, **kwargs) -> Dict[str, float]:
+        """Send `messages` once to every healthy backend, loading the model and filling its prompt cache
+
+        Returns seconds per backend; a backend that fails is left out (it then starts cold).
+        """
+        timings = {}
+        for backend in self._healthy():
+            with self._lock:
+                backend.in_flight += 1
+            start = time.perf_counter()
+            try:
+                self._complete(backend, messages, model, **kwargs)
+            except Exception as e:
+                print(f"Warm-up of {backend.name} failed: {e}")
+                continue
+            timings[backend.name] = time.perf_counter() - start
+        return timings
+
+    def stats(self) -> Dict[str, Dict]:
+        return {backend.name: backend.stats() for backend in self.backends}
+
+
+_shared_router = None
+
+
+def get_llm_router(**kwargs) -> LLMRouter:
+    """Process-wide router, created on first use
+
+    Defaults come from the environment: LLM_BACKENDS, LLM_TIMEOUT, LLM_RETRIES,
+    LLM_HEDGE_AFTER (seconds; unset disables hedging) and LLM_KEEP_ALIVE
+    (Ollama duration such as "30m", "-1" for forever, empty to not send it).
+    """
+    global _shared_router
+    if _shared_router is None:
+        settings = {
+            "timeout": float(os.environ.get("LLM_TIMEOUT", 60)),
+            "retries": int(os.environ.get("LLM_RETRIES", 2)),
+            "hedge_after": float(os.environ["LLM_HEDGE_AFTER"]) if os.environ.get("LLM_HEDGE_AFTER") else None,
+        }
+        settings.update(kwargs)
+        _shared_router = LLMRouter(**settings)
+    return _shared_router
@@ -0,0 +1,182 @@
+import os
+import json
+from datetime import datetime
+from typing import List, Dict
+
+import pandas as pd
+
+from report_memo import ReportMemo, engine_version, account_fingerprints
+from results_store import ResultsStore
+
+LEVEL_PRIORITY = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
+
+
+class TriageStopped(RuntimeError):
+    """Raised by run_triage when its `stop` event was set before all accounts were processed"""
+
+
+# ============================================================================
+# BUDGET
+# ============================================================================
+
+class LLMBudget:
+    """Per-run LLM budget: a maximum number of calls and/or of seconds spent waiting on the LLM
+
+    Only time inside LLM calls is charged, so scoring, report building and
+    memo/results I/O do not use up the seconds budget.
+    """
+
+    def __init__(self, max_calls: int = None, max_seconds: float = None):
+        self.max_calls = max_calls
+        self.max_seconds = max_seconds
+        self.calls = 0
+        self.seconds = 0.0
+
+    def allows(self, calls: int) -> bool:
+        """Whether `calls` more LLM calls fit in the remaining budget"""
+        if self.max_calls is not None and self.calls + calls > self.max_calls:
+            return False
+        return self.max_seconds is None or self.seconds < self.max_seconds
+
+    def charge(self, calls: int, seconds: float = 0.0):
+        self.calls += calls
+        self.seconds += seconds
+
+    def remaining(self, calls: int, seconds: float) -> 'LLMBudget':
+        """What is left of this budget once `calls` calls and `seconds` in LLM calls were spent (resumed runs)"""
+        return LLMBudget(None if self.max_calls is None else max(0, self.max_calls - calls),
+                         None if self.max_seconds is None else max(0.0, self.max_seconds - seconds))
+
+    def share(self, index: int, workers: int) -> 'LLMBudget':
+        """Worker `index`'s part of this budget when `workers` processes spend it in parallel"""
+        max_calls = None
+        if self.max_calls is not None:
+            max_calls = self.max_calls // workers + (index < self.max_calls % workers)
+        return LLMBudget(max_calls, None if self.max_seconds is None else self.max_seconds / workers)
+
+
+# ============================================================================
+# PENDING QUEUE
+# ============================================================================
+
+def load_pending(path: str) -> List[str]:
+    """Accounts left pending by the previous run"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["accounts"]
+
+
+def save_pending(path: str, accounts: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"updated": datetime.now().isoformat(), "accounts": accounts}, f, indent=2)
+
+
+def prioritize(assessments: Dict[str, Dict], pending: List[str] = ()) -> List[str]:
+    """Accounts in LLM triage order
+
+    CRITICAL first, then HIGH, MEDIUM and LOW; within a level, accounts left
+    pending by the previous run go first, then by descending risk score. Input
+    order never matters.
+    """
+    pending = set(pending)
+    return sorted(assessments, key=lambda account_id: (
+        LEVEL_PRIORITY[assessments[account_id]['risk_score']['level']],
+        account_id not in pending,
+        -assessments[account_id]['risk_score']['score'],
+        str(account_id)
+    ))
+
+
+# ============================================================================
+# SCHEDULER
+# ============================================================================
+
+def run_triage(engine, transactions: pd.DataFrame, detections_by_account: Dict[str, List[Dict]],
+               budget: LLMBudget = None, min_level: str = 'MEDIUM', structured: bool = False,
+               pending_path: str = None, memo: ReportMemo = None, results: ResultsStore = None,
+               previous_pending: List[str] = None, stop=None) -> List[Dict]:
+    """Score every account deterministically, then spend the LLM budget in risk order
+
+    Each report gets an 'llm_status': 'analyzed', 'pending' (budget exhausted;
+    written to `pending_path` for the next run), 'skipped' (risk level below
+    `min_level`) or 'not_needed' (no detections). Reports are returned in input
+    account order.
+
+    With a `memo` (see report_memo.py), accounts whose fingerprint - their rows,
+    detections, peer summary and the engine configuration - is unchanged since
+    the previous run get their stored report back without being scored or sent
+    to the LLM; only new and changed accounts (and previously pending ones) are
+    recomputed and stored.
+
+    With `results` (see results_store.py) every report, reused or new, is also
+    written to the results store as soon as it is ready.
+
+    `previous_pending` overrides the accounts read from `pending_path` (sharded
+    runs read the file once and save the merged pending list themselves).
+
+    When the `stop` event (threading.Event) is set, no further account is
+    processed: the reports made so far are still stored in the memo and the
+    results store, then TriageStopped is raised.
+    """
+    budget = budget or LLMBudget()
+    # Row positions per account; an account's rows are taken only while it is being processed
+    positions = transactions.groupby('account_id', sort=False, observed=True).indices
+
+    reports, fingerprints = {}, {}
+    if memo is not None:
+        version = engine_version(engine, structured=structured, min_level=min_level)
+        fingerprints = account_fingerprints(transactions, positions, detections_by_account,
+                                            engine._peer_summary, version)
+        reports = memo.lookup(fingerprints)
+        if results is not None:
+            for report in reports.values():
+                results.add(report)
+
+    assessments = {account_id: engine.assess_account(account_id, transactions.iloc[rows],
+                                                     detections_by_account.get(account_id, []))
+                   for account_id, rows in positions.items() if account_id not in reports}
+
+    pending = []
+    if previous_pending is None:
+        previous_pending = load_pending(pending_path)
+    for account_id in prioritize(assessments, previous_pending):
+        if stop is not None and stop.is_set():
+            break
+        detections = detections_by_account.get(account_id, [])
+        level = assessments[account_id]['risk_score']['level']
+        # Structured mode needs one call per account, free-text mode one per analyzed detection
+        calls = 1 if structured else min(len(detections), 2)
+
+        if not detections:
+            status = 'not_needed'
+        elif LEVEL_PRIORITY[level] > LEVEL_PRIORITY[min_level]:
+            status = 'skipped'
+        elif budget.allows(calls):
+            status = 'analyzed'
+        else:
+            status = 'pending'
+            pending.append(account_id)
+
+        llm_seconds = engine.llm.chat_seconds
+        report = engine.generate_report(account_id, transactions.iloc[positions[account_id]], detections,
+                                        structured=structured, assessment=assessments[account_id],
+                                        run_llm=status == 'analyzed')
+        if status == 'analyzed':
+            budget.charge(calls, engine.llm.chat_seconds - llm_seconds)
+        report['llm_status'] = status
+        reports[account_id] = report
+        if memo is not None:
+            memo.store(account_id, fingerprints[account_id], report)
+        if results is not None:
+            results.add(report)
+
+    if memo is not None:
+        memo.flush()
+    if results is not None:
+        results.flush()
+    if stop is not None and stop.is_set():
+        raise TriageStopped(f"stopped after {len(reports)} of {len(positions)} accounts")
+    if pending_path:
+        save_pending(pending_path, pending)
+    return [reports[account_id] for account_id in positions]
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+
+# ============================================================================
+# SPENDING PROFILE FEATURES
+# ============================================================================
+
+INTERNATIONAL_LOCATIONS = ['International', 'Unknown']
+
+
+def _mix_shares(account_codes: np.ndarray, values: pd.Series, counts: np.ndarray, top: int) -> np.ndarray:
+    """Share of each account's transactions per top-`top` category (plus an 'other' column)"""
+    top_values = values.value_counts().index[:top]
+    category = pd.Index(top_values).get_indexer(values)
+    category = np.where(category < 0, len(top_values), category)
+    width = len(top_values) + 1
+    shares = np.bincount(account_codes * width + category, minlength=len(counts) * width)
+    return shares.reshape(len(counts), width) / counts[:, None]
+
+
+def spending_features(transactions: pd.DataFrame, top_merchants: int = 10, top_locations: int = 5):
+    """Per-account feature matrix built with group aggregates over the full dataset
+
+    Features: mean/std/90th percentile of log amounts, log transaction count,
+    log number of distinct merchants, international share, and the account's
+    merchant and location mix over the most common categories.
+    """
+    account_codes, accounts = pd.factorize(transactions['account_id'], sort=True)
+    num_accounts = len(accounts)
+    counts = np.bincount(account_codes, minlength=num_accounts).astype(np.float64)
+
+    log_amounts = np.log1p(transactions['amount'].to_numpy(dtype=np.float64).clip(min=0))
+    mean = np.bincount(account_codes, weights=log_amounts, minlength=num_accounts) / counts
+    squares = np.bincount(account_codes, weights=log_amounts ** 2, minlength=num_accounts) / counts
+    std = np.sqrt(np.maximum(squares - mean ** 2, 0))
+    q90 = pd.Series(log_amounts).groupby(account_codes).quantile(0.9).to_numpy()
+
+    merchant_codes = pd.factorize(transactions['merchant'])[0]
+    pairs = np.unique(account_codes.astype(np.int64) * (merchant_codes.max() + 1) + merchant_codes)
+    unique_merchants = np.bincount(pairs // (merchant_codes.max() + 1), minlength=num_accounts)
+    international = np.bincount(account_codes,
+                                weights=transactions['location'].isin(INTERNATIONAL_LOCATIONS).to_numpy(),
+                                minlength=num_accounts) / counts
+
+    features = np.column_stack([
+        mean, std, q90, np.log(counts), np.log1p(unique_merchants), international,
+        _mix_shares(account_codes, transactions['merchant'], counts, top_merchants),
+        _mix_shares(account_codes, transactions['location'], counts, top_locations),
+    ]).astype(np.float32)
+    return accounts, features
+
+
+# ============================================================================
+# CLUSTERING
+# ============================================================================
+
+def kmeans(features: np.ndarray, n_clusters: int, iterations: int = 20,
+           sample_size: int = 100_000, seed: int = 42):
+    """Lloyd's k-means with k-means++ seeding on a sample; returns (labels, centroids)
+
+    Distances are computed as ||x||^2 - 2x.c + ||c||^2 with one matrix product per
+    iteration, so each pass over 10^6 accounts is a handful of BLAS calls.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(features)
+    n_clusters = max(1, min(n_clusters, n))
+    sample = features[rng.choice(n, size=min(sample_size, n), replace=False)]
+
+    centroids = [sample[rng.integers(len(sample))]]
+    closest = ((sample - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, n_clusters):
+        if closest.sum() == 0:
+            break
+        centroids.append(sample[rng.choice(len(sample), p=closest / closest.sum())])
+        closest = np.minimum(closest, ((sample - centroids[-1]) ** 2).sum(axis=1))
+    centroids = np.array(centroids, dtype=np.float32)
+
+    squared_norms = (features ** 2).sum(axis=1)
+    labels = np.zeros(n, dtype=np.int32)
+    for _ in range(iterations):
+        distances = squared_norms[:, None] - 2 * features @ centroids.T + (centroids ** 2).sum(axis=1)
+        new_labels = distances.argmin(axis=1).astype(np.int32)
+        sizes = np.bincount(new_labels, minlength=len(centroids))
+        sums = np.column_stack([np.bincount(new_labels, weights=features[:, j], minlength=len(centroids))
+                                for j in range(features.shape[1])])
+        occupied = sizes > 0
+        centroids[occupied] = sums[occupied] / sizes[occupied, None]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels, centroids
+
+
+# ============================================================================
+# PEER GROUP ANALYSIS
+# ============================================================================
+
+def analyze_peer_groups(transactions: pd.DataFrame, n_clusters: int = 16,
+                        min_group_size: int = 50) -> pd.DataFrame:
+    """Cluster accounts by spending profile and measure each account's deviation from its peers
+
+    Returns a DataFrame indexed by account_id with:
+      peer_group, peer_group_size, deviation (distance to the group centroid
+      relative to the group's median distance) and amount_zscore (the account's
+      mean log amount against its group).
+    """
+    accounts, features = spending_features(transactions)
+    # Standardize so no single feature dominates the distance
+    spread = features.std(axis=0)
+    features = (features - features.mean(axis=0)) / np.where(spread > 0, spread, 1)
+
+    n_clusters = min(n_clusters, max(1, len(accounts) // min_group_size))
+    labels, centroids = kmeans(features, n_clusters)
+
+    distances = np.sqrt(((features - centroids[labels]) ** 2).sum(axis=1))
+    groups = pd.Series(distances).groupby(labels)
+    median_distance = groups.median().reindex(range(len(centroids))).to_numpy()[labels]
+    sizes = np.bincount(labels, minlength=len(centroids))
+
+    mean_amount = pd.Series(features[:, 0]).groupby(labels)
+    group_mean = mean_amount.mean().reindex(range(len(centroids))).to_numpy()[labels]
+    group_std = mean_amount.std(ddof=0).reindex(range(len(centroids))).to_numpy()[labels]
+
+    return pd.DataFrame({
+        'peer_group': labels,
+        'peer_group_size': sizes[labels],
+        'deviation': distances / np.where(median_distance > 0, median_distance, 1),
+        'amount_zscore': np.where(group_std > 0, (features[:, 0] - group_mean) / np.where(group_std > 0, group_std, 1), 0),
+    }, index=pd.Index(accounts, name='account_id'))
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import contextlib
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict
+
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 15
+# Frames of the profiler itself, left out of allocation reports
+IGNORED_FILES = (tracemalloc.__file__, cProfile.__file__, pstats.__file__, contextlib.__file__, __file__)
+
+
+# ============================================================================
+# STAGE PROFILER
+# ============================================================================
+
+class Profiler:
+    """cProfile statistics and tracemalloc snapshots per pipeline stage
+
+    Every `stage(name)` block writes to `output_dir`:
+      <name>.pstats            - cProfile data (python -m pstats, snakeviz)
+      <name>.speedscope.json   - the same call tree for https://www.speedscope.app
+      <name>.txt               - top functions by cumulative time and top
+                                 allocation sites (memory still held at the
+                                 end of the stage that it allocated)
+    plus a line in summary.jsonl with wall time and peak traced memory.
+    A stage entered inside another pauses the outer one, so each function's
+    time is counted under the innermost stage only; the outer stage's peak
+    memory includes the inner one's.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.stages: List[Dict] = []
+        self._stack = []
+        if not tracemalloc.is_tracing():
+            # A few frames per allocation so sites inside library helpers can still be traced back
+            tracemalloc.start(5)
+
+    @contextmanager
+    def stage(self, name: str):
+        if self._stack:
+            outer = self._stack[-1]
+            outer['profile'].disable()
+            outer['peak'] = max(outer['peak'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        current = {'name': name, 'profile': cProfile.Profile(), 'peak': 0,
+                   'start_memory': tracemalloc.get_traced_memory()[0],
+                   'snapshot': tracemalloc.take_snapshot(), 'start': time.perf_counter()}
+        self._stack.append(current)
+        current['profile'].enable()
+        try:
+            yield
+        finally:
+            current['profile'].disable()
+            wall = time.perf_counter() - current['start']
+            current['peak'] = max(current['peak'], tracemalloc.get_traced_memory()[1])
+            growth = tracemalloc.take_snapshot().compare_to(current['snapshot'], 'lineno')
+            self._stack.pop()
+            self._write(current, wall, growth)
+            if self._stack:
+                outer = self._stack[-1]
+                outer['peak'] = max(outer['peak'], current['peak'])
+                tracemalloc.reset_peak()
+                outer['profile'].enable()
+
+    # ------------------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------------------
+
+    def _write(self, current: Dict, wall: float, growth: List[tracemalloc.StatisticDiff]):
+        name = self._unique_name(current['name'])
+        base = os.path.join(self.output_dir, name)
+        stats = pstats.Stats(current['profile'])
+        stats.dump_stats(f"{base}.pstats")
+        with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(speedscope_profile(stats, name), f)
+
+        growth = [stat for stat in growth if stat.size_diff > 0 and stat.traceback[0].filename not in IGNORED_FILES]
+        growth.sort(key=lambda stat: stat.size_diff, reverse=True)
+        functions = top_functions(stats, TOP_FUNCTIONS)
+        summary = {
+            "stage": name,
+            "pid": os.getpid(),
+            "wall_seconds": round(wall, 4),
+            "peak_mb": round((current['peak'] - current['start_memory']) / 2**20, 2),
+            "top_functions": [f"{entry['function']} {entry['cumulative_seconds']:.3f}s" for entry in functions[:5]],
+            "top_allocations": [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} "
+                                f"{stat.size_diff / 2**20:+.2f} MB" for stat in growth[:5]],
+        }
+        self.stages.append(summary)
+
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(f"Stage {name}: {wall:.3f}s wall, peak {summary['peak_mb']:.2f} MB above stage start\n\n")
+            f.write("Top functions by cumulative time:\n")
+            f.write(f"{'calls':>10} {'total s':>9} {'cumul s':>9}  function\n")
+            for entry in functions:
+                f.write(f"{entry['calls']:>10} {entry['total_seconds']:>9.3f} {entry['cumulative_seconds']:>9.3f}  "
+                        f"{entry['function']}\n")
+            f.write("\nTop allocation sites (memory grown during the stage):\n")
+            for stat in growth[:TOP_ALLOCATIONS]:
+                f.write(f"{stat.size_diff / 2**20:>+9.2f} MB {stat.count_diff:>+9} blocks  "
+                        f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}\n")
+        with open(os.path.join(self.output_dir, "summary.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary) + "\n")
+
+    def _unique_name(self, name: str) -> str:
+        used = {stage['stage'] for stage in self.stages}
+        candidate, i = name, 1
+        while candidate in used or os.path.exists(os.path.join(self.output_dir, f"{candidate}.pstats")):
+            i += 1
+            candidate = f"{name}.{i}"
+        return candidate
+
+    def report(self, log=print):
+        """Wall time, peak memory, top functions and allocation sites of this process's stages"""
+        log(f"\nPROFILE ({self.output_dir})")
+        log("-" * 70)
+        for summary in self.stages:
+            log(f"{summary['stage']}: {summary['wall_seconds']:.3f}s, peak {summary['peak_mb']:.2f} MB")
+            for line in summary['top_functions']:
+                log(f"    {line}")
+            for line in summary['top_allocations']:
+                log(f"    alloc {line}")
+
+
+# ============================================================================
+# PSTATS HELPERS
+# ============================================================================
+
+def _label(function) -> str:
+    filename, line, name = function
+    return name if filename == "~" else f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def top_functions(stats: pstats.Stats, n: int) -> List[Dict]:
+    """Functions with the highest cumulative time"""
+    entries = [{"function": _label(function), "calls": calls, "total_seconds": total, "cumulative_seconds": cumulative}
+               for function, (_, calls, total, cumulative, _) in stats.stats.items()]
+    return sorted(entries, key=lambda entry: entry["cumulative_seconds"], reverse=True)[:n]
+
+
+def speedscope_profile(stats: pstats.Stats, name: str, max_depth: int = 64, min_fraction: float = 0.0005) -> Dict:
+    """Speedscope "evented" profile approximating the call tree recorded by cProfile
+
+    cProfile keeps caller -> callee edges with their cumulative time, not full
+    stacks, so a function called from several places has its callees split
+    between those places in proportion to time (the same approximation as
+    gprof2dot/flameprof). Recursion is cut where a function reappears on its
+    own stack, and calls shorter than `min_fraction` of the profile are left
+    out to keep the file small.
+    """
+    functions = list(stats.stats)
+    index = {function: i for i, function in enumerate(functions)}
+    children = {function: [] for function in functions}
+    for callee, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            if caller in children:
+                children[caller].append((callee, cumulative))
+    roots = [function for function, (_, _, _, _, callers) in stats.stats.items()
+             if not callers or all(caller not in stats.stats for caller in callers)]
+
+    total = sum(stats.stats[root][3] for root in roots)
+    min_duration = total * min_fraction
+    events = []
+
+    def visit(function, at: float, duration: float, stack: tuple):
+        events.append({"type": "O", "frame": index[function], "at": at})
+        cumulative = stats.stats[function][3]
+        scale = duration / cumulative if cumulative > 0 else 0.0
+        offset = at
+        if len(stack) < max_depth:
+            for callee, edge in sorted(children[function], key=lambda item: -item[1]):
+                if callee in stack or callee == function:
+                    continue
+                child = min(edge * scale, at + duration - offset)
+                if child <= min_duration:
+                    continue
+                visit(callee, offset, child, stack + (callee,))
+                offset += child
+        events.append({"type": "C", "frame": index[function], "at": at + duration})
+
+    at = 0.0
+    for root in sorted(roots, key=lambda function: -stats.stats[function][3]):
+        duration = stats.stats[root][3]
+        if duration > 0:
+            visit(root, at, duration, (root,))
+            at += duration
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": function[2], "file": function[0], "line": function[1]}
+                              for function in functions]},
+        "profiles": [{"type": "evented", "name": name, "unit": "seconds",
+                      "startValue": 0.0, "endValue": at, "events": events}],
+        "name": name,
+        "exporter": "profiling.py",
+    }
+
+
+# ============================================================================
+# PROCESS-WIDE SWITCH
+# ============================================================================
+
+_profiler = None
+
+
+def configure(output_dir: str = None) -> Profiler:
+    """Enable profiling into `output_dir` (default: the PROFILE_DIR environment variable)
+
+    Without a directory profiling stays off and `stage` is a no-op context.
+    """
+    global _profiler
+    output_dir = output_dir or os.environ.get("PROFILE_DIR")
+    if output_dir and _profiler is None:
+        _profiler = Profiler(output_dir)
+    return _profiler
+
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+
+def stage(name: str):
+    """Profile the enclosed block as pipeline stage `name` when profiling is enabled"""
+    return _profiler.stage(name) if _profiler is not None else nullcontext()
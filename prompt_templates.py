@@ -0,0 +1,115 @@
+import time
+import statistics
+from typing import List, Dict, Callable
+
+
+# ============================================================================
+# PREFIX-STABLE TEMPLATES
+# ============================================================================
+
+class PromptTemplate:
+    """Chat prompt split into a fixed prefix and a per-call tail
+
+    Local servers (Ollama, llama.cpp, LM Studio) keep the KV cache of the last
+    prompt and only prefill the tokens after the longest common prefix. The
+    instructions, answer format and any other static text therefore live in
+    the system message, which is byte-identical on every call, and everything
+    that changes per call (account data, retrieved context, the question) is
+    rendered into the final user message, most stable part first.
+    """
+
+    def __init__(self, name: str, prefix: str, tail: str):
+        self.name = name
+        self.prefix = prefix
+        self.tail = tail
+
+    def messages(self, **fields) -> List[Dict]:
+        return [{"role": "system", "content": self.prefix},
+                {"role": "user", "content": self.tail.format(**fields)}]
+
+    def warmup_messages(self) -> List[Dict]:
+        """The shared prefix alone, for loading the model and caching the prefix before a run"""
+        return [{"role": "system", "content": self.prefix}, {"role": "user", "content": "OK"}]
+
+
+def warm_up(router, templates: List[PromptTemplate]) -> Dict[str, Dict[str, float]]:
+    """Load the model on every healthy backend and prefill each template's prefix before a run"""
+    return {template.name: router.warm(template.warmup_messages(), max_tokens=1) for template in templates}
+
+
+# ============================================================================
+# PREFILL MEASUREMENT
+# ============================================================================
+
+def measure_prefill(router, prompts: List[List[Dict]], repeats: int = 1) -> Dict:
+    """Latency of one-token completions, i.e. mostly prompt prefill, over `prompts` in order
+
+    Run it once with prompts in the template layout and once with the same
+    content laid out variable-first to see what the shared prefix saves.
+    """
+    latencies = []
+    for _ in range(repeats):
+        for messages in prompts:
+            start = time.perf_counter()
+            router.chat(messages, max_tokens=1, temperature=0)
+            latencies.append(time.perf_counter() - start)
+    return {"calls": len(latencies), "total_seconds": sum(latencies),
+            "median_seconds": statistics.median(latencies) if latencies else 0.0}
+
+
+def variable_first(messages: List[Dict]) -> List[Dict]:
+    """The same prompt with the per-call tail ahead of the shared prefix (the pre-template layout)"""
+    prefix, tail = messages[0]["content"], messages[-1]["content"]
+    return [{"role": "user", "content": f"{tail}\n{prefix}"}]
+
+
+def compare_layouts(router, build: Callable[[int], List[Dict]], samples: int = 20, backend=None) -> Dict:
+    """measure_prefill for `samples` prompts from `build(i)`, variable-first vs template layout
+
+    Every call goes to one backend (`backend`, default the router's first
+    healthy one): the prompt cache is per server, so a reset or measurement
+    routed elsewhere would compare different caches.
+    """
+    from llm_router import LLMRouter, LLMUnavailableError
+
+    if backend is None:
+        healthy = router.check_health()
+        if not healthy:
+            raise LLMUnavailableError("no healthy LLM backend")
+        backend = healthy[0]
+    pinned = LLMRouter([backend], timeout=router.timeout, retries=router.retries)
+    prompts = [build(i) for i in range(samples)]
+    # Each layout starts from a cache that holds neither
+    pinned.chat([{"role": "user", "content": "reset"}], max_tokens=1)
+    legacy = measure_prefill(pinned, [variable_first(messages) for messages in prompts])
+    pinned.chat([{"role": "user", "content": "reset"}], max_tokens=1)
+    templated = measure_prefill(pinned, prompts)
+    return {"backend": backend.name, "variable_first": legacy, "template": templated,
+            "saved_seconds": legacy["total_seconds"] - templated["total_seconds"]}
+
+
+if __name__ == "__main__":
+    import argparse
+    from llm_router import get_llm_router
+    from structured_analysis import ACCOUNT_ANALYSIS, account_prompt_fields
+
+    parser = argparse.ArgumentParser(description="Measure prompt prefill time saved by the prefix-stable layout")
+    parser.add_argument("--samples", type=int, default=20, help="Number of synthetic account prompts")
+    args = parser.parse_args()
+
+    router = get_llm_router()
+    if not router.check_health():
+        raise SystemExit("No LLM backend available")
+
+    def build(i):
+        stats = {'total_transactions': 40 + i, 'total_amount': 1000.0 * i, 'average_amount': 25.0 + i,
+                 'max_amount': 900.0 + i, 'amount_outliers': [], 'merchant_analysis': {'unique_merchants': 5 + i},
+                 'geographic_analysis': {'unique_locations': 2}, 'peer_analysis': None}
+        detections = [{'pattern': 'Structuring (Smurfing)', 'severity': 'HIGH', 'count': 3 + i}]
+        return ACCOUNT_ANALYSIS.messages(**account_prompt_fields(f"ACC{i:05d}", detections, stats, [], []))
+
+    result = compare_layouts(router, build, args.samples)
+    for layout in ("variable_first", "template"):
+        print(f"{layout:<15} total {result[layout]['total_seconds']:.3f}s  "
+              f"median {result[layout]['median_seconds'] * 1000:.1f} ms")
+    print(f"Prefill time saved: {result['saved_seconds']:.3f}s over {args.samples} prompts on {result['backend']}")
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+
+# ============================================================================
+# MERGEABLE QUANTILE SKETCHES
+# ============================================================================
+
+# Magnitudes below this share the zero bucket
+MIN_INDEXABLE = 1e-6
+
+
+class QuantileSketches:
+    """Mergeable per-key quantile sketches with a relative error bound
+
+    Log-bucketed sketches (as in DDSketch): a value x > 0 is counted in bucket
+    ceil(log_gamma(x)) with gamma = (1 + alpha) / (1 - alpha), negative values
+    in mirrored buckets, and every quantile is answered within a relative error
+    of `alpha` (1% by default). Memory depends on the spread of values, not on
+    how many were added: amounts from 0.01 to 1,000,000 need at most ~920
+    buckets per key. Sketches are updated chunk by chunk and merged by adding
+    bucket counts, so results do not depend on chunking or merge order.
+
+    Like ProfileStore, the sketches of all keys are flat NumPy arrays:
+      - keys:           sorted key vocabulary (e.g. account ids)
+      - entry_key/entry_bucket/entry_count: non-empty buckets sorted by (key, bucket)
+      - minimum/maximum: exact extremes per key (quantiles are clipped to them)
+    """
+
+    ARRAYS = ('keys', 'entry_key', 'entry_bucket', 'entry_count', 'minimum', 'maximum', 'alpha', 'cutoff')
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @property
+    def gamma(self) -> float:
+        return (1 + float(self.alpha)) / (1 - float(self.alpha))
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ------------------------------------------------------------------------
+    # Building and merging
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def _buckets(values: np.ndarray, gamma: float) -> np.ndarray:
+        """Signed bucket of every value; 0 is the zero bucket and bucket order follows value order"""
+        magnitude = np.abs(values)
+        offset = np.ceil(np.log(MIN_INDEXABLE) / np.log(gamma)) - 1
+        index = np.ceil(np.log(np.maximum(magnitude, MIN_INDEXABLE)) / np.log(gamma)) - offset
+        return np.where(magnitude < MIN_INDEXABLE, 0, np.sign(values) * index).astype(np.int32)
+
+    def _bucket_values(self, buckets: np.ndarray) -> np.ndarray:
+        """Value reported for a bucket: within `alpha` of everything counted in it"""
+        offset = np.ceil(np.log(MIN_INDEXABLE) / np.log(self.gamma)) - 1
+        magnitude = 2 * self.gamma ** (np.abs(buckets) + offset) / (self.gamma + 1)
+        return np.where(buckets == 0, 0.0, np.sign(buckets) * magnitude)
+
+    @classmethod
+    def _from_entries(cls, keys, entry_key, entry_bucket, entry_count, minimum, maximum, alpha, cutoff):
+        """Sum counts of duplicate (key, bucket) entries and sort them"""
+        # One sortable int64 per entry: key in the high 32 bits, offset bucket in the low 32
+        combined = entry_key.astype(np.int64) * 2 ** 32 + (entry_bucket.astype(np.int64) + 2 ** 31)
+        order = np.argsort(combined)
+        combined, entry_count = combined[order], entry_count[order]
+        starts = np.flatnonzero(np.r_[True, combined[1:] != combined[:-1]]) if len(order) else order
+        entry_key, entry_bucket = np.divmod(combined[starts], 2 ** 32)
+        return cls(
+            keys=keys,
+            entry_key=entry_key,
+            entry_bucket=(entry_bucket - 2 ** 31).astype(np.int32),
+            entry_count=np.add.reduceat(entry_count, starts).astype(np.int64) if len(order) else entry_count,
+            minimum=minimum,
+            maximum=maximum,
+            alpha=np.array(alpha, dtype=np.float64),
+            cutoff=np.array(cutoff if cutoff is not None else 'NaT', dtype='datetime64[s]'),
+        )
+
+    @classmethod
+    def build(cls, keys, values, alpha: float = 0.01, cutoff=None) -> 'QuantileSketches':
+        """Sketch `values` grouped by `keys` (e.g. amounts by account id)
+
+        `cutoff` records the time up to which the data was summarized, so later
+        runs can add only newer rows (see update).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        # Categorical keys (e.g. the account_id column) are factorized from their codes
+        codes, vocabulary = pd.factorize(pd.Series(keys).iloc[valid], sort=True)
+        values = values[valid]
+
+        minimum = np.full(len(vocabulary), np.inf)
+        maximum = np.full(len(vocabulary), -np.inf)
+        np.minimum.at(minimum, codes, values)
+        np.maximum.at(maximum, codes, values)
+        gamma = (1 + alpha) / (1 - alpha)
+        return cls._from_entries(np.asarray(vocabulary).astype(str), codes.astype(np.int64),
+                                 cls._buckets(values, gamma), np.ones(len(values), dtype=np.int64),
+                                 minimum, maximum, alpha, cutoff)
+
+    def merge(self, other: 'QuantileSketches') -> 'QuantileSketches':
+        """Sketch of both inputs combined (e.g. two worker shards or history plus a new chunk)"""
+        if float(self.alpha) != float(other.alpha):
+            raise ValueError(f"Cannot merge sketches with different accuracy ({float(self.alpha)} "
+                             f"and {float(other.alpha)})")
+        keys = np.union1d(self.keys, other.keys).astype(str)
+        remap_self = np.searchsorted(keys, self.keys)
+        remap_other = np.searchsorted(keys, other.keys)
+
+        minimum = np.full(len(keys), np.inf)
+        maximum = np.full(len(keys), -np.inf)
+        for remap, sketch in ((remap_self, self), (remap_other, other)):
+            np.minimum.at(minimum, remap, sketch.minimum)
+            np.maximum.at(maximum, remap, sketch.maximum)
+
+        cutoff = max(self.cutoff, other.cutoff) if not (np.isnat(self.cutoff) or np.isnat(other.cutoff)) else None
+        return self._from_entries(
+            keys,
+            np.concatenate([remap_self[self.entry_key], remap_other[other.entry_key]]),
+            np.concatenate([self.entry_bucket, other.entry_bucket]),
+            np.concatenate([self.entry_count, other.entry_count]),
+            minimum, maximum, float(self.alpha), cutoff
+        )
+
+    def update(self, keys, values) -> 'QuantileSketches':
+        """Sketches with a new chunk of values added"""
+        chunk = self.build(keys, values, alpha=float(self.alpha))
+        chunk.cutoff = self.cutoff
+        return self.merge(chunk)
+
+    def overall(self) -> 'QuantileSketches':
+        """Single sketch over all keys (key '*'), e.g. for global thresholds"""
+        return self._from_entries(
+            np.array(['*']), np.zeros(len(self.entry_key), dtype=np.int64), self.entry_bucket, self.entry_count,
+            np.array([self.minimum.min(initial=np.inf)]), np.array([self.maximum.max(initial=-np.inf)]),
+            float(self.alpha), None if np.isnat(self.cutoff) else self.cutoff
+        )
+
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+
+    def counts(self) -> np.ndarray:
+        """Number of values summarized per key"""
+        return np.bincount(self.entry_key, weights=self.entry_count, minlength=len(self.keys)).astype(np.int64)
+
+    def quantile(self, q: float, keys=None) -> np.ndarray:
+        """q-quantile of every key (or of `keys`, NaN for unknown ones), vectorized over keys
+
+        Same definition as pandas/NumPy's default (linear): the values of ranks
+        floor(h) and floor(h) + 1, h = q * (n - 1), interpolated by the
+        fractional part of h. Each of the two values is within relative error
+        `alpha` (exact for the smallest and largest rank), so the result is too.
+        """
+        totals = self.counts()
+        if len(self.entry_bucket):
+            # Entries are sorted by key, so the running count is monotonic across all keys
+            cumulative = np.cumsum(self.entry_count)
+            before = np.r_[0, np.cumsum(totals)[:-1]]
+            rank = q * np.maximum(totals - 1, 0)
+            low = np.floor(rank)
+            high = np.minimum(low + 1, np.maximum(totals - 1, 0))
+
+            def value(ranks):
+                positions = np.searchsorted(cumulative, before + ranks, side='right')
+                values = self._bucket_values(self.entry_bucket[np.minimum(positions, len(cumulative) - 1)])
+                values = np.clip(values, self.minimum, self.maximum)
+                return np.where(ranks == 0, self.minimum, np.where(ranks == totals - 1, self.maximum, values))
+
+            result = value(low) + (rank - low) * (value(high) - value(low))
+            result = np.where(totals > 0, result, np.nan)
+        else:
+            result = np.full(len(self.keys), np.nan)
+
+        if keys is None:
+            return result
+        keys = np.asarray(keys, dtype=str)
+        if len(self.keys) == 0:
+            return np.full(len(keys), np.nan)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, result[pos], np.nan)
+
+    # ------------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------------
+
+    def save(self, path: str):
+        """Write all arrays to a single uncompressed .npz file"""
+        np.savez(path, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> 'QuantileSketches':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
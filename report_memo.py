@@ -0,0 +1,123 @@
+import json
+import sqlite3
+import hashlib
+from typing import List, Dict
+
+import numpy as np
+import pandas as pd
+
+from fraud_detectors import RowRule
+
+# Bump when report generation changes in a way that invalidates stored reports
+REPORT_VERSION = 1
+
+
+# ============================================================================
+# FINGERPRINTS
+# ============================================================================
+
+def _collection_version(collection) -> str:
+    """Hash of a knowledge base collection's ids and entry content hashes (see knowledge_loader.py)"""
+    data = collection.get(include=["documents", "metadatas"])
+    entries = sorted((entry_id, (metadata or {}).get("content_hash") or
+                      hashlib.sha256((document or "").encode("utf-8")).hexdigest())
+                     for entry_id, document, metadata in zip(data["ids"], data["documents"], data["metadatas"]))
+    return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+
+
+def engine_version(engine, **settings) -> str:
+    """Hash of everything besides an account's own data that shapes its report
+
+    Covers the report code version, detector rules, embedding model, LLM
+    backends/models (and whether any is up), knowledge base content, baseline profile and sketch cutoffs, historical cases and any
+    run settings passed as keyword arguments (e.g. structured, min_level).
+    """
+    config = {
+        "report_version": REPORT_VERSION,
+        "detectors": [(rule.pattern, rule.severity, rule.min_count) if isinstance(rule, RowRule) else rule.name
+                      for rule in engine.detectors],
+        "embedding_model": engine.embeddings.model_name,
+        "llm": [(backend.base_url, backend.model) for backend in engine.llm.backends],
+        # Reports written with the mock analysis (no backend up) are not reused once a backend is available
+        "llm_available": engine.llm.available(),
+        "fraud_patterns": _collection_version(engine.fraud_patterns_collection),
+        "financial_documents": _collection_version(engine.financial_docs_collection),
+        "profiles_cutoff": str(engine.profiles.cutoff) if engine.profiles is not None else None,
+        "sketches_cutoff": str(engine.sketches.cutoff) if engine.sketches is not None else None,
+        "cases": (hashlib.sha256(engine.cases.case_ids.tobytes() + engine.cases.resolutions.tobytes()).hexdigest()
+                  if engine.cases is not None else None),
+        "settings": settings,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def account_fingerprints(transactions: pd.DataFrame, positions: Dict[str, np.ndarray],
+                         detections_by_account: Dict[str, List[Dict]], peer_summary, version: str) -> Dict[str, str]:
+    """Content fingerprint of every account's report inputs
+
+    Rows are hashed once for the whole frame (pd.util.hash_pandas_object) and
+    sorted within each account, so row order does not matter. The account's
+    detections and peer summary are included because they depend on other
+    accounts too (transaction graph, peer groups).
+    """
+    columns = [column for column in transactions.columns if column != 'timestamp']
+    row_hashes = pd.util.hash_pandas_object(transactions[columns], index=False).to_numpy()
+
+    fingerprints = {}
+    for account_id, rows in positions.items():
+        digest = hashlib.blake2b(np.sort(row_hashes[rows]).tobytes(), digest_size=16)
+        digest.update(json.dumps([detections_by_account.get(account_id, []), peer_summary(account_id)],
+                                 sort_keys=True, default=str).encode("utf-8"))
+        digest.update(version.encode("utf-8"))
+        fingerprints[account_id] = digest.hexdigest()
+    return fingerprints
+
+
+# ============================================================================
+# REPORT STORE
+# ============================================================================
+
+class ReportMemo:
+    """Previous reports keyed by account id, valid while the account's fingerprint is unchanged"""
+
+    def __init__(self, path: str, batch_size: int = 500):
+        # Sharded runs share one store between worker processes, so wait for their writes
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS reports (account_id TEXT PRIMARY KEY, fingerprint TEXT, report TEXT)"
+        )
+        self.batch_size = batch_size
+        self.hits = 0
+        self._pending = []
+
+    def lookup(self, fingerprints: Dict[str, str]) -> Dict[str, Dict]:
+        """Stored reports whose fingerprint matches; pending reports are never reused"""
+        found = {}
+        accounts = list(fingerprints)
+        for start in range(0, len(accounts), self.batch_size):
+            batch = accounts[start:start + self.batch_size]
+            rows = self.connection.execute(
+                f"SELECT account_id, fingerprint, report FROM reports WHERE account_id IN ({','.join('?' * len(batch))})",
+                [str(account_id) for account_id in batch]
+            )
+            for account_id, fingerprint, report in rows:
+                if fingerprint == fingerprints.get(account_id):
+                    report = json.loads(report)
+                    if report.get('llm_status') != 'pending':
+                        found[account_id] = report
+        self.hits += len(found)
+        return found
+
+    def store(self, account_id: str, fingerprint: str, report: Dict):
+        self._pending.append((str(account_id), fingerprint, json.dumps(report, default=str)))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO reports VALUES (?, ?, ?)", self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
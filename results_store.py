@@ -0,0 +1,192 @@
+import json
+import uuid
+import sqlite3
+import argparse
+from datetime import datetime
+from typing import Dict, Iterator
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    run_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    generated TEXT NOT NULL,
+    risk_level TEXT,
+    risk_score REAL,
+    llm_status TEXT,
+    report TEXT NOT NULL,
+    report_timestamp TEXT,
+    PRIMARY KEY (run_id, account_id)
+);
+CREATE INDEX IF NOT EXISTS reports_account ON reports (account_id, generated);
+CREATE INDEX IF NOT EXISTS reports_level ON reports (risk_level, generated);
+CREATE INDEX IF NOT EXISTS reports_generated ON reports (generated);
+CREATE TABLE IF NOT EXISTS report_patterns (
+    run_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    pattern TEXT NOT NULL,
+    severity TEXT,
+    count INTEGER
+);
+CREATE INDEX IF NOT EXISTS report_patterns_pattern ON report_patterns (pattern, run_id, account_id);
+CREATE INDEX IF NOT EXISTS report_patterns_report ON report_patterns (run_id, account_id);
+"""
+
+
+# ============================================================================
+# RESULTS STORE
+# ============================================================================
+
+class ResultsStore:
+    """Analysis reports in an indexed SQLite file, written in batches during a run
+
+    Every report is stored whole (JSON) next to the columns analysts filter on:
+    account, risk level, risk score, LLM status, generation time and, in a
+    side table, each detected pattern. Queries read only matching rows.
+
+    `generated` is when this run wrote the report; a report reused from the
+    memo keeps its original 'timestamp' (stored as `report_timestamp`), so
+    date filters and `latest` follow the run that stored it.
+    """
+
+    def __init__(self, path: str, run_id: str = None, batch_size: int = 200):
+        self.path = path
+        # Microsecond timestamp (runs still sort by start time) plus a random suffix so concurrent runs never share an id
+        self.run_id = run_id or f"{datetime.now().isoformat(timespec='microseconds')}-{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        # Sharded runs write from several worker processes, so wait for each other's batches
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(reports)")}
+        if 'report_timestamp' not in columns:
+            # Stores created before the column existed
+            self.connection.execute("ALTER TABLE reports ADD COLUMN report_timestamp TEXT")
+        self._pending = []
+
+    # ------------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------------
+
+    def add(self, report: Dict):
+        """Queue a report; it is written with the next full batch or on flush"""
+        self._pending.append(report)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        rows, patterns = [], []
+        written = datetime.now().isoformat(timespec='microseconds')
+        for report in self._pending:
+            account_id = str(report['account_id'])
+            risk = report.get('risk_score') or {}
+            timestamp = report.get('timestamp')
+            rows.append((self.run_id, account_id, written, risk.get('level'), risk.get('score'),
+                         report.get('llm_status'), json.dumps(report, default=str),
+                         None if timestamp is None else str(timestamp)))
+            patterns.extend((self.run_id, account_id, d['pattern'], d.get('severity'), d.get('count'))
+                            for d in report.get('detections') or [])
+        with self.connection:
+            # A report written again in the same run replaces the previous one
+            self.connection.executemany("DELETE FROM report_patterns WHERE run_id = ? AND account_id = ?",
+                                        [(run_id, account_id) for run_id, account_id, *_ in rows])
+            self.connection.executemany("INSERT OR REPLACE INTO reports (run_id, account_id, generated, risk_level, "
+                                        "risk_score, llm_status, report, report_timestamp) "
+                                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.executemany("INSERT INTO report_patterns VALUES (?, ?, ?, ?, ?)", patterns)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+
+    def query(self, account_id: str = None, risk_level: str = None, pattern: str = None,
+              since: str = None, until: str = None, run_id: str = None, latest: bool = False,
+              limit: int = None) -> Iterator[Dict]:
+        """Reports matching all given filters, newest first, streamed row by row
+
+        `since`/`until` are ISO dates or timestamps compared with the time the
+        report was stored (`until` is exclusive); `latest` keeps only the most
+        recently stored report of each account.
+        """
+        conditions, params = [], []
+        for column, value in (('r.account_id', account_id), ('r.risk_level', risk_level), ('r.run_id', run_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(str(value))
+        if since is not None:
+            conditions.append("r.generated >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("r.generated < ?")
+            params.append(until)
+        if pattern is not None:
+            conditions.append("EXISTS (SELECT 1 FROM report_patterns p WHERE p.run_id = r.run_id "
+                              "AND p.account_id = r.account_id AND p.pattern = ?)")
+            params.append(pattern)
+        if latest:
+            conditions.append("r.run_id = (SELECT l.run_id FROM reports l WHERE l.account_id = r.account_id "
+                              "ORDER BY l.generated DESC, l.run_id DESC LIMIT 1)")
+
+        sql = "SELECT r.report FROM reports r"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY r.generated DESC, r.account_id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        for (report,) in self.connection.execute(sql, params):
+            yield json.loads(report)
+
+    def export(self, path: str, **filters) -> int:
+        """Write matching reports to a .json array or a .jsonl file, streaming; returns the count"""
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                for report in self.query(**filters):
+                    f.write(json.dumps(report, default=str) + "\n")
+                    count += 1
+            else:
+                f.write("[")
+                for report in self.query(**filters):
+                    f.write((",\n" if count else "\n") + json.dumps(report, indent=2, default=str))
+                    count += 1
+                f.write("\n]\n")
+        return count
+
+
+# ============================================================================
+# COMMAND LINE QUERIES
+# ============================================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query and export stored fraud analysis reports")
+    parser.add_argument("--db", default="analysis_results.sqlite", help="Results store file")
+    parser.add_argument("--account", help="Account id")
+    parser.add_argument("--level", choices=["CRITICAL", "HIGH", "MEDIUM", "LOW"], help="Risk level")
+    parser.add_argument("--pattern", help="Detected pattern name, e.g. 'Structuring (Smurfing)'")
+    parser.add_argument("--since", help="Stored at or after this ISO date/time")
+    parser.add_argument("--until", help="Stored before this ISO date/time")
+    parser.add_argument("--run", help="Only reports of this run id")
+    parser.add_argument("--latest", action="store_true", help="Only the newest report of each account")
+    parser.add_argument("--limit", type=int, help="Maximum number of reports")
+    parser.add_argument("--export", metavar="PATH", help="Write matching reports to a .json or .jsonl file")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    filters = dict(account_id=args.account, risk_level=args.level, pattern=args.pattern, since=args.since,
+                   until=args.until, run_id=args.run, latest=args.latest, limit=args.limit)
+    if args.export:
+        print(f"✓ Exported {store.export(args.export, **filters)} reports to {args.export}")
+    else:
+        for report in store.query(**filters):
+            risk = report.get('risk_score') or {}
+            patterns = ', '.join(d['pattern'] for d in report.get('detections') or []) or '-'
+            print(f"{report.get('timestamp', '')[:19]}  {report['account_id']:<12} {risk.get('level', ''):<8} "
+                  f"{risk.get('score', 0):5.1f}  {patterns}")
+    store.connection.close()
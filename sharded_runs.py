@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# ============================================================================
+# RUN DIRECTORY LAYOUT
+# ============================================================================
+#
+#   manifest.json        account shards and run settings, written once
+#   progress.jsonl       append-only log of completed shards (fsynced)
+#   llm_spend.jsonl      append-only log of LLM calls/seconds spent per shard attempt
+#   claims/NNNNN.json    shard currently being processed (worker, pid, host, lease expiry)
+#   shards/NNNNN.json    reports of a completed shard (written atomically)
+#   queue.lock           held while a worker claims a shard
+#
+# A shard counts as done once its output file exists and its completion is in
+# the progress log, so an interrupted run resumes from the first shard that was
+# not finished. A claim is a lease that its worker renews while it works on the
+# shard; an expired lease (worker crashed or hung, on any host) is taken over,
+# and so is a claim of a process on this host that no longer exists. A worker
+# that lost its lease stops and its shard is completed by the new owner only.
+
+def _write_json(path: str, data):
+    """Write JSON atomically: the file either has the complete content or does not exist"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class ShardQueue:
+    """Durable work queue of account shards shared by worker processes
+
+    Workers may run on several hosts sharing the run directory; `lease_seconds`
+    is how long a claim stays valid without being renewed (see `lease`).
+    """
+
+    def __init__(self, run_dir: str, lease_seconds: float = 300.0):
+        self.run_dir = run_dir
+        self.lease_seconds = lease_seconds
+        with open(os.path.join(run_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.shards: List[List[str]] = self.manifest["shards"]
+        os.makedirs(os.path.join(run_dir, "claims"), exist_ok=True)
+        os.makedirs(os.path.join(run_dir, "shards"), exist_ok=True)
+
+    @classmethod
+    def create(cls, run_dir: str, accounts: List[str], shard_size: int = 100, settings: Dict = None) -> 'ShardQueue':
+        """Open the run in `run_dir`, creating its manifest on first use
+
+        Accounts are split into shards of `shard_size` in the given order. An
+        existing run is resumed only for the same accounts and settings; a
+        different dataset or configuration needs a fresh run directory.
+        """
+        accounts = [str(account_id) for account_id in accounts]
+        settings = settings or {}
+        digest = hashlib.sha256(json.dumps([accounts, settings], sort_keys=True, default=str).encode("utf-8"))
+        manifest_path = os.path.join(run_dir, "manifest.json")
+
+        if os.path.exists(manifest_path):
+            queue = cls(run_dir)
+            if queue.manifest["digest"] != digest.hexdigest():
+                raise ValueError(f"{run_dir} holds a run over different accounts or settings; "
+                                 f"use a new run directory")
+            return queue
+
+        os.makedirs(run_dir, exist_ok=True)
+        _write_json(manifest_path, {
+            "created": datetime.now().isoformat(),
+            "digest": digest.hexdigest(),
+            "settings": settings,
+            "shards": [accounts[start:start + shard_size] for start in range(0, len(accounts), shard_size)],
+        })
+        return cls(run_dir)
+
+    def _path(self, kind: str, shard: int) -> str:
+        return os.path.join(self.run_dir, kind, f"{shard:05d}.json")
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.run_dir, "queue.lock"), "a+") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # ------------------------------------------------------------------------
+    # Progress
+    # ------------------------------------------------------------------------
+
+    def completed(self) -> set:
+        """Shards recorded in the progress log whose output is on disk"""
+        log_path = os.path.join(self.run_dir, "progress.jsonl")
+        if not os.path.exists(log_path):
+            return set()
+        done = set()
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # line cut short by a crash
+                if os.path.exists(self._path("shards", entry["shard"])):
+                    done.add(entry["shard"])
+        return done
+
+    def remaining(self) -> List[int]:
+        done = self.completed()
+        return [shard for shard in range(len(self.shards)) if shard not in done]
+
+    def _read_claim(self, shard: int) -> Dict:
+        try:
+            with open(self._path("claims", shard), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _claim_is_live(self, shard: int) -> bool:
+        claim = self._read_claim(shard)
+        if claim is None or claim.get("expires", 0) <= time.time():
+            return False
+        # A dead process on this host cannot renew its lease, so there is no need to wait for it to expire
+        return claim["host"] != socket.gethostname() or _pid_alive(claim["pid"])
+
+    def _holds(self, shard: int, worker: str) -> bool:
+        """Whether this process's `worker` still holds the claim on `shard` (call with the lock held)"""
+        claim = self._read_claim(shard)
+        return claim is not None and (claim["worker"], claim["pid"], claim["host"]) == (worker, os.getpid(),
+                                                                                        socket.gethostname())
+
+    def _write_claim(self, shard: int, worker: str):
+        _write_json(self._path("claims", shard), {
+            "worker": worker,
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "claimed": datetime.now().isoformat(),
+            "expires": time.time() + self.lease_seconds,
+        })
+
+    def claim(self, worker: str) -> int:
+        """Claim the next unfinished shard nobody holds a valid lease on; None when there is none"""
+        with self._locked():
+            for shard in self.remaining():
+                if not self._claim_is_live(shard):
+                    self._write_claim(shard, worker)
+                    return shard
+        return None
+
+    def renew(self, shard: int, worker: str) -> bool:
+        """Extend this worker's lease on `shard`; False if the claim was lost to another worker"""
+        with self._locked():
+            if not self._holds(shard, worker):
+                return False
+            self._write_claim(shard, worker)
+            return True
+
+    @contextmanager
+    def lease(self, shard: int, worker: str):
+        """Renew the claim on `shard` in the background (every third of the lease) while the block runs
+
+        Yields a threading.Event that is set once a renewal fails, i.e. another
+        worker took the shard over; the block should then stop working on it.
+        """
+        stop, lost = threading.Event(), threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.renew(shard, worker):
+                    print(f"[{worker}] lost the lease on shard {shard}")
+                    lost.set()
+                    return
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, shard: int, reports: List[Dict], worker: str) -> bool:
+        """Store a shard's reports and record it in the progress log; False (nothing written) if the claim was lost"""
+        with self._locked():
+            if not self._holds(shard, worker):
+                return False
+            _write_json(self._path("shards", shard), reports)
+            self._append("progress.jsonl", {"shard": shard, "worker": worker, "reports": len(reports),
+                                            "completed": datetime.now().isoformat()})
+            os.remove(self._path("claims", shard))
+            return True
+
+    def _append(self, name: str, entry: Dict):
+        with open(os.path.join(self.run_dir, name), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ------------------------------------------------------------------------
+    # LLM spend
+    # ------------------------------------------------------------------------
+
+    def record_spend(self, shard: int, worker: str, calls: int, seconds: float):
+        """Log the LLM calls and seconds one attempt at `shard` spent, finished or not"""
+        if calls or seconds:
+            self._append("llm_spend.jsonl", {"shard": shard, "worker": worker, "calls": calls,
+                                             "seconds": round(seconds, 3)})
+
+    def spent(self):
+        """(calls, seconds) spent on LLM calls by all earlier attempts of this run"""
+        log_path = os.path.join(self.run_dir, "llm_spend.jsonl")
+        calls, seconds = 0, 0.0
+        if os.path.exists(log_path):
+            with open(log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # line cut short by a crash
+                    calls += entry["calls"]
+                    seconds += entry["seconds"]
+        return calls, seconds
+
+    def merge(self) -> List[Dict]:
+        """Reports of all shards in shard order (raises if the run is not finished)"""
+        remaining = self.remaining()
+        if remaining:
+            raise RuntimeError(f"{len(remaining)} of {len(self.shards)} shards are not finished yet")
+        reports = []
+        for shard in range(len(self.shards)):
+            with open(self._path("shards", shard), "r", encoding="utf-8") as f:
+                reports.extend(json.load(f))
+        return reports
@@ -0,0 +1,158 @@
+import re
+import json
+from typing import List, Dict
+
+from case_store import summarize_cases
+from prompt_templates import PromptTemplate
+
+RISK_LEVELS = ("CRITICAL", "HIGH", "MEDIUM", "LOW")
+LIST_FIELDS = ("risk_indicators", "regulations", "immediate_actions")
+SNIPPET_CHARS = 600
+
+
+class AnalysisParseError(ValueError):
+    """Raised when an LLM answer is not a valid structured account analysis"""
+
+
+# ============================================================================
+# PROMPT
+# ============================================================================
+
+def _stats_summary(stats: Dict) -> Dict:
+    summary = {
+        "total_transactions": stats['total_transactions'],
+        "total_amount": round(stats['total_amount'], 2),
+        "average_amount": round(stats['average_amount'], 2),
+        "max_amount": round(stats['max_amount'], 2),
+        "amount_outliers": len(stats['amount_outliers']),
+        "unique_merchants": stats['merchant_analysis']['unique_merchants'],
+        "unique_locations": stats['geographic_analysis']['unique_locations'],
+    }
+    if stats.get('peer_analysis'):
+        summary["peer_group_deviation"] = round(stats['peer_analysis']['deviation'], 2)
+    return summary
+
+
+ANALYSIS_EXAMPLE = {
+    "analyses": [{
+        "pattern": "<pattern name exactly as listed>",
+        "risk_level": "|".join(RISK_LEVELS),
+        "risk_indicators": ["..."],
+        "regulations": ["..."],
+        "immediate_actions": ["..."],
+        "investigation_approach": "..."
+    }]
+}
+
+# Instructions and answer format are identical for every account, so they form the cached prompt prefix;
+# knowledge-base context (shared by accounts with the same patterns) comes next and the account itself last
+ACCOUNT_ANALYSIS = PromptTemplate("account_analysis", f"""
+You analyze detected financial fraud patterns for one account at a time.
+
+Each request lists related fraud patterns from the knowledge base, relevant regulations,
+the account's statistics and its detected patterns. Based on this context and your knowledge
+of financial fraud detection and AML regulations, return ONLY a JSON object (no markdown,
+no commentary) with one entry per detected pattern, in the same order, using this structure:
+{json.dumps(ANALYSIS_EXAMPLE, indent=2)}
+""", """
+Related fraud patterns from the knowledge base:
+{pattern_text}
+
+Relevant regulations:
+{compliance_text}
+
+Account: {account_id}
+Account statistics: {stats}
+
+Detected patterns:
+{detection_lines}
+""")
+
+
+def account_prompt_fields(account_id: str, detections: List[Dict], stats: Dict,
+                          patterns: List[Dict], compliance_docs: List[Dict],
+                          similar_cases: List[List[Dict]] = None) -> Dict:
+    """Template fields for ACCOUNT_ANALYSIS
+
+    Knowledge-base snippets are sorted so accounts with the same patterns
+    render the same context text. `similar_cases` (per detection, see
+    case_store.py) adds how comparable past cases were resolved to each
+    detection line.
+    """
+    detection_lines = "\n".join(
+        f"{i + 1}. {d['pattern']} (severity {d['severity']}, occurrences {d['count']})"
+        + (f" - {summarize_cases(similar_cases[i])}" if similar_cases is not None else "")
+        for i, d in enumerate(detections)
+    )
+    pattern_text = "\n---\n".join(sorted(p['pattern'].strip()[:SNIPPET_CHARS] for p in patterns)) or "none"
+    compliance_text = "\n---\n".join(sorted(
+        f"{d.get('metadata', {}).get('title', 'Unknown')}: {d['content'].strip()[:SNIPPET_CHARS]}"
+        for d in compliance_docs
+    )) or "none"
+    return {"pattern_text": pattern_text, "compliance_text": compliance_text, "account_id": account_id,
+            "stats": json.dumps(_stats_summary(stats)), "detection_lines": detection_lines}
+
+
+def build_account_messages(account_id: str, detections: List[Dict], stats: Dict,
+                           patterns: List[Dict], compliance_docs: List[Dict],
+                           similar_cases: List[List[Dict]] = None) -> List[Dict]:
+    """One prompt covering all of an account's detections, answered as JSON"""
+    return ACCOUNT_ANALYSIS.messages(**account_prompt_fields(account_id, detections, stats, patterns,
+                                                             compliance_docs, similar_cases))
+
+
+# ============================================================================
+# PARSING AND VALIDATION
+# ============================================================================
+
+def _extract_json(text: str) -> Dict:
+    """Parse the JSON object in an answer, tolerating code fences and surrounding prose"""
+    text = re.sub(r"```(?:json)?", "", text or "").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        raise AnalysisParseError("no JSON object in LLM answer")
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise AnalysisParseError(f"invalid JSON in LLM answer: {e}") from e
+
+
+def _validate_entry(entry: Dict, pattern: str) -> Dict:
+    if not isinstance(entry, dict):
+        raise AnalysisParseError(f"analysis for '{pattern}' is not an object")
+    risk_level = str(entry.get("risk_level", "")).upper()
+    if risk_level not in RISK_LEVELS:
+        raise AnalysisParseError(f"invalid risk_level '{entry.get('risk_level')}' for '{pattern}'")
+    result = {"pattern": pattern, "risk_level": risk_level}
+    for field in LIST_FIELDS:
+        value = entry.get(field, [])
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list):
+            raise AnalysisParseError(f"'{field}' for '{pattern}' must be a list")
+        result[field] = [str(item) for item in value if str(item).strip()]
+    result["investigation_approach"] = str(entry.get("investigation_approach", ""))
+    return result
+
+
+def parse_account_analysis(text: str, detections: List[Dict]) -> List[Dict]:
+    """Validated analyses in detection order
+
+    Entries are matched to detections by pattern name, falling back to position
+    when the model renamed a pattern. Raises AnalysisParseError if the answer is
+    not JSON, an entry is malformed, or a detection has no analysis.
+    """
+    analyses = _extract_json(text).get("analyses")
+    if not isinstance(analyses, list):
+        raise AnalysisParseError("'analyses' must be a list")
+
+    by_name = {str(a.get("pattern", "")).strip().lower(): a for a in analyses if isinstance(a, dict)}
+    results = []
+    for i, detection in enumerate(detections):
+        entry = by_name.get(detection['pattern'].lower())
+        if entry is None and i < len(analyses):
+            entry = analyses[i]
+        if entry is None:
+            raise AnalysisParseError(f"no analysis for '{detection['pattern']}'")
+        results.append(_validate_entry(entry, detection['pattern']))
+    return results
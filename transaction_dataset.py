@@ -0,0 +1,343 @@
+import os
+import json
+import zlib
+import shutil
+from typing import List, Dict
+
+import numpy as np
+import pandas as pd
+
+from transaction_schema import normalize_transactions
+
+
+# ============================================================================
+# PARTITIONED DATASET LAYOUT
+# ============================================================================
+#
+#   manifest.json                       columns, bucket count and current partition of every (bucket, month)
+#   bucket=07/month=2026-05/g000003/    one generation of a partition, rows sorted by (account_id, timestamp):
+#       <column>.npy                    one array per column (integer codes for categorical columns)
+#       <column>.categories.npy         distinct values of a categorical column in this partition
+#       _offsets.npy                    first row of every account (in account_id category order)
+#       _index.json                     dtype and data offset of every file, for direct slice reads
+#
+# Accounts go to buckets by a stable hash of their id, transactions to the
+# calendar month of their timestamp. Partition files are never modified: an
+# append writes a new generation of every partition it touches and then
+# replaces the manifest, so the manifest always points at complete partitions.
+
+MANIFEST = "manifest.json"
+INDEX = "_index.json"
+
+
+def account_buckets(accounts, num_buckets: int) -> np.ndarray:
+    """Bucket of every account id (CRC32 of the id, computed once per distinct id)"""
+    codes, uniques = pd.factorize(pd.Series(accounts))
+    buckets = np.array([zlib.crc32(str(account).encode("utf-8")) % num_buckets for account in uniques],
+                       dtype=np.int64)
+    return buckets[codes] if len(buckets) else np.zeros(len(codes), dtype=np.int64)
+
+
+def _column_values(series: pd.Series):
+    """Categorical columns as pd.Categorical, text as fixed-width strings, the rest as they are"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.array
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.to_numpy()
+    # Missing text is stored as '' and restored as NaN on read
+    return np.asarray(series.astype(object).fillna(''), dtype=str)
+
+
+def _concat(pieces: list):
+    """Concatenate arrays, or (codes, categories) pairs into one pd.Categorical with sorted categories"""
+    if not isinstance(pieces[0], tuple):
+        return np.concatenate(pieces) if len(pieces) > 1 else pieces[0]
+    categories, inverse = np.unique(np.concatenate([piece_categories for _, piece_categories in pieces]),
+                                    return_inverse=True)
+    codes, start = [], 0
+    for piece_codes, piece_categories in pieces:
+        # Position -1 (missing value) maps to -1
+        mapping = np.append(inverse[start:start + len(piece_categories)], -1)
+        codes.append(mapping[piece_codes])
+        start += len(piece_categories)
+    return pd.Categorical.from_codes(np.concatenate(codes), categories=categories)
+
+
+def _pair(values: pd.Categorical):
+    return values.codes, np.asarray(values.categories, dtype=str)
+
+
+def _save_array(path: str, values: np.ndarray) -> Dict:
+    """Write `values` as .npy; returns its dtype and where its data starts"""
+    with open(path, "wb") as f:
+        np.save(f, values)
+        end = f.tell()
+    return {"dtype": values.dtype.str, "offset": end - values.nbytes, "length": len(values)}
+
+
+def _read_slice(path: str, layout: Dict, start: int = 0, stop: int = None) -> np.ndarray:
+    """Rows start:stop of a .npy file written by _save_array, reading only those bytes"""
+    dtype = np.dtype(layout["dtype"])
+    stop = layout["length"] if stop is None else stop
+    with open(path, "rb") as f:
+        f.seek(layout["offset"] + start * dtype.itemsize)
+        return np.frombuffer(f.read((stop - start) * dtype.itemsize), dtype=dtype)
+
+
+class PartitionedDataset:
+    """Transactions stored in (account bucket, month) partitions of per-column .npy files
+
+    Reads open only the partitions of the requested accounts' buckets whose time
+    range overlaps the requested dates, and of those only the requested columns.
+    Within a partition an account's rows are one contiguous, time-ordered slice
+    found by binary search and read directly from each column file, so reading
+    one account costs a few small reads per partition regardless of how many
+    other accounts and transactions the dataset holds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.num_buckets: int = self.manifest["num_buckets"]
+        self.columns: Dict[str, str] = self.manifest["columns"]
+        self.partitions: Dict[str, Dict] = self.manifest["partitions"]
+
+    @classmethod
+    def create(cls, path: str, num_buckets: int = 16) -> 'PartitionedDataset':
+        """Empty dataset in `path` (the columns are taken from the first append)"""
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            raise ValueError(f"{path} already holds a dataset")
+        cls._write_manifest(path, {"num_buckets": num_buckets, "columns": {}, "generation": 0, "partitions": {}})
+        return cls(path)
+
+    @classmethod
+    def write(cls, path: str, transactions: pd.DataFrame, num_buckets: int = 16) -> 'PartitionedDataset':
+        """New dataset in `path` holding `transactions`, replacing any dataset already there"""
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            shutil.rmtree(path)
+        dataset = cls.create(path, num_buckets)
+        dataset.append(transactions)
+        return dataset
+
+    @staticmethod
+    def _write_manifest(path: str, manifest: Dict):
+        tmp_path = os.path.join(path, f"{MANIFEST}.tmp.{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(path, MANIFEST))
+
+    def __len__(self):
+        return sum(entry["rows"] for entry in self.partitions.values())
+
+    # ------------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------------
+
+    def _write_partition(self, bucket: int, month: str, columns: Dict) -> Dict:
+        """Write one partition generation; returns its manifest entry"""
+        accounts = columns["account_id"].remove_unused_categories()
+        accounts = accounts.reorder_categories(np.sort(np.asarray(accounts.categories, dtype=str)))
+        order = np.lexsort((columns["timestamp"], accounts.codes))
+
+        self.manifest["generation"] += 1
+        relative = os.path.join(f"bucket={bucket:02d}", f"month={month}", f"g{self.manifest['generation']:06d}")
+        directory = os.path.join(self.path, relative)
+        os.makedirs(directory)
+        index = {"rows": int(len(order)), "files": {}}
+        for column, values in columns.items():
+            values = (accounts if column == "account_id" else values)[order]
+            if isinstance(values, pd.Categorical):
+                values = values.remove_unused_categories()
+                index["files"][f"{column}.categories"] = _save_array(
+                    os.path.join(directory, f"{column}.categories.npy"), np.asarray(values.categories, dtype=str))
+                values = values.codes.astype(np.int32)
+            index["files"][column] = _save_array(os.path.join(directory, f"{column}.npy"), values)
+        index["files"]["_offsets"] = _save_array(
+            os.path.join(directory, "_offsets.npy"),
+            np.searchsorted(accounts.codes[order], np.arange(len(accounts.categories) + 1)).astype(np.int64))
+        with open(os.path.join(directory, INDEX), "w", encoding="utf-8") as f:
+            json.dump(index, f)
+
+        timestamps = columns["timestamp"][~np.isnat(columns["timestamp"])]
+        return {
+            "path": relative,
+            "rows": int(len(order)),
+            "min": str(timestamps.min()) if len(timestamps) else None,
+            "max": str(timestamps.max()) if len(timestamps) else None,
+        }
+
+    def append(self, transactions: pd.DataFrame) -> int:
+        """Add transactions, rewriting only the partitions they fall into; returns the rows added
+
+        Columns not in the dataset are ignored and missing ones left empty
+        (as when appending to a CSV with the dataset's header).
+        """
+        frame = normalize_transactions(transactions.copy())
+        if not self.columns:
+            self.columns = {column: ("category" if isinstance(frame[column].dtype, pd.CategoricalDtype)
+                                     else _column_values(frame[column].iloc[:0]).dtype.str)
+                            for column in frame.columns}
+            self.manifest["columns"] = self.columns
+        frame = frame.reindex(columns=list(self.columns))
+        for column, kind in self.columns.items():
+            if kind == "category" and not isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].astype("category")
+        values = {column: _column_values(frame[column]) for column in self.columns}
+
+        buckets = account_buckets(frame["account_id"], self.num_buckets)
+        months = frame["timestamp"].dt.strftime("%Y-%m").fillna("NaT").to_numpy()
+        replaced = []
+        groups = pd.Series(np.arange(len(frame))).groupby([buckets, months]).indices
+        for (bucket, month), positions in sorted(groups.items()):
+            key = f"{bucket:02d}/{month}"
+            part = {column: column_values[positions] for column, column_values in values.items()}
+            if key in self.partitions:
+                existing = self._read_partition(self.partitions[key], list(self.columns))
+                part = {column: _concat([existing[column], _pair(values) if self.columns[column] == "category"
+                                         else values]) for column, values in part.items()}
+                replaced.append(os.path.join(self.path, self.partitions[key]["path"]))
+            self.partitions[key] = self._write_partition(int(bucket), month, part)
+
+        # Partition files reach the disk before the manifest that points to them;
+        # the old generations are removed only after the switch
+        if hasattr(os, "sync"):
+            os.sync()
+        self._write_manifest(self.path, self.manifest)
+        for directory in replaced:
+            shutil.rmtree(directory, ignore_errors=True)
+        return len(frame)
+
+    # ------------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------------
+
+    def _read_partition(self, entry: Dict, columns: List[str], accounts: np.ndarray = None,
+                        since=None, until=None) -> Dict:
+        """Requested columns of the partition's rows that match the filters (None if no row does)
+
+        Categorical columns come as (codes, categories) pairs, combined by _concat.
+        """
+        directory = os.path.join(self.path, entry["path"])
+        with open(os.path.join(directory, INDEX), "r", encoding="utf-8") as f:
+            files = json.load(f)["files"]
+
+        def path(name):
+            return os.path.join(directory, f"{name}.npy")
+
+        # Row ranges of the requested accounts (each account's rows are contiguous)
+        if accounts is not None:
+            names = _read_slice(path("account_id.categories"), files["account_id.categories"])
+            offsets = _read_slice(path("_offsets"), files["_offsets"])
+            pos = np.minimum(np.searchsorted(names, accounts), max(len(names) - 1, 0))
+            found = pos[names[pos] == accounts] if len(names) else pos[:0]
+            ranges = [(int(offsets[i]), int(offsets[i + 1])) for i in found]
+        else:
+            ranges = [(0, entry["rows"])]
+
+        # Dates: binary search within an account's time-ordered rows, a mask over a whole partition
+        selections = []
+        for start, stop in ranges:
+            if since is None and until is None:
+                selections.append((start, stop, None))
+                continue
+            timestamps = _read_slice(path("timestamp"), files["timestamp"], start, stop)
+            if accounts is not None:
+                # NaT sorts last and matches no date range
+                valid = len(timestamps) - int(np.isnat(timestamps).sum())
+                low = np.searchsorted(timestamps[:valid], since) if since is not None else 0
+                high = np.searchsorted(timestamps[:valid], until) if until is not None else valid
+                selections.append((start + int(low), start + int(high), None))
+            else:
+                keep = ~np.isnat(timestamps)
+                if since is not None:
+                    keep &= timestamps >= since
+                if until is not None:
+                    keep &= timestamps < until
+                selections.append((start, stop, keep))
+        selections = [(start, stop, keep) for start, stop, keep in selections
+                      if stop > start and (keep is None or keep.any())]
+        if not selections:
+            return None
+
+        result = {}
+        for column in columns:
+            pieces = []
+            for start, stop, keep in selections:
+                piece = _read_slice(path(column), files[column], start, stop)
+                pieces.append(piece if keep is None else piece[keep])
+            values = _concat(pieces)
+            if self.columns[column] == "category":
+                categories = _read_slice(path(f"{column}.categories"), files[f"{column}.categories"])
+                if len(values) < len(categories):
+                    # Keep only the values in use, so a few rows do not carry e.g. every time of day
+                    used, values = np.unique(values, return_inverse=True)
+                    categories = categories[used[used >= 0]]
+                    values = values - int((used < 0).sum())
+                values = (values, categories)
+            result[column] = values
+        return result
+
+    def read(self, accounts: List[str] = None, since=None, until=None, columns: List[str] = None) -> pd.DataFrame:
+        """Transactions of `accounts` (all if None) with since <= timestamp < until, in the engine's schema
+
+        `columns` limits which column files are read (all by default). Rows come
+        partition by partition, in time order within each account.
+        """
+        columns = list(self.columns) if columns is None else list(dict.fromkeys(columns))
+        unknown = [column for column in columns if column not in self.columns]
+        if unknown:
+            raise ValueError(f"Dataset {self.path} has no column(s) {', '.join(unknown)}")
+        since = np.datetime64(pd.Timestamp(since)) if since is not None else None
+        until = np.datetime64(pd.Timestamp(until)) if until is not None else None
+        buckets = None
+        if accounts is not None:
+            accounts = np.unique(np.asarray(accounts, dtype=str))
+            buckets = set(account_buckets(accounts, self.num_buckets).tolist())
+
+        parts = []
+        for key, entry in sorted(self.partitions.items()):
+            if buckets is not None and int(key.split("/")[0]) not in buckets:
+                continue
+            if since is not None and (entry["max"] is None or np.datetime64(entry["max"]) < since):
+                continue
+            if until is not None and (entry["min"] is None or np.datetime64(entry["min"]) >= until):
+                continue
+            part = self._read_partition(entry, columns, accounts, since, until)
+            if part is not None:
+                parts.append(part)
+
+        frame = {}
+        for column in columns:
+            kind = self.columns[column]
+            if parts:
+                values = _concat([part[column] for part in parts])
+            else:
+                values = pd.Categorical([]) if kind == "category" else np.zeros(0, dtype=kind)
+            if isinstance(values, np.ndarray) and values.dtype.kind == "U":
+                text = values.astype(object)
+                text[values == ""] = np.nan
+                values = text
+            frame[column] = values
+        return pd.DataFrame(frame)
+
+
+# ============================================================================
+# CONVERSION FROM CSV
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+    from transaction_schema import load_transactions
+
+    parser = argparse.ArgumentParser(description="Write a transactions CSV as a partitioned dataset")
+    parser.add_argument("--csv", default="sample_data/transactions.csv", help="Transactions CSV")
+    parser.add_argument("--dataset", default="sample_data/transactions_dataset", help="Dataset directory")
+    parser.add_argument("--buckets", type=int, default=16, help="Account hash buckets")
+    args = parser.parse_args()
+
+    dataset = PartitionedDataset.write(args.dataset, load_transactions(args.csv), args.buckets)
+    print(f"✓ Wrote {len(dataset)} transactions to {args.dataset} ({len(dataset.partitions)} partitions)")
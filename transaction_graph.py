@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+from typing import List, Dict
+
+
+# ============================================================================
+# COMPACT MONEY-FLOW GRAPH
+# ============================================================================
+
+class TransactionGraph:
+    """Directed money-flow graph between accounts stored as CSR NumPy arrays
+
+    Parallel transfers between the same pair of accounts are collapsed into a
+    single edge carrying the total amount and transfer count. Node ids are
+    int32 codes into `nodes`; out-edges live in (`indptr`, `indices`) and
+    in-edges in (`in_indptr`, `in_indices`), so one edge costs ~20 bytes.
+    """
+
+    def __init__(self, nodes: np.ndarray, src: np.ndarray, dst: np.ndarray,
+                 amounts: np.ndarray, counts: np.ndarray):
+        self.nodes = nodes
+        n = len(nodes)
+
+        # Edges are expected sorted by (src, dst) and unique
+        self.src = src.astype(np.int32)
+        self.indices = dst.astype(np.int32)
+        self.amounts = amounts.astype(np.float64)
+        self.counts = counts.astype(np.int32)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.src, minlength=n), out=self.indptr[1:])
+
+        in_order = np.lexsort((self.src, self.indices))
+        self.in_indices = self.src[in_order]
+        self.in_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=n), out=self.in_indptr[1:])
+
+        self._edge_keys = self.src.astype(np.int64) * n + self.indices
+
+    @classmethod
+    def from_transactions(cls, transactions: pd.DataFrame,
+                          source_column: str = 'account_id',
+                          target_column: str = 'counterparty_account') -> 'TransactionGraph':
+        """Build the graph from transfers that name a counterparty account"""
+        if target_column not in transactions.columns:
+            transfers = transactions.iloc[:0]
+        else:
+            transfers = transactions[transactions[target_column].notna() &
+                                     (transactions[target_column] != transactions[source_column])]
+
+        codes, nodes = pd.factorize(pd.concat([transfers[source_column], transfers[target_column]],
+                                              ignore_index=True).astype(str), sort=True)
+        n, m = len(nodes), len(transfers)
+        keys = codes[:m].astype(np.int64) * max(n, 1) + codes[m:]
+
+        edge_keys, inverse = np.unique(keys, return_inverse=True)
+        amounts = np.bincount(inverse, weights=transfers['amount'].to_numpy(dtype=np.float64),
+                              minlength=len(edge_keys))
+        counts = np.bincount(inverse, minlength=len(edge_keys))
+        return cls(np.asarray(nodes), edge_keys // max(n, 1), edge_keys % max(n, 1), amounts, counts)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def out_degree(self) -> np.ndarray:
+        """Number of distinct accounts each node sends money to (fan-out)"""
+        return np.diff(self.indptr)
+
+    def in_degree(self) -> np.ndarray:
+        """Number of distinct accounts each node receives money from (fan-in)"""
+        return np.diff(self.in_indptr)
+
+    def has_edges(self, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """Vectorized edge membership test"""
+        keys = src.astype(np.int64) * self.num_nodes + dst
+        pos = np.searchsorted(self._edge_keys, keys)
+        pos = np.minimum(pos, max(len(self._edge_keys) - 1, 0))
+        return (len(self._edge_keys) > 0) & (self._edge_keys[pos] == keys)
+
+    # ------------------------------------------------------------------------
+    # Connected components
+    # ------------------------------------------------------------------------
+
+    def connected_components(self) -> np.ndarray:
+        """Label weakly connected components (label = smallest node id in the component)
+
+        Uses hook-and-compress over the edge arrays: every round hooks the larger
+        root of each cross edge onto the smaller one and then pointer-jumps until
+        all nodes point at a root, so it needs O(log n) vectorized rounds.
+        """
+        parent = np.arange(self.num_nodes, dtype=np.int64)
+        while True:
+            root_src = parent[self.src]
+            root_dst = parent[self.indices]
+            cross = root_src != root_dst
+            if not cross.any():
+                return parent
+            np.minimum.at(parent, np.maximum(root_src[cross], root_dst[cross]),
+                          np.minimum(root_src[cross], root_dst[cross]))
+            while True:
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+
+    # ------------------------------------------------------------------------
+    # Short cycles
+    # ------------------------------------------------------------------------
+
+    def _cycle_candidate_edges(self) -> np.ndarray:
+        """Edges whose endpoints both have in- and out-edges (nodes on any cycle must)"""
+        active = (self.out_degree() > 0) & (self.in_degree() > 0)
+        keep = active[self.src] & active[self.indices]
+        while True:
+            out_deg = np.bincount(self.src[keep], minlength=self.num_nodes)
+            in_deg = np.bincount(self.indices[keep], minlength=self.num_nodes)
+            active = (out_deg > 0) & (in_deg > 0)
+            pruned = keep & active[self.src] & active[self.indices]
+            if np.array_equal(pruned, keep):
+                return np.flatnonzero(keep)
+            keep = pruned
+
+    def find_short_cycles(self, max_hub_degree: int = 1000, chunk_size: int = 1_000_000) -> np.ndarray:
+        """Find directed cycles of length 2 and 3 (money returning to its origin)
+
+        Returns an (k, 3) int array of node ids, each cycle listed once starting at
+        its smallest node; 2-cycles have -1 in the last column. Paths through hubs
+        with out-degree above `max_hub_degree` are skipped to bound the expansion,
+        and 2-hop paths are expanded `chunk_size` at a time to bound memory.
+        """
+        edges = self._cycle_candidate_edges()
+        u = self.src[edges].astype(np.int64)
+        v = self.indices[edges].astype(np.int64)
+
+        two = (u < v) & self.has_edges(v, u)
+        cycles = [np.column_stack((u[two], v[two], np.full(two.sum(), -1)))]
+
+        out_deg = self.out_degree()
+        # Only paths u -> v -> w with u the smallest node, so each cycle is found once
+        start = (u < v) & (out_deg[v] <= max_hub_degree)
+        u, v = u[start], v[start]
+        fan = out_deg[v]
+        bounds = np.concatenate(([0], np.cumsum(fan)))
+        first = 0
+        while first < len(u):
+            last = int(np.searchsorted(bounds, bounds[first] + chunk_size, side='right')) - 1
+            last = min(max(last, first + 1), len(u))
+            chunk_fan = fan[first:last]
+            total = int(chunk_fan.sum())
+            if total:
+                path_u = np.repeat(u[first:last], chunk_fan)
+                path_v = np.repeat(v[first:last], chunk_fan)
+                offsets = np.arange(total) - np.repeat(np.cumsum(chunk_fan) - chunk_fan, chunk_fan)
+                path_w = self.indices[np.repeat(self.indptr[v[first:last]], chunk_fan) + offsets].astype(np.int64)
+                closes = (path_w > path_u) & self.has_edges(path_w, path_u)
+                cycles.append(np.column_stack((path_u[closes], path_v[closes], path_w[closes])))
+            first = last
+
+        return np.concatenate(cycles) if cycles else np.empty((0, 3), dtype=np.int64)
+
+
+# ============================================================================
+# LAYERING DETECTION
+# ============================================================================
+
+LAYERING_PATTERN = 'Layering'
+
+def detect_layering(transactions: pd.DataFrame,
+                    fan_threshold: int = 5,
+                    max_examples: int = 3) -> Dict[str, List[Dict]]:
+    """Flag accounts taking part in round-trip cycles or wide fan-in/fan-out (fp_008)"""
+    graph = TransactionGraph.from_transactions(transactions)
+    if graph.num_edges == 0:
+        return {}
+
+    components = graph.connected_components()
+    component_sizes = np.bincount(components, minlength=graph.num_nodes)
+    fan_out = graph.out_degree()
+    fan_in = graph.in_degree()
+    cycles = graph.find_short_cycles()
+
+    members = cycles.ravel()
+    owners = np.repeat(np.arange(len(cycles)), 3)
+    owners, members = owners[members >= 0], members[members >= 0]
+    cycles_per_node = np.bincount(members, minlength=graph.num_nodes)
+
+    flagged = (cycles_per_node > 0) | (fan_out >= fan_threshold) | (fan_in >= fan_threshold)
+    # Counterparties that never appear as a source account are not reported on
+    flagged &= pd.Index(graph.nodes).isin(transactions['account_id'].astype(str).unique())
+
+    member_order = np.argsort(members, kind='stable')
+    member_starts = np.searchsorted(members[member_order], np.arange(graph.num_nodes + 1))
+
+    # Gather per-node attributes vectorized; the loop below only assembles dicts
+    nodes = np.flatnonzero(flagged)
+    has_fan_out = (fan_out[nodes] >= fan_threshold).tolist()
+    has_fan_in = (fan_in[nodes] >= fan_threshold).tolist()
+    node_cycle_counts = cycles_per_node[nodes].tolist()
+    rows = zip(nodes.tolist(), graph.nodes[nodes].tolist(), node_cycle_counts, has_fan_out, has_fan_in,
+               fan_in[nodes].tolist(), fan_out[nodes].tolist(), component_sizes[components[nodes]].tolist())
+
+    results = {}
+    for node, account_id, cycle_count, dispersed, collected, node_fan_in, node_fan_out, component_size in rows:
+        indicators = []
+        examples = []
+        if cycle_count:
+            indicators.append('Funds returned to origin through intermediary accounts')
+            start = member_starts[node]
+            for cycle in cycles[owners[member_order[start:start + max_examples]]].tolist():
+                examples.append([str(graph.nodes[x]) for x in cycle if x >= 0])
+        if dispersed:
+            indicators.append('Funds dispersed to many accounts')
+        if collected:
+            indicators.append('Funds collected from many accounts')
+        results[account_id] = [{
+            'pattern': LAYERING_PATTERN,
+            'severity': 'HIGH',
+            'count': cycle_count + dispersed + collected,
+            'indicators': indicators,
+            'fan_in': node_fan_in,
+            'fan_out': node_fan_out,
+            'component_size': component_size,
+            'cycles': examples
+        }]
+    return results
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# ============================================================================
+# IN-MEMORY TRANSACTION SCHEMA
+# ============================================================================
+
+# Low-cardinality text columns, stored as integer codes plus one copy of each distinct value
+CATEGORICAL_COLUMNS = ['account_id', 'merchant', 'location', 'currency', 'transaction_type',
+                       'status', 'fraud_indicator', 'date', 'time']
+STRING_COLUMNS = ['transaction_id', 'counterparty_account']
+
+
+def _parse_categories(series: pd.Series, parse) -> np.ndarray:
+    """Parse only the distinct values of a categorical column and broadcast them by code"""
+    values = parse(pd.Series(series.cat.categories.astype(str)), errors='coerce').to_numpy()
+    codes = series.cat.codes.to_numpy()
+    parsed = values.take(np.maximum(codes, 0))
+    parsed[codes < 0] = np.array('NaT', dtype=parsed.dtype)
+    return parsed
+
+
+def normalize_transactions(transactions: pd.DataFrame) -> pd.DataFrame:
+    """Convert a transactions frame to the engine's schema (in place) and return it
+
+    - account_id, merchant, location, currency, ... become categoricals; an
+      account's integer id is `transactions['account_id'].cat.codes`
+    - amount becomes float32 (exact to the cent below 131,072 = 2**17; aggregates are
+      computed in float64)
+    - 'timestamp' is parsed once from date + time; each distinct date and time
+      string is parsed only once
+    """
+    for column in CATEGORICAL_COLUMNS:
+        if column in transactions.columns and not isinstance(transactions[column].dtype, pd.CategoricalDtype):
+            transactions[column] = transactions[column].astype('category')
+    transactions['amount'] = transactions['amount'].astype(np.float32)
+
+    if 'timestamp' not in transactions.columns:
+        transactions['timestamp'] = (_parse_categories(transactions['date'], pd.to_datetime)
+                                     + _parse_categories(transactions['time'], pd.to_timedelta))
+    return transactions
+
+
+def load_transactions(path: str) -> pd.DataFrame:
+    """Read a transactions CSV (or a partitioned dataset directory) straight into the engine's schema
+
+    Categorical and float32 dtypes are applied by the CSV parser, so the full
+    object-string and float64 columns are never materialized.
+    """
+    if os.path.isdir(path):
+        # Imported here: transaction_dataset builds on this module
+        from transaction_dataset import PartitionedDataset
+        return PartitionedDataset(path).read()
+
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {column: 'category' for column in CATEGORICAL_COLUMNS if column in header}
+    dtypes.update({column: str for column in STRING_COLUMNS if column in header})
+    dtypes['amount'] = np.float32
+    return normalize_transactions(pd.read_csv(path, dtype=dtypes))
+
+
+def example_records(rows: pd.DataFrame):
+    """Rows as plain dicts for reports, with float32 amounts rounded back to cents"""
+    if 'amount' in rows.columns:
+        rows = rows.assign(amount=rows['amount'].astype(np.float64).round(2))
+    return rows.to_dict('records')
@@ -0,0 +1,275 @@
+import os
+import json
+import argparse
+from typing import List, Dict
+
+import numpy as np
+
+
+# ============================================================================
+# COMPACT VECTOR INDEX
+# ============================================================================
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class CompactVectorIndex:
+    """Reduced-precision retrieval index with full-precision re-scoring
+
+    Vectors are L2-normalized and stored as float16 or int8 (per-dimension scalar
+    quantization), optionally after PCA to `pca_dim` dimensions (of the centred
+    vectors; each row's dot product with the mean is kept so q.x is still
+    estimated in full: q.x = (q-m).(x-m) + m.x + const). A search scores
+    all compact codes, keeps `rescore_factor * k` candidates per query and
+    re-ranks them with the original float32 vectors, which can live in a
+    memory-mapped file so only the compact codes occupy RAM.
+    Scores are cosine similarities; `query` reports distance = 1 - cosine.
+    `save`/`load` keep the index in a directory, so a service can start from
+    it without reading every embedding back from the vector store.
+    """
+
+    PARAMETERS = ("scale", "offset", "pca_mean", "pca_components", "row_bias")
+
+    def __init__(self, ids: List[str], codes: np.ndarray, mode: str, full: np.ndarray = None,
+                 documents: List[str] = None, scale: np.ndarray = None, offset: np.ndarray = None,
+                 pca_mean: np.ndarray = None, pca_components: np.ndarray = None, row_bias: np.ndarray = None,
+                 chunk_size: int = 65536):
+        self.ids = list(ids)
+        self.codes = codes
+        self.mode = mode
+        self.full = full
+        self.documents = documents
+        self.scale = scale
+        self.offset = offset
+        self.pca_mean = pca_mean
+        self.pca_components = pca_components
+        self.row_bias = row_bias
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def build(cls, ids: List[str], vectors: np.ndarray, mode: str = "int8", pca_dim: int = None,
+              documents: List[str] = None, full_precision_path: str = None,
+              pca_sample: int = 100_000, seed: int = 42) -> 'CompactVectorIndex':
+        """Quantize vectors; with `full_precision_path` the float32 copy goes to a memmap on disk"""
+        if mode not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unknown compact mode '{mode}' (expected float32, float16 or int8)")
+        vectors = _normalize(vectors)
+
+        pca_mean = pca_components = row_bias = None
+        reduced = vectors
+        if pca_dim and pca_dim < vectors.shape[1]:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), size=min(pca_sample, len(vectors)), replace=False)]
+            pca_mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - pca_mean, full_matrices=False)
+            pca_components = vt[:pca_dim].astype(np.float32)
+            reduced = (vectors - pca_mean) @ pca_components.T
+            row_bias = (vectors @ pca_mean).astype(np.float32)
+
+        scale = offset = None
+        if mode == "int8":
+            low, high = reduced.min(axis=0), reduced.max(axis=0)
+            scale = np.maximum(high - low, 1e-12) / 255.0
+            offset = low
+            codes = (np.rint((reduced - offset) / scale) - 128).astype(np.int8)
+        else:
+            codes = reduced.astype(mode)
+
+        full = vectors
+        if full_precision_path:
+            full = np.lib.format.open_memmap(full_precision_path, mode="w+", dtype=np.float32, shape=vectors.shape)
+            full[:] = vectors
+            full.flush()
+        return cls(ids, codes, mode, full, documents, scale, offset, pca_mean, pca_components, row_bias)
+
+    @classmethod
+    def from_collection(cls, collection, mode: str = "int8", pca_dim: int = None,
+                        full_precision_path: str = None, page_size: int = 10_000) -> 'CompactVectorIndex':
+        """Build from all embeddings stored in a Chroma collection, read page by page (empty index if none)"""
+        ids, documents, vectors = [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings", "documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+            offset += len(page["ids"])
+        if not vectors:
+            codes = np.empty((0, 0), dtype=np.int8 if mode == "int8" else mode)
+            return cls([], codes, mode, np.empty((0, 0), dtype=np.float32), [])
+        return cls.build(ids, np.concatenate(vectors), mode, pca_dim, documents, full_precision_path)
+
+    def save(self, directory: str):
+        """Write the index to `directory`: compact.npz (codes and parameters), index.json and full.npy
+
+        full.npy holds the float32 vectors for re-scoring; it is not copied when
+        the index was built with `full_precision_path` pointing at it.
+        """
+        os.makedirs(directory, exist_ok=True)
+        full_path = os.path.join(directory, "full.npy")
+        if os.path.abspath(getattr(self.full, "filename", None) or "") != os.path.abspath(full_path):
+            np.save(full_path, np.asarray(self.full, dtype=np.float32))
+        elif isinstance(self.full, np.memmap):
+            self.full.flush()
+        parameters = {name: getattr(self, name) for name in self.PARAMETERS if getattr(self, name) is not None}
+        np.savez(os.path.join(directory, "compact.npz"), codes=self.codes, **parameters)
+        # Written last: a directory without index.json is an unfinished save
+        with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"mode": self.mode, "ids": self.ids, "documents": self.documents}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'CompactVectorIndex':
+        """Read an index written by `save`; the float32 vectors stay memory-mapped unless `mmap` is False"""
+        with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(os.path.join(directory, "compact.npz")) as data:
+            arrays = {name: data[name] for name in data.files}
+        full = np.load(os.path.join(directory, "full.npy"), mmap_mode="r" if mmap else None)
+        return cls(meta["ids"], arrays.pop("codes"), meta["mode"], full, meta["documents"], **arrays)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def pca_dim(self) -> int:
+        return None if self.pca_components is None else len(self.pca_components)
+
+    def compact_bytes(self) -> int:
+        """RAM needed by the compact codes plus quantization/PCA parameters"""
+        extra = sum(a.nbytes for a in (self.scale, self.offset, self.pca_mean, self.pca_components, self.row_bias)
+                    if a is not None)
+        return self.codes.nbytes + extra
+
+    def full_bytes(self) -> int:
+        """Size of the float32 vectors used for re-scoring"""
+        return len(self) * self.full.shape[1] * 4
+
+    def _project(self, queries: np.ndarray) -> np.ndarray:
+        if self.pca_components is not None:
+            return (queries - self.pca_mean) @ self.pca_components.T
+        return queries
+
+    def approximate_scores(self, queries: np.ndarray, limit: int):
+        """Top-`limit` candidates per query scored on the compact codes, chunk by chunk"""
+        projected = self._project(queries).astype(np.float32)
+        if self.mode == "int8":
+            # q.x ~= (q*scale).code + q.(offset + 128*scale), so codes are never dequantized in full
+            weights = (projected * self.scale).T.astype(np.float32)
+            bias = projected @ (self.offset + 128 * self.scale)
+        else:
+            weights = projected.T
+            bias = np.zeros(len(queries), dtype=np.float32)
+
+        limit = min(limit, len(self))
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self), self.chunk_size):
+            chunk = self.codes[start:start + self.chunk_size].astype(np.float32)
+            scores = chunk @ weights + bias
+            if self.row_bias is not None:
+                scores += self.row_bias[start:start + len(chunk), None]
+            scores = np.concatenate([best_scores, scores.T], axis=1)
+            ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(chunk)),
+                                                            (len(queries), len(chunk)))], axis=1)
+            keep = np.argpartition(-scores, limit - 1, axis=1)[:, :limit] if scores.shape[1] > limit \
+                else np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_ids = np.take_along_axis(ids, keep, axis=1)
+        return best_ids, best_scores
+
+    def search(self, queries: np.ndarray, k: int = 5, rescore_factor: int = 10, rescore: bool = True):
+        """Return (row indices, cosine scores) of the top-k vectors for each query"""
+        queries = _normalize(np.atleast_2d(queries))
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        candidates, scores = self.approximate_scores(queries, k * rescore_factor if rescore else k)
+        if rescore:
+            # Exact cosine on the few candidates, read from the full-precision (possibly memmapped) vectors
+            order = np.sort(candidates, axis=1)
+            exact = np.einsum("qcd,qd->qc", self.full[order.ravel()].reshape(*order.shape, -1), queries)
+            candidates, scores = order, exact
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(candidates, top, axis=1), np.take_along_axis(scores, top, axis=1)
+
+    def query(self, query_embeddings, n_results: int = 2, **kwargs) -> Dict:
+        """Chroma-compatible query returning ids, documents and distances (1 - cosine)"""
+        rows, scores = self.search(np.asarray(query_embeddings, dtype=np.float32), n_results, **kwargs)
+        return {
+            "ids": [[self.ids[i] for i in query_rows] for query_rows in rows.tolist()],
+            "documents": [[self.documents[i] if self.documents else None for i in query_rows]
+                          for query_rows in rows.tolist()],
+            "distances": (1.0 - scores).tolist()
+        }
+
+
+# ============================================================================
+# EVALUATION
+# ============================================================================
+
+def recall_at_k(index: CompactVectorIndex, exact_rows: np.ndarray, queries: np.ndarray,
+                k: int, rescore: bool) -> float:
+    """Share of the exact top-k neighbours found by the compact index"""
+    rows, _ = index.search(queries, k, rescore=rescore)
+    hits = [len(set(found) & set(truth)) for found, truth in zip(rows.tolist(), exact_rows.tolist())]
+    return sum(hits) / max(exact_rows.size, 1)
+
+
+def evaluate(ids: List[str], vectors: np.ndarray, queries: np.ndarray, k: int = 5,
+             configurations=(("float16", None), ("int8", None), ("int8", 128), ("int8", 64))) -> List[Dict]:
+    """Recall@k and memory of each (mode, pca_dim) configuration against exact float32 search"""
+    normalized = _normalize(vectors)
+    k = min(k, len(ids))
+    exact_rows = np.argsort(-(_normalize(queries) @ normalized.T), axis=1, kind="stable")[:, :k]
+
+    results = []
+    for mode, pca_dim in configurations:
+        if pca_dim and pca_dim >= min(vectors.shape):
+            continue
+        index = CompactVectorIndex.build(ids, vectors, mode, pca_dim)
+        results.append({
+            "mode": mode,
+            "pca_dim": pca_dim or vectors.shape[1],
+            "compact_bytes": index.compact_bytes(),
+            "full_bytes": index.full_bytes(),
+            "memory_saved": 1 - index.compact_bytes() / index.full_bytes(),
+            "recall": recall_at_k(index, exact_rows, queries, k, rescore=False),
+            "recall_rescored": recall_at_k(index, exact_rows, queries, k, rescore=True),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="Recall@k vs memory of compact vector representations")
+    parser.add_argument("--db-path", action="append",
+                        help="ChromaDB directory (repeatable; default: chroma_db and /chroma_db)")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=1000, help="Stored vectors reused as queries")
+    args = parser.parse_args()
+
+    for db_path in args.db_path or ["chroma_db", "/chroma_db"]:
+        if not os.path.exists(db_path):
+            continue
+        client = chromadb.PersistentClient(path=db_path)
+        for collection_info in client.list_collections():
+            collection = client.get_collection(getattr(collection_info, "name", collection_info))
+            full = CompactVectorIndex.from_collection(collection, mode="float32")
+            if len(full) == 0:
+                continue
+            rng = np.random.default_rng(0)
+            query_rows = rng.choice(len(full), size=min(args.queries, len(full)), replace=False)
+            # Perturb the stored vectors so queries are near, but not identical to, their targets
+            queries = np.asarray(full.full[query_rows]) + rng.normal(0, 0.02, (len(query_rows), full.full.shape[1]))
+
+            print(f"\n{db_path} / {collection.name}: {len(full)} vectors, dim {full.full.shape[1]}")
+            print(f"  {'mode':8s} {'dims':>5s} {'memory':>12s} {'saved':>7s} "
+                  f"{'recall@' + str(args.k):>9s} {'+rescore':>9s}")
+            for row in evaluate(full.ids, np.asarray(full.full), queries, args.k):
+                print(f"  {row['mode']:8s} {row['pca_dim']:5d} {row['compact_bytes']:10,d} B "
+                      f"{row['memory_saved']:6.1%} {row['recall']:9.3f} {row['recall_rescored']:9.3f}")